@@ -29,9 +29,14 @@ from tdw_object_utils import get_cameras, get_camera_views, numpy_to_python, get
 import itertools
 import random
 import yaml
+from render_cache import RenderCache, CACHE_DIR_NAME, sample_spec, spec_hash, spec_seed
+from index_writer import IndexWriter
+from scene_config import get_scene_settings
+from pipeline import DeferredImageCapture, SamplePipeline
 
 MOVE_STEP = 10
 PIC_NUM = 4 # the number of pictures serving as the query  
+GENERATOR_VERSION = 1 # bump when the rendering changes, to invalidate the render cache
 
 
 class VisualAttributeTask(ObjectTask):
@@ -50,15 +55,16 @@ class VisualAttributeTask(ObjectTask):
         super().__init__(output_path=output_path, port=port, 
                          display=display, scene=scene, 
                          screen_size=screen_size, physics=physics, 
-                         render_quality=render_quality, name=name, library=library, camera=camera)
+                         render_quality=render_quality, name=name, library=library, camera=camera,
+                         timings=kwargs.get("timings"))
         self.num_objects = 1
+        self.render_cache = RenderCache(os.path.join(self.output_path, CACHE_DIR_NAME), enabled=kwargs.get("render_cache", True))
+        self.pipeline_depth = kwargs.get("pipeline_depth", 1)
         
     def set_scene_get_camera_config(self, background):
         self.scene = background
         self.c.communicate(self.c.get_add_scene(self.scene))
-        with open('/data/shared/sim/benchmark/benchmark_TDW/scene_settings.yaml', 'r') as file:
-            config = yaml.safe_load(file)[self.scene]['camera']
-            return config
+        return get_scene_settings(self.scene).camera_config()
 
     def trial(self, background, colors, shapes, materials, textures, sizes, trial_id=0, fileWriter=None, flush=True):
         
@@ -75,69 +81,98 @@ class VisualAttributeTask(ObjectTask):
         object_position = scene_center.copy()
         object_position["x"] += 0.5
         positions = [object_position]
+        cameras = ["front", "right", "top"]
+        
+        ### Every cell is planned, rendered and persisted by a SamplePipeline, so the build renders a cell while the
+        ### next one is planned and the images of the previous one are written
+        def plan(item):
+            scene_id, (color_pair, shape_pair, material_pair, texture_pair, size_pair) = item
+            output_pth = os.path.join(self.output_path, self.name, background, f"scene_{scene_id:04d}")
+            
+            ### Seed from the content of the cell rather than its position, so that unchanged cells draw the same rotations
+            ### (and hit the render cache) when another factor changes
+            rng = np.random.RandomState(spec_seed([trial_id, background, color_pair, shape_pair, material_pair, texture_pair, size_pair]))
+            
+            planned_objects = [ObjectType(model_name=shape, position=positions[i], rotation={"x": 0, "y": rng.uniform(-90, 90), "z": 0}, 
+                                          scale_factor=size, color=color, material=material, texture_scale=texture_scale)
+                               for i, (color, shape, size, material, texture_scale) in enumerate(zip(color_pair, shape_pair, size_pair, material_pair, texture_pair))]
+            spec = sample_spec(self.name, GENERATOR_VERSION, self.scene, planned_objects, 
+                               {cam: camera_config.get(cam) for cam in cameras}, self.screen_size, self.render_quality)
+            cache_key = spec_hash(spec)
+            cached = self.render_cache.fetch(cache_key, output_pth)
+            return {"scene_id": scene_id, "output_pth": output_pth, "planned_objects": planned_objects, "size_pair": size_pair, 
+                    "spec": spec, "cache_key": cache_key, "objects": planned_objects if cached is not None else None}
+        
+        def render(sample):
+            if sample["objects"] is not None:
+                return sample
+            ### A cell whose build dies is rendered again on a new build, or skipped (see supervised_controller.py)
+            self.c.run_sample(f"{background}/scene_{sample['scene_id']:04d}", render_cell, sample)
+            return sample
+        
+        def render_cell(sample):
+            self.timings.set_sample(f"{background}/scene_{sample['scene_id']:04d}")
+            self.camera = cameras
+            
+            ### Lightning
+            # interior_lighting = InteriorSceneLighting()
+            # self.c.add_ons.append(interior_lighting) 
+            # interior_lighting.reset(hdri_skybox="old_apartments_walkway_4k", aperture=8, focus_distance=2.5, ambient_occlusion_intensity=0.125, ambient_occlusion_thickness_modifier=3.5, shadow_strength=1)
+                
+            capture = add_cameras(self.c, self.camera, sample["output_pth"], self.scene, deferred=True)
+                
+            ### Collison Manager
+            collision_manager = CollisionManager(enter=True, stay=False, exit=False, objects=True, environment=True)
+            self.c.add_ons.append(collision_manager)
+            
+            #print("Cameras added!")
+            
+            objects = []
+            
+            for planned, size in zip(sample["planned_objects"], sample["size_pair"]):
         
-        scene_id = 0
-        for color_pair in colors:
-            for shape_pair in shapes:
-                for material_pair in materials:
-                    for texture_pair in textures:
-                        for size_pair in sizes:
-                            
-                            np.random.seed(trial_id*10000 + scene_id)
-                            random.seed(trial_id*10000 + scene_id)
-                            
-                            output_pth = os.path.join(self.output_path, self.name, background, f"scene_{scene_id:04d}")
-                            if os.path.exists(output_pth) and flush:
-                                shutil.rmtree(output_pth)
-                            
-                            ### Lightning
-                            # interior_lighting = InteriorSceneLighting()
-                            # self.c.add_ons.append(interior_lighting) 
-                            # interior_lighting.reset(hdri_skybox="old_apartments_walkway_4k", aperture=8, focus_distance=2.5, ambient_occlusion_intensity=0.125, ambient_occlusion_thickness_modifier=3.5, shadow_strength=1)
-                                
-                            self.camera = ["front", "right", "top"] 
-                            add_cameras(self.c, self.camera, output_pth, self.scene)
-                                
-                            ### Collison Manager
-                            collision_manager = CollisionManager(enter=True, stay=False, exit=False, objects=True, environment=True)
-                            self.c.add_ons.append(collision_manager)
-                            
-                            #print("Cameras added!")
-                            
-                            objects = []
-                            
-                            for i, (color, shape, size, material, texture_scale) in enumerate(zip(color_pair, shape_pair, size_pair, material_pair, texture_pair)):
-                        
 
-                                object_info = self.generate_regular_object(shape, position=positions[i], scale=size, color=color, rotation={"x": 0, "y": np.random.uniform(-90, 90), "z": 0}, 
-                                                                        material=material, texture_scale=texture_scale)
-                                objects.append(object_info)
+                object_info = self.generate_regular_object(planned.model_name, position=planned.position, scale=size, color=planned.color_name, rotation=planned.rotation, 
+                                                        material=planned.material, texture_scale=planned.texture_scale)
+                objects.append(object_info)
 
 
-                            self.step()
-                            
-                            #print("Objects generated!")
-                            
-          
-                            # vecs = [{"x": 3, "y": 0, "z": -3}, {"x": 6, "y": 0, "z": 6}]
-                            # for i, vec in enumerate(vecs):
-                            #     self.commands.append({"$type": "apply_force_to_object",
-                            #                         "id": objects[i].object_id,
-                            #                         "force": vec})
-                                   
-                            for i in range(1):
-                                resp = self.c.communicate([])
-                                
-                                
-                            if(fileWriter is not None):
-                                output_dict = {"source_dir": output_pth, "scene_id": scene_id, "background": self.scene, **objects[0].get_attributes()}
-                                json.dump(output_dict, fileWriter)
-                                fileWriter.write("\n")
-                    
+            self.step()
+            
+            #print("Objects generated!")
+            
 
-                            scene_id += 1
-                            pbar.update(1)
-                            self.reset_scene([obj_info.object_id for obj_info in objects])
+            # vecs = [{"x": 3, "y": 0, "z": -3}, {"x": 6, "y": 0, "z": 6}]
+            # for i, vec in enumerate(vecs):
+            #     self.commands.append({"$type": "apply_force_to_object",
+            #                         "id": objects[i].object_id,
+            #                         "force": vec})
+                   
+            for i in range(1):
+                resp = self.c.communicate([])
+            
+            sample["images"] = capture.pop_pending()
+            sample["objects"] = objects
+            self.reset_scene([obj_info.object_id for obj_info in objects])
+            return sample
+        
+        def persist(sample):
+            if "images" in sample:
+                if os.path.exists(sample["output_pth"]) and flush:
+                    shutil.rmtree(sample["output_pth"])
+                DeferredImageCapture.save_images(sample.pop("images"))
+                self.render_cache.store(sample["cache_key"], sample["output_pth"], sample["spec"])
+            return sample
+        
+        def commit(sample):
+            if(fileWriter is not None and sample["objects"] is not None):
+                output_dict = {"source_dir": sample["output_pth"], "scene_id": sample["scene_id"], "background": self.scene, **sample["objects"][0].get_attributes()}
+                fileWriter.write(output_dict)
+            pbar.update(1)
+        
+        cells = enumerate(itertools.product(colors, shapes, materials, textures, sizes))
+        stats = SamplePipeline(plan, render, persist, commit, depth=self.pipeline_depth).run(cells)
+        print(f"{background}: {stats['samples']} cells in {stats['wall_s']:.1f}s, build idle {stats['render_idle_s']:.1f}s")
                             
                             
                             
@@ -163,7 +198,7 @@ class VisualAttributeTask(ObjectTask):
         if(not os.path.exists(self.output_path)):
             os.makedirs(self.output_path, exist_ok=True)
         
-        with open(os.path.join(self.output_path, f"{self.name}_index.jsonl"), "w") as f:
+        with IndexWriter(os.path.join(self.output_path, f"{self.name}_index.jsonl")) as f:
             
             
             for background in tqdm(SELECTED_SCENES):
@@ -177,6 +212,7 @@ class VisualAttributeTask(ObjectTask):
            
             
         self.c.communicate({"$type": "terminate"})
+        self.write_timings()
         
 
 @hydra.main(config_path="../configs", config_name="visual_attributes.yaml", version_base=None)
@@ -30,10 +30,14 @@ SELECTED_SCENES = ["box_room_2018", "monkey_physics_room", "suburb_scene_2018"]
 import itertools
 import random
 import yaml
+from index_writer import IndexWriter
+from scene_config import get_scene_settings
+from scene_geometry import SceneGeometry
 
 MOVE_STEP = 10
 PIC_NUM = 4 # the number of pictures serving as the query  
-TABLES = {"marble_table": 0.45, "trapezoidal_table": 0.55, "small_table_green_marble": 1.33, "willisau_varion_w3_table": 0.74}
+# The table tops, measured once (see scene_geometry.py)
+SCENE_GEOMETRY = SceneGeometry()
 SHAPE_OFFSET = {
     "sphere": 0.05,
     "cube": 0.05,
@@ -70,15 +74,14 @@ class VisualAttributeTask(ObjectTask):
         super().__init__(output_path=output_path, port=port, 
                          display=display, scene=scene, 
                          screen_size=screen_size, physics=physics, 
-                         render_quality=render_quality, name=name, library=library, camera=camera)
+                         render_quality=render_quality, name=name, library=library, camera=camera,
+                         timings=kwargs.get("timings"))
         self.num_objects = 2
         
     def set_scene_get_camera_config(self, background):
         self.scene = background
         self.c.communicate(self.c.get_add_scene(self.scene))
-        with open('/data/shared/sim/benchmark/benchmark_TDW/scene_settings.yaml', 'r') as file:
-            config = yaml.safe_load(file)[self.scene]['camera']
-            return config
+        return get_scene_settings(self.scene).camera_config()
 
     def flush_output_folder(self, path: str):
         if os.path.exists(path):
@@ -99,7 +102,7 @@ class VisualAttributeTask(ObjectTask):
                                                 object_id=table_id))
         
         table_top_center = table_pos.copy()
-        table_top_center["y"] += TABLES[table_name]*scale
+        table_top_center["y"] += SCENE_GEOMETRY.top(self.c, table_name, scale=scale)
         
         return table_id, table_top_center
     
@@ -148,6 +151,7 @@ class VisualAttributeTask(ObjectTask):
                             np.random.seed(trial_id*10000 + scene_id)
                             random.seed(trial_id*10000 + scene_id)
                             
+                            self.timings.set_sample(f"{background}/scene_{scene_id:04d}")
                             output_pth = os.path.join(self.output_path, self.name, background, f"scene_{scene_id:04d}")
                             if flush:
                                 self.flush_output_folder(output_pth)
@@ -211,8 +215,7 @@ class VisualAttributeTask(ObjectTask):
                                 
                             if(fileWriter is not None):
                                 output_dict = {"source_dir": output_pth, "scene_id": scene_id, "background": self.scene, "objects": objects_info}
-                                json.dump(output_dict, fileWriter)
-                                fileWriter.write("\n")
+                                fileWriter.write(output_dict)
                     
 
                             scene_id += 1
@@ -277,7 +280,7 @@ class VisualAttributeTask(ObjectTask):
         if(not os.path.exists(self.output_path)):
             os.makedirs(self.output_path, exist_ok=True)
         
-        with open(os.path.join(self.output_path, f"{self.name}_index.jsonl"), "w") as f:
+        with IndexWriter(os.path.join(self.output_path, f"{self.name}_index.jsonl")) as f:
             
             
             for background in tqdm(SELECTED_SCENES):
@@ -291,6 +294,7 @@ class VisualAttributeTask(ObjectTask):
            
             
         self.c.communicate({"$type": "terminate"})
+        self.write_timings()
         
 
 @hydra.main(config_path="../configs", config_name="visual_attributes_comparison_material.yaml", version_base=None)
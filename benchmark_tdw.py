@@ -0,0 +1,92 @@
+import argparse
+import os
+import runpy
+import sys
+
+# One command for the generators and the tools of the benchmark: python benchmark_tdw.py <command> [arguments...]
+# The commands are a table of script paths, not imports: listing them or running one only loads that script, so a
+# tool or a worker process does not pay for tdw, hydra or cv2 unless it uses them. The arguments after the command
+# are the script's own: its argparse options, or the hydra overrides of a task.
+#
+# python benchmark_tdw.py --help
+# python benchmark_tdw.py visual_attribute port=1072 render_quality=5
+# python benchmark_tdw.py generate_counting_discrete --output_path outputs/counting
+# python benchmark_tdw.py index_extractor discrete --processes 8
+# python benchmarks/bench_import_time.py          # import time of the CLI and of the worker modules
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Command -> (script, relative to ROOT, and its group and one-line description for --help)
+COMMANDS = {
+    # Hydra tasks: the arguments are config overrides, e.g. port=1072
+    "temporal_positioning": ("temporal_positioning.py", "task", "Temporal positioning of moving objects"),
+    "visual_attribute": ("attributes/visual_attribute.py", "task", "Pairs of objects differing in visual attributes"),
+    "visual_attribute_comparison_material": ("attributes/visual_attribute_comparison_material.py", "task",
+                                             "Material comparison of objects on a table"),
+    "object_interaction": ("compositionality/object_interaction.py", "task", "Collisions and physic types of object pairs"),
+    # Generator scripts
+    "generate_counting_discrete": ("generate_counting_discrete.py", "generator", "Discrete counting"),
+    "generate_counting_relative": ("generate_counting_relative.py", "generator", "Relative counting"),
+    "generate_counting_continuous_smoothness": ("generate_counting_continuous_smoothness.py", "generator",
+                                                "Continuous quantity, smoothness"),
+    "generate_counting_continuous_tone": ("generate_counting_continuous_tone.py", "generator", "Continuous quantity, tone"),
+    "generate_occupancy_compare": ("generate_occupancy_compare.py", "generator", "Occupancy comparison"),
+    "generate_occupancy_distance": ("generate_occupancy_distance.py", "generator", "Occupancy distance"),
+    "generate_occupancy_fill": ("generate_occupancy_fill.py", "generator", "Occupancy fill"),
+    "speed_new": ("speed_new.py", "generator", "Two objects moving at different speeds"),
+    "trajectory_new": ("trajectory_new.py", "generator", "Object trajectories"),
+    "direction_with_light": ("direction_with_light.py", "generator", "Motion directions under lights"),
+    "generate_video_speed": ("generate_video_speed.py", "generator", "Videos of the speed dataset"),
+    "generate_video_trajectory": ("generate_video_trajectory.py", "generator", "Videos of the trajectory dataset"),
+    # Tools on the outputs
+    "shard_coordinator": ("shard_coordinator.py", "tool", "Render a planned generator in shards over several servers"),
+    "index_extractor": ("index_extractor.py", "tool", "Evaluation indexes from the generator outputs"),
+    "extract_discrete_index_info": ("extract_discrete_index_info.py", "tool", "Indexes of the discrete counting dataset"),
+    "extract_relative_index_info": ("extract_relative_index_info.py", "tool", "Indexes of the relative counting dataset"),
+    "extract_smoothness_index_info": ("extract_smoothness_index_info.py", "tool", "Indexes of the smoothness dataset"),
+    "extract_tone_index_info": ("extract_tone_index_info.py", "tool", "Indexes of the tone dataset"),
+    "quality_gate": ("quality_gate.py", "tool", "Check the frames of a run and quarantine the bad samples"),
+    "catalog": ("catalog.py", "tool", "SQLite catalog of the generated benchmarks"),
+    # Benchmarks
+    "bench_tdw_mock": ("benchmarks/bench_tdw_mock.py", "benchmark", "Throughput of the generators against the mock server"),
+    "bench_serialization": ("benchmarks/bench_serialization.py", "benchmark", "JSON encoding of index records"),
+    "bench_import_time": ("benchmarks/bench_import_time.py", "benchmark", "Import time of the CLI and the worker modules"),
+}
+GROUPS = ["task", "generator", "tool", "benchmark"]
+
+
+def command_list() -> str:
+    lines = []
+    for group in GROUPS:
+        lines.append(f"{group}s:")
+        for name, (_, command_group, description) in COMMANDS.items():
+            if command_group == group:
+                lines.append(f"  {name:42s}{description}")
+    return "\n".join(lines)
+
+
+def run(command: str, args: list):
+    """
+    Run a command in this process, as if its script was run with python: __name__ is "__main__", sys.argv holds the
+    script and the arguments, and the directory of the script comes first in sys.path.
+    """
+    path = os.path.join(ROOT, COMMANDS[command][0])
+    sys.argv = [path] + list(args)
+    for directory in (ROOT, os.path.dirname(path)):
+        if directory not in sys.path:
+            sys.path.insert(0, directory)
+    runpy.run_path(path, run_name="__main__")
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(prog="benchmark_tdw", formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     description="Generators and tools of the TDW benchmark.",
+                                     epilog=command_list() + "\n\nThe arguments after the command are passed to it, "
+                                            "e.g. benchmark_tdw.py speed_new --help")
+    parser.add_argument("command", type=str, choices=list(COMMANDS), metavar="command")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="The arguments of the command.")
+    args = parser.parse_args(argv)
+    run(args.command, args.args)
+
+
+if __name__ == "__main__":
+    main()
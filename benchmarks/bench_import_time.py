@@ -0,0 +1,123 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Import time of the CLI and of the modules the worker processes load, each in a fresh interpreter:
+#   import_s     time of the import itself, in the process
+#   startup_s    wall time of "python -c 'import module'", i.e. the spin-up of a worker: interpreter + import
+#   heavy        the heavy modules the import loaded
+# A module fails if it loads one of the heavy modules it must not (see MODULES) or if its startup_s is over --budget.
+#
+# python benchmarks/bench_import_time.py
+# python benchmarks/bench_import_time.py --modules sample_planner catalog --repeat 10
+# python benchmarks/bench_import_time.py --output imports.json --baseline imports_main.json --tolerance 0.2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ["tdw", "cv2", "matplotlib", "IPython", "PIL", "psutil", "hydra", "omegaconf", "multiprocessing", "scipy"]
+RENDER = ["tdw", "hydra", "omegaconf", "psutil"]
+# Module -> the heavy modules it must not load
+MODULES = {
+    "benchmark_tdw": HEAVY,
+    "serialization": HEAVY,
+    "index_writer": HEAVY,
+    "run_journal": HEAVY,
+    "index_extractor": HEAVY,
+    "catalog": HEAVY,
+    "render_cache": HEAVY,
+    "scene_config": HEAVY,
+    "plot_utils": HEAVY,
+    "sample_planner": RENDER + ["cv2", "matplotlib", "IPython", "multiprocessing"],
+    "shard_coordinator": RENDER + ["cv2", "matplotlib", "IPython", "multiprocessing"],
+    "quality_gate": RENDER + ["matplotlib", "IPython"],
+    # The render side, tracked only
+    "pipeline": [],
+    "tdw_object_utils": [],
+    "task_abstract": [],
+}
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"import_s": elapsed, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+# Lower is better for both
+COMPARED = ["import_s", "startup_s"]
+
+
+def measure(module: str, repeat: int) -> dict:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT] + [p for p in [os.environ.get("PYTHONPATH")] if p]))
+    imports, startups, heavy = [], [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY)], cwd=ROOT, env=env,
+                                capture_output=True, text=True)
+        startups.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            return {"status": "failed", "log": result.stderr[-2000:]}
+        probe = json.loads(result.stdout.strip().splitlines()[-1])
+        imports.append(probe["import_s"])
+        heavy = probe["heavy"]
+    return {"status": "ok", "import_s": round(statistics.median(imports), 4),
+            "startup_s": round(statistics.median(startups), 4), "heavy": heavy}
+
+
+def check(name: str, result: dict, budget: float) -> list:
+    if result["status"] != "ok":
+        return [f"{name}: import failed"]
+    errors = [f"{name}: loads {module}" for module in result["heavy"] if module in MODULES.get(name, [])]
+    if budget is not None and result["startup_s"] > budget:
+        errors.append(f"{name}: startup {result['startup_s']}s > {budget}s")
+    return errors
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for name, result in results.items():
+        for metric in COMPARED:
+            value, reference = result.get(metric), baseline.get(name, {}).get(metric)
+            if value is None or not reference:
+                continue
+            change = (value - reference) / reference
+            if change > tolerance:
+                regressions.append(f"{name} {metric}: {reference} -> {value} ({change:+.0%})")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import time of the CLI and the worker modules.")
+    parser.add_argument("--modules", type=str, nargs="+", default=list(MODULES))
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per module, the median is reported.")
+    parser.add_argument("--budget", type=float, default=1.0, help="Maximum startup_s of a module, in seconds.")
+    parser.add_argument("--output", type=str, default=None, help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", type=str, default=None, help="Exit with 1 if a module regressed with respect to these results.")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    baseline_startup = measure("sys", args.repeat)["startup_s"]
+    print(f"interpreter: {baseline_startup}s")
+    results, errors = {}, []
+    for name in args.modules:
+        results[name] = r = measure(name, args.repeat)
+        if r["status"] == "ok":
+            print(f"{name}: import {r['import_s']}s, startup {r['startup_s']}s, heavy: {', '.join(r['heavy']) or '-'}")
+        else:
+            print(f"{name}: failed\n{r['log']}")
+        errors.extend(check(name, r, args.budget))
+
+    for error in errors:
+        print(f"Error: {error}")
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump({"interpreter_s": baseline_startup, "modules": results}, f, indent=4)
+    regressions = []
+    if args.baseline is not None:
+        with open(args.baseline, "r") as f:
+            regressions = compare(results, json.load(f)["modules"], args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+    sys.exit(1 if errors or regressions else 0)
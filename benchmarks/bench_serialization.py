@@ -0,0 +1,113 @@
+import argparse
+import json
+import os
+import sys
+import timeit
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import serialization
+from interface import AVAILABLE_COLOR, AVAILABLE_MOTION, AVAILABLE_OBJECT, AVAILABLE_SCALE_FACTOR
+from serialization import numpy_to_python, to_python
+
+# Per-record cost of encoding output_res_cam records (see temporal_positioning.py):
+#   legacy:  json.dumps(numpy_to_python(record)), the recursive copy the generators used to make
+#   json:    json.dumps with the to_python default hook, as serialization.dumps does without orjson
+#   orjson:  serialization.dumps with orjson, if it is installed
+#
+# python benchmarks/bench_serialization.py
+# python benchmarks/bench_serialization.py --records outputs/temporal_positioning/output_res_cam.jsonl
+
+
+def make_object(rng):
+    return {
+        "model_name": str(rng.choice(AVAILABLE_OBJECT)),
+        "position": {"x": rng.uniform(-0.3, 0.3), "y": np.float64(0.2), "z": rng.uniform(-0.3, 0.3)},
+        "rotation": {"x": 0, "y": rng.uniform(-90, 90), "z": 0},
+        "scale_factor": rng.choice(AVAILABLE_SCALE_FACTOR),
+        "motion": str(rng.choice(AVAILABLE_MOTION)),
+        "color": AVAILABLE_COLOR[str(rng.choice(list(AVAILABLE_COLOR.keys())))],
+        "material": None,
+        "texture_scale": 1,
+    }
+
+
+def make_record(rng, cam="front", expr_dir="outputs/temporal_positioning/test_seed=0"):
+    """
+    A record shaped like those of TemporalPositioning.run, with the numpy values it holds.
+    """
+    images = [os.path.join(expr_dir, cam, f"img_{i:04d}.png") for i in range(8)]
+    index = np.arange(4)
+    rng.shuffle(index)
+    return {
+        "query": images[1:4],
+        "candidates": [images[0]] + images[4:7],
+        "answer": index[0],
+        "camera_direction": cam,
+        "main_obj": make_object(rng),
+        "other_objs": [make_object(rng)],
+        "scene": "empty_scene",
+    }
+
+
+def with_numpy(value):
+    """
+    Turn the numbers of a record read back from disk into numpy scalars, as they are before being written.
+    """
+    if isinstance(value, dict):
+        return {k: with_numpy(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [with_numpy(v) for v in value]
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, int):
+        return np.int64(value)
+    if isinstance(value, float):
+        return np.float64(value)
+    return value
+
+
+def load_records(path, limit):
+    records = []
+    with open(path, "r") as f:
+        for line in f:
+            records.append(with_numpy(json.loads(line)))
+            if len(records) >= limit:
+                break
+    return records
+
+
+def main(args):
+    if args.records is not None:
+        records = load_records(args.records, args.num_records)
+    else:
+        rng = np.random.RandomState(args.seed)
+        records = [make_record(rng, cam) for _ in range(args.num_records // 3) for cam in ["front", "top", "left"]]
+
+    encoders = {
+        "legacy": lambda r: json.dumps(numpy_to_python(r)),
+        "json": lambda r: json.dumps(r, separators=(",", ":"), default=to_python),
+    }
+    if serialization.orjson is not None:
+        encoders["orjson"] = serialization.dumps
+
+    print(f"{len(records)} records, {args.repeat} repeats")
+    baseline = None
+    for name, encode in encoders.items():
+        seconds = min(timeit.repeat(lambda: [encode(r) for r in records], number=1, repeat=args.repeat))
+        per_record = seconds / len(records) * 1e6
+        baseline = baseline or per_record
+        print(f"{name:>8}: {per_record:7.2f} us/record  ({baseline / per_record:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmark of the JSON encoding of index records.")
+    parser.add_argument("--records", type=str, default=None,
+                        help="An output_res_cam.jsonl to benchmark on. By default, synthetic records of the same shape.")
+    parser.add_argument("--num_records", type=int, default=3000, help="The number of records.")
+    parser.add_argument("--repeat", type=int, default=5, help="The number of timed repeats, the best one is reported.")
+    parser.add_argument("--seed", type=int, default=0, help="The seed of the synthetic records.")
+
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,213 @@
+import argparse
+import importlib
+import json
+import os
+import runpy
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yaml
+
+from mock_tdw_server import MockTDWServer
+
+# End-to-end throughput of the tasks and the generators against the mock TDW server (mock_tdw_server.py), so that
+# regressions show up in CI without a GPU or the TDW build. Every target runs in its own process, with a fresh server
+# on its port, until it is done, --samples records are written or --duration seconds have passed. Then:
+#   samples_per_s             records written to the index per second, between the first and the last round trip:
+#                             the launch of the scripts that start their own build (5s) is left out
+#   round_trips_per_sample    frames the server answered / records
+#   bytes_per_sample          commands + output data / records
+# A record is one line of the JSONL index of the target.
+#
+# python benchmarks/bench_tdw_mock.py
+# python benchmarks/bench_tdw_mock.py --targets generate_counting_discrete temporal_positioning --duration 30
+# python benchmarks/bench_tdw_mock.py --output bench.json --baseline bench_main.json --tolerance 0.2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Tasks: the module of their hydra main, their config and their index ({name} is the name in the config).
+# Scripts: their port and their index. Paths are relative to the output path.
+TARGETS = {
+    "temporal_positioning": {"module": "temporal_positioning", "config": "temporal_positioning.yaml",
+                             "index": "{name}/output_res_cam.jsonl"},
+    "visual_attribute": {"module": "attributes.visual_attribute", "config": "visual_attributes.yaml",
+                         "index": "{name}_index.jsonl"},
+    "object_interaction": {"module": "compositionality.object_interaction", "config": "compositionality.yaml",
+                           "index": "{name}/{name}_index.jsonl"},
+    "generate_counting_discrete": {"port": 1071, "index": "discrete_counting_info.jsonl"},
+    "generate_counting_relative": {"port": 1071, "index": "relative_counting_info.jsonl"},
+    "generate_counting_continuous_smoothness": {"port": 1071, "index": "continuous_quantity_smoothness.jsonl"},
+    "generate_counting_continuous_tone": {"port": 1071, "index": "continuous_quantity_tone.jsonl"},
+    "generate_occupancy_compare": {"port": 1071, "index": "position.jsonl", "args": ["--port", "1071"]},
+    "generate_occupancy_distance": {"port": 1071, "index": "position.jsonl"},
+    "generate_occupancy_fill": {"port": 1071, "index": "position.jsonl"},
+    "speed_new": {"port": 1078, "index": "speed.jsonl"},
+    "trajectory_new": {"port": 1075, "index": "trajectory.jsonl"},
+    "direction_with_light": {"port": 1075, "index": "direction.jsonl"},
+}
+SCREEN_SIZE = 256
+POLL_INTERVAL = 0.2
+STOP_TIMEOUT = 15
+# Lower is worse for samples_per_s, higher is worse for the others
+COMPARED = {"samples_per_s": -1, "round_trips_per_sample": 1, "bytes_per_sample": 1}
+
+
+def load_config(spec):
+    with open(os.path.join(ROOT, "configs", spec["config"]), "r") as f:
+        cfg = yaml.safe_load(f)
+    # Only hydra reads these
+    cfg.pop("defaults", None)
+    cfg.pop("hydra", None)
+    return cfg
+
+
+def run_target(name: str, output_path: str, port: int):
+    """
+    Run a target in this process, against the mock server on port: the build is never launched nor waited for.
+    """
+    from tdw.controller import Controller
+    import utils
+    import scene_geometry
+    from task_abstract import AbstractTask
+
+    def no_server(*args, **kwargs):
+        return None
+
+    # No network access nor build to wait for
+    Controller._check_pypi_version = staticmethod(no_server)
+    utils.start_tdw_server = no_server
+    AbstractTask.start_tdw_server = no_server
+    AbstractTask.startup_wait = 0
+    # The mock's geometry is not the build's: keep it out of the shared measurements
+    scene_geometry.SCENE_GEOMETRY_PATH = os.path.join(output_path, "scene_geometry.json")
+
+    spec = TARGETS[name]
+    if "module" in spec:
+        from omegaconf import OmegaConf
+        cfg = load_config(spec)
+        cfg.update(output_path=output_path, port=port, screen_size=[SCREEN_SIZE, SCREEN_SIZE])
+        importlib.import_module(spec["module"]).main(OmegaConf.create(cfg))
+    else:
+        sys.argv = [f"{name}.py", "--output_path", output_path, "--screen_size", str(SCREEN_SIZE), str(SCREEN_SIZE)] + spec.get("args", [])
+        runpy.run_path(os.path.join(ROOT, f"{name}.py"), run_name="__main__")
+
+
+def count_records(path: str) -> int:
+    if not os.path.exists(path):
+        return 0
+    with open(path, "rb") as f:
+        return f.read().count(b"\n")
+
+
+def benchmark(name: str, output_path: str, samples: int, duration: float, server_kwargs) -> dict:
+    """
+    Run a target in a child process against a fresh mock server and measure it.
+    """
+    spec = TARGETS[name]
+    port = load_config(spec)["port"] if "module" in spec else spec["port"]
+    index = spec["index"].format(name=load_config(spec)["name"] if "module" in spec else name)
+    index_path = os.path.join(output_path, index)
+    log_path = os.path.join(output_path, "log.txt")
+    os.makedirs(output_path, exist_ok=True)
+
+    server = MockTDWServer(port=port, **server_kwargs).start()
+    start = time.perf_counter()
+    with open(log_path, "w") as log:
+        child = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--run", name, "--output_path", output_path],
+                                 cwd=ROOT, stdout=log, stderr=subprocess.STDOUT)
+        n = 0
+        while child.poll() is None and n < samples and time.perf_counter() - start < duration:
+            time.sleep(POLL_INTERVAL)
+            n = count_records(index_path)
+        status = "done" if child.poll() == 0 else "failed" if child.poll() is not None else "stopped"
+        if status == "stopped":
+            # The records buffered by the index writer are flushed on the way out
+            child.send_signal(signal.SIGINT)
+            try:
+                child.wait(STOP_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                child.kill()
+                child.wait()
+    wall = time.perf_counter() - start
+    server.stop()
+    stats = server.stats()
+
+    n = count_records(index_path)
+    result = {"status": status, "samples": n, "wall_s": round(wall, 3),
+              "samples_per_s": round(n / stats["elapsed_s"], 3) if n and stats["elapsed_s"] > 0 else None,
+              "round_trips_per_sample": round(stats["round_trips"] / n, 2) if n else None,
+              "bytes_per_sample": round((stats["request_bytes"] + stats["response_bytes"]) / n) if n else None,
+              "images_per_sample": round(stats["images"] / n, 2) if n else None,
+              "server": stats}
+    if status == "failed":
+        with open(log_path, "r") as f:
+            result["log"] = f.read()[-2000:]
+    return result
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    The regressions of results with respect to baseline: metrics worse by more than tolerance (a fraction).
+    """
+    regressions = []
+    for name, result in results.items():
+        for metric, sign in COMPARED.items():
+            value, reference = result.get(metric), baseline.get(name, {}).get(metric)
+            if value is None or not reference:
+                continue
+            change = (value - reference) / reference
+            if change * sign > tolerance:
+                regressions.append(f"{name} {metric}: {reference} -> {value} ({change:+.0%})")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--targets", type=str, nargs="+", default=list(TARGETS), choices=list(TARGETS))
+    parser.add_argument("--samples", type=int, default=20, help="Stop a target after this many records.")
+    parser.add_argument("--duration", type=float, default=60, help="Stop a target after this many seconds.")
+    parser.add_argument("--latency", type=float, default=0.0, help="The latency of every frame, in seconds.")
+    parser.add_argument("--command_latency", type=str, default="{}",
+                        help='Additional latency per command type, as JSON, e.g. \'{"add_object": 0.002}\'.')
+    parser.add_argument("--image_latency", type=float, default=0.0, help="Additional latency per image.")
+    parser.add_argument("--output_path", type=str, default=None, help="Where the targets write. Default: a temporary directory, removed.")
+    parser.add_argument("--output", type=str, default=None, help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", type=str, default=None, help="Exit with 1 if a target regressed with respect to these results.")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--run", type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run is not None:
+        spec = TARGETS[args.run]
+        run_target(args.run, args.output_path, load_config(spec)["port"] if "module" in spec else spec["port"])
+        sys.exit(0)
+
+    output_path = args.output_path or tempfile.mkdtemp(prefix="bench_tdw_mock_")
+    server_kwargs = {"latency": args.latency, "command_latency": json.loads(args.command_latency),
+                     "image_latency": args.image_latency}
+    results = {}
+    try:
+        for name in args.targets:
+            results[name] = benchmark(name, os.path.join(output_path, name), args.samples, args.duration, server_kwargs)
+            r = results[name]
+            print(f"{name}: {r['status']}, {r['samples']} samples, {r['samples_per_s']} samples/s, "
+                  f"{r['round_trips_per_sample']} round trips/sample, {r['bytes_per_sample']} bytes/sample")
+            if r["status"] == "failed":
+                print(r["log"])
+    finally:
+        if args.output_path is None:
+            shutil.rmtree(output_path, ignore_errors=True)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+    if args.baseline is not None:
+        with open(args.baseline, "r") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        sys.exit(1 if regressions or any(r["status"] == "failed" for r in results.values()) else 0)
@@ -0,0 +1,202 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from scene_config import get_scene_settings
+
+# Analytic camera checks, used to reject samples before rendering.
+# Objects are approximated by bounding spheres and projected through a pinhole model of each
+# ThirdPersonCamera (position, look_at, vertical field of view). All functions broadcast over leading
+# dimensions, so a whole trajectory (frames x objects) is evaluated in one call.
+# Coordinates follow TDW: "y" is the vertical axis.
+
+DEFAULT_FIELD_OF_VIEW = 35  # TDW's default vertical field of view, in degrees
+NEAR_CLIP = 0.01
+QUADRATURE_POINTS = 64
+
+
+def to_array(vector) -> np.ndarray:
+    """
+    Convert a TDW vector ({"x", "y", "z"}) or a sequence into a float array.
+    """
+    if isinstance(vector, dict):
+        return np.array([vector["x"], vector["y"], vector["z"]], dtype=float)
+    return np.asarray(vector, dtype=float)
+
+
+def load_scene_cameras(scene: str, camera_ids: List[str] = None, config_path: str = None) -> Dict[str, dict]:
+    """
+    The cameras of a scene in scene_settings.yaml (see scene_config.py).
+
+    :param scene: The scene name.
+    :param camera_ids: The cameras to return. If None, return all of them.
+    :param config_path: The path of scene_settings.yaml. Default: scene_config.scene_settings_path().
+    :return: {camera_id: {"position": array, "look_at": array}}, read-only arrays
+    """
+    return get_scene_settings(scene, config_path).camera_rig(camera_ids)
+
+
+def camera_basis(position, look_at):
+    """
+    Return the (right, up, forward) unit vectors of a camera looking from position at look_at.
+    A camera looking straight down uses +z as its up direction.
+    """
+    forward = to_array(look_at) - to_array(position)
+    forward = forward / np.linalg.norm(forward)
+    world_up = np.array([0.0, 1.0, 0.0])
+    if abs(np.dot(forward, world_up)) > 0.999:
+        world_up = np.array([0.0, 0.0, 1.0])
+    right = np.cross(world_up, forward)
+    right = right / np.linalg.norm(right)
+    up = np.cross(forward, right)
+    return right, up, forward
+
+
+def project_spheres(centers, radii, position, look_at, field_of_view: float = DEFAULT_FIELD_OF_VIEW):
+    """
+    Project bounding spheres into the image plane of a camera.
+
+    The image plane is normalized so that the frame spans [-aspect, aspect] x [-1, 1].
+
+    :param centers: Sphere centers, shape (..., 3).
+    :param radii: Sphere radii, broadcastable to centers.shape[:-1].
+    :param position: The camera position.
+    :param look_at: The point the camera looks at.
+    :param field_of_view: The vertical field of view in degrees.
+    :return: (uv (..., 2), projected radius (...), depth (...)). Spheres behind the camera get a NaN position.
+    """
+    right, up, forward = camera_basis(position, look_at)
+    relative = np.asarray(centers, dtype=float) - to_array(position)
+    depth = relative @ forward
+    focal = 1.0 / np.tan(np.radians(field_of_view) / 2)
+    safe_depth = np.where(depth > NEAR_CLIP, depth, np.nan)
+    uv = np.stack([relative @ right, relative @ up], axis=-1) * (focal / safe_depth)[..., None]
+    radius = np.broadcast_to(np.asarray(radii, dtype=float), depth.shape) * focal / safe_depth
+    return uv, radius, depth
+
+
+def frame_coverage(uv, radius, aspect: float = 1.0):
+    """
+    Fraction of each projected disc that lies inside the frame.
+    The chord length of the disc inside the frame is integrated over x with a fixed quadrature.
+
+    :param uv: Projected centers, shape (..., 2).
+    :param radius: Projected radii, shape (...).
+    :param aspect: Width / height of the screen.
+    :return: Coverage in [0, 1], shape (...). Spheres behind the camera have coverage 0.
+    """
+    radius = np.asarray(radius, dtype=float)
+    cx, cy = uv[..., 0], uv[..., 1]
+    # Midpoints of QUADRATURE_POINTS slices of the disc's diameter, in units of the radius
+    t = (np.arange(QUADRATURE_POINTS) + 0.5) / QUADRATURE_POINTS * 2 - 1
+    x = cx[..., None] + radius[..., None] * t
+    half_chord = radius[..., None] * np.sqrt(1 - t ** 2)
+    low = np.maximum(cy[..., None] - half_chord, -1.0)
+    high = np.minimum(cy[..., None] + half_chord, 1.0)
+    inside = np.clip(high - low, 0, None) * ((x >= -aspect) & (x <= aspect))
+    area = inside.sum(axis=-1) * (2 * radius / QUADRATURE_POINTS)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        coverage = area / (np.pi * radius ** 2)
+    return np.nan_to_num(np.clip(coverage, 0, 1), nan=0.0)
+
+
+def disc_overlap_area(uv_a, r_a, uv_b, r_b):
+    """
+    Closed-form intersection area of two discs. Broadcasts over leading dimensions.
+    """
+    d = np.linalg.norm(uv_a - uv_b, axis=-1)
+    r_small = np.minimum(r_a, r_b)
+    r_large = np.maximum(r_a, r_b)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        alpha = np.arccos(np.clip((d ** 2 + r_a ** 2 - r_b ** 2) / (2 * d * r_a), -1, 1))
+        beta = np.arccos(np.clip((d ** 2 + r_b ** 2 - r_a ** 2) / (2 * d * r_b), -1, 1))
+        lens = (r_a ** 2 * (alpha - np.sin(2 * alpha) / 2) + r_b ** 2 * (beta - np.sin(2 * beta) / 2))
+    area = np.where(d >= r_a + r_b, 0.0, np.where(d <= r_large - r_small, np.pi * r_small ** 2, lens))
+    return np.nan_to_num(area, nan=0.0)
+
+
+def occlusion_matrix(uv, radius, depth):
+    """
+    Pairwise occlusion between the objects of each frame.
+
+    :param uv: Projected centers, shape (..., N, 2).
+    :param radius: Projected radii, shape (..., N).
+    :param depth: Depths along the camera axis, shape (..., N).
+    :return: (..., N, N) array whose [i, j] entry is the fraction of object i hidden by object j (0 if j is farther).
+    """
+    overlap = disc_overlap_area(uv[..., :, None, :], radius[..., :, None], uv[..., None, :, :], radius[..., None, :])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fraction = overlap / (np.pi * radius[..., :, None] ** 2)
+    in_front = depth[..., None, :] < depth[..., :, None]
+    return np.nan_to_num(np.where(in_front, np.clip(fraction, 0, 1), 0.0), nan=0.0)
+
+
+def visibility_report(centers, radii, cameras: Dict[str, dict], field_of_view: float = DEFAULT_FIELD_OF_VIEW,
+                      aspect: float = 1.0) -> Dict[str, dict]:
+    """
+    Evaluate every camera over every frame of a trajectory.
+
+    :param centers: Object centers, shape (T, N, 3) or (N, 3).
+    :param radii: Bounding sphere radii, shape (N,).
+    :param cameras: {camera_id: {"position", "look_at"}} as returned by load_scene_cameras.
+    :param field_of_view: The vertical field of view in degrees.
+    :param aspect: Width / height of the screen.
+    :return: {camera_id: {"coverage": (T, N), "occlusion": (T, N), "motion": (N,)}}.
+             "occlusion" is the hidden fraction (sum over closer objects, capped at 1),
+             "motion" is the image-plane path length of each object.
+    """
+    centers = np.asarray(centers, dtype=float)
+    if centers.ndim == 2:
+        centers = centers[None]
+    report = {}
+    for camera_id, camera in cameras.items():
+        uv, radius, depth = project_spheres(centers, radii, camera["position"], camera["look_at"], field_of_view)
+        occlusion = occlusion_matrix(uv, radius, depth).sum(axis=-1)
+        steps = np.linalg.norm(np.diff(uv, axis=0), axis=-1)
+        report[camera_id] = {
+            "coverage": frame_coverage(uv, radius, aspect),
+            "occlusion": np.clip(occlusion, 0, 1),
+            "motion": np.nan_to_num(steps, nan=0.0).sum(axis=0),
+        }
+    return report
+
+
+def is_sample_visible(centers, radii, cameras: Dict[str, dict], field_of_view: float = DEFAULT_FIELD_OF_VIEW,
+                      aspect: float = 1.0, min_coverage: float = 0.95, max_occlusion: float = 0.5) -> bool:
+    """
+    True if, for every camera and every frame, each object is (almost) inside the frame and not hidden.
+    """
+    report = visibility_report(centers, radii, cameras, field_of_view, aspect)
+    return all(bool((res["coverage"] >= min_coverage).all() and (res["occlusion"] <= max_occlusion).all())
+               for res in report.values())
+
+
+def filter_views_by_motion(centers, cameras: Dict[str, dict], field_of_view: float = DEFAULT_FIELD_OF_VIEW,
+                           min_motion: float = 0.1, moving: Optional[List[int]] = None) -> List[str]:
+    """
+    Keep the cameras in which the moving objects travel at least min_motion in the image plane.
+    This replaces the direction-based filtering of get_camera_views: motion along a camera's axis barely moves in its image.
+
+    :param centers: Object centers, shape (T, N, 3).
+    :param cameras: {camera_id: {"position", "look_at"}}.
+    :param field_of_view: The vertical field of view in degrees.
+    :param min_motion: Minimum image-plane path length (the frame height is 2).
+    :param moving: Indices of the moving objects. If None, all objects are checked.
+    :return: The camera ids that show the motion.
+    """
+    centers = np.asarray(centers, dtype=float)
+    radii = np.zeros(centers.shape[-2])
+    report = visibility_report(centers, radii, cameras, field_of_view)
+    views = []
+    for camera_id, res in report.items():
+        motion = res["motion"] if moving is None else res["motion"][moving]
+        if (motion >= min_motion).all():
+            views.append(camera_id)
+    return views
+
+
+def bounding_radius(scale: float, half_extent: float = 0.5) -> float:
+    """
+    Bounding sphere radius of a primitive (prim_cube, prim_sphere...) whose unscaled half extent is half_extent.
+    """
+    return float(scale) * half_extent * np.sqrt(3)
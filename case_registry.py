@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+from collections.abc import Sequence
+from typing import Any, Dict, Iterator
+
+from combinatorics import PermutationSpace, ProductSpace, ShuffledView
+
+# Unique-case generation without rejection sampling.
+# A CaseSpace maps every integer in [0, len(space)) to one distinct combination of discrete parameters,
+# so the integer itself is a compact case id. CaseLedger remembers which ids earlier runs already generated
+# (one bit per case, persisted next to the output), and CaseSpace.iter_new walks the space in a seeded
+# random order while skipping them: no retries, however close the target gets to the size of the space.
+
+
+def case_hash(params: Dict[str, Any], digest_size: int = 8) -> str:
+    """
+    Stable hashed id of a case, independent of the order of the space (it survives adding colors or shapes).
+
+    :param params: The case parameters, as returned by CaseSpace[case_id].
+    :param digest_size: The number of bytes of the blake2b digest.
+    :return: The hex digest.
+    """
+    canonical = json.dumps(params, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=digest_size).hexdigest()
+
+
+def _describe(factor) -> Any:
+    """
+    JSON-serializable description of a factor, without enumerating lazy spaces.
+    """
+    if isinstance(factor, PermutationSpace):
+        return {"permutations": _describe(factor.choices), "k": factor.k}
+    if isinstance(factor, ProductSpace):
+        return {"product": [_describe(f) for f in factor.factors]}
+    return list(factor)
+
+
+class CaseSpace(Sequence):
+    """
+    The product of named factors. Factors may be plain lists or lazy spaces from combinatorics.py,
+    e.g. a PermutationSpace of (model, color) pairs so that two objects never share a shape id.
+    """
+    def __init__(self, factors: Dict[str, Sequence]):
+        self.names = list(factors.keys())
+        self.factors = [f if isinstance(f, Sequence) else list(f) for f in factors.values()]
+        self.space = ProductSpace(*self.factors)
+
+    def __len__(self):
+        return len(self.space)
+
+    def __getitem__(self, case_id):
+        if isinstance(case_id, slice):
+            return [self[i] for i in range(*case_id.indices(len(self)))]
+        return dict(zip(self.names, self.space[case_id]))
+
+    def fingerprint(self) -> str:
+        """
+        Hash of the factor values: a ledger is only valid for the space it was written for.
+        """
+        description = {name: _describe(factor) for name, factor in zip(self.names, self.factors)}
+        canonical = json.dumps(description, sort_keys=True, default=str)
+        return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+
+    def order(self, seed: int = 0) -> ShuffledView:
+        """
+        All case ids in a deterministic pseudo-random order.
+        """
+        return ShuffledView(range(len(self)), seed)
+
+    def iter_new(self, ledger: "CaseLedger" = None, seed: int = 0) -> Iterator[int]:
+        """
+        Lazily yield the case ids that are not in the ledger, in the order given by the seed.
+        """
+        for case_id in self.order(seed):
+            if ledger is None or case_id not in ledger:
+                yield case_id
+
+
+class CaseLedger:
+    """
+    Persistent bitmap of generated case ids. Membership checks and updates are O(1).
+
+    The file holds the space fingerprint (32 hex characters and a newline) followed by the bitmap.
+    """
+    def __init__(self, path: str, space: CaseSpace):
+        self.path = path
+        self.fingerprint = space.fingerprint()
+        self.size = len(space)
+        self.bits = bytearray((self.size + 7) // 8)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                header = f.readline().decode("utf-8").strip()
+                if header != self.fingerprint:
+                    raise ValueError(f"Case ledger {path} was written for a different case space; "
+                                     f"remove it or use another output path.")
+                data = f.read()
+            self.bits[:len(data)] = data
+
+    def __contains__(self, case_id: int) -> bool:
+        return bool(self.bits[case_id >> 3] & (1 << (case_id & 7)))
+
+    def __len__(self):
+        return sum(bin(byte).count("1") for byte in self.bits)
+
+    def add(self, case_id: int, flush: bool = True):
+        self.bits[case_id >> 3] |= 1 << (case_id & 7)
+        if flush:
+            self.save()
+
+    def save(self):
+        """
+        Write the ledger atomically, so an interrupted run never leaves a truncated bitmap behind.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self.fingerprint.encode("utf-8") + b"\n")
+            f.write(bytes(self.bits))
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,485 @@
+import argparse
+import fnmatch
+import hashlib
+import os
+import sqlite3
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from index_extractor import iter_json_records, sample_id, split_record
+from serialization import dumps, loads
+
+# SQLite catalog of the generated benchmarks.
+# Every generator writes its own index (discrete_counting_info.json, position.json, direction.json,
+# output_res_cam.jsonl, {name}_index.jsonl, metadata.json...). ingest() loads any of them into one local database
+# with a row per sample and its objects, cameras, frames and answers in indexed tables, so filters such as "the
+# samples of box_room_2018 with a prim_cyl at scale 0.4" are answered by the indexes instead of by loading every index.
+#
+# Ingestion is incremental: a source is skipped if its size and mtime did not change, a .jsonl that only grew is
+# read from the offset reached by the previous ingestion (IndexWriter files are append-only while a run is going),
+# and any other change re-ingests the source. Each source is ingested in one transaction.
+
+DEFAULT_DB = "catalog.sqlite"
+INDEX_PATTERNS = ["*_info.json", "*_info.jsonl", "continuous_quantity_*.json", "continuous_quantity_*.jsonl",
+                  "position.json", "position.jsonl", "direction.json", "direction.jsonl", "speed.json", "speed.jsonl",
+                  "trajectory.json", "trajectory.jsonl", "output_res_cam.jsonl", "*_index.jsonl", "metadata.json"]
+INSERT_BATCH_SIZE = 1000
+HEAD_SIZE = 4096
+SCALE_DIGITS = 6
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    benchmark TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    head TEXT NOT NULL,
+    records INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS samples (
+    id INTEGER PRIMARY KEY,
+    source_id INTEGER NOT NULL REFERENCES sources(id) ON DELETE CASCADE,
+    benchmark TEXT NOT NULL,
+    section TEXT,
+    sample_key TEXT,
+    scene TEXT,
+    image_path TEXT,
+    shuffle_key INTEGER NOT NULL,
+    record TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS objects (
+    sample_id INTEGER NOT NULL REFERENCES samples(id) ON DELETE CASCADE,
+    role TEXT NOT NULL,
+    model_name TEXT,
+    color TEXT,
+    material TEXT,
+    scale REAL
+);
+CREATE TABLE IF NOT EXISTS cameras (
+    sample_id INTEGER NOT NULL REFERENCES samples(id) ON DELETE CASCADE,
+    camera TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS frames (
+    sample_id INTEGER NOT NULL REFERENCES samples(id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    path TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS answers (
+    sample_id INTEGER NOT NULL REFERENCES samples(id) ON DELETE CASCADE,
+    question TEXT,
+    answer TEXT,
+    choices TEXT
+);
+CREATE INDEX IF NOT EXISTS samples_source ON samples(source_id);
+CREATE INDEX IF NOT EXISTS samples_benchmark ON samples(benchmark, section);
+CREATE INDEX IF NOT EXISTS samples_scene ON samples(scene);
+CREATE INDEX IF NOT EXISTS objects_sample ON objects(sample_id);
+CREATE INDEX IF NOT EXISTS objects_model ON objects(model_name, scale, sample_id);
+CREATE INDEX IF NOT EXISTS objects_color ON objects(color, sample_id);
+CREATE INDEX IF NOT EXISTS objects_material ON objects(material, sample_id);
+CREATE INDEX IF NOT EXISTS cameras_sample ON cameras(sample_id);
+CREATE INDEX IF NOT EXISTS cameras_camera ON cameras(camera, sample_id);
+CREATE INDEX IF NOT EXISTS frames_sample ON frames(sample_id);
+CREATE INDEX IF NOT EXISTS answers_sample ON answers(sample_id);
+CREATE INDEX IF NOT EXISTS answers_answer ON answers(answer, sample_id);
+"""
+
+# Filters on the samples table, and on the objects of a sample (all of them must hold for the same object).
+# Filters on the other tables are "s.id IN (...)" so they are evaluated once, with their index, not once per sample.
+SAMPLE_FILTERS = {"benchmark": "s.benchmark = ?", "section": "s.section = ?", "scene": "s.scene = ?",
+                  "camera": "s.id IN (SELECT c.sample_id FROM cameras c WHERE c.camera = ?)",
+                  "answer": "s.id IN (SELECT a.sample_id FROM answers a WHERE a.answer = ?)"}
+OBJECT_FILTERS = {"model_name": "o.model_name = ?", "color": "o.color = ?", "material": "o.material = ?",
+                  "scale": "o.scale = ?", "role": "o.role = ?"}
+# The values a subset can be balanced over
+BALANCE_COLUMNS = {"benchmark": "s.benchmark", "section": "s.section", "scene": "s.scene",
+                   "camera": "(SELECT MIN(c.camera) FROM cameras c WHERE c.sample_id = s.id)",
+                   "answer": "(SELECT MIN(a.answer) FROM answers a WHERE a.sample_id = s.id)"}
+
+
+def benchmark_name(path: str) -> str:
+    """
+    The default benchmark of an index: "discrete_counting_info.json" -> "discrete_counting",
+    "{name}_index.jsonl" -> name, "{name}/output_res_cam.jsonl" -> name, "metadata.json" -> "relative_position".
+    """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if stem == "output_res_cam":
+        return os.path.basename(os.path.dirname(os.path.abspath(path)))
+    if stem == "metadata":
+        return "relative_position"
+    for suffix in ("_index", "_info"):
+        if stem.endswith(suffix):
+            return stem[:-len(suffix)]
+    return stem
+
+
+def find_indexes(root: str) -> List[str]:
+    """
+    The indexes under root. A .json written by IndexWriter.finalize is skipped if its .jsonl is there.
+    """
+    paths = []
+    for dirpath, _, filenames in os.walk(root):
+        names = set(filenames)
+        for filename in sorted(filenames):
+            if not any(fnmatch.fnmatch(filename, pattern) for pattern in INDEX_PATTERNS):
+                continue
+            if filename.endswith(".json") and filename + "l" in names:
+                continue
+            paths.append(os.path.join(dirpath, filename))
+    return paths
+
+
+def _scale(value: Any) -> Optional[float]:
+    # Scales are numbers, {"x", "y", "z"} dicts or lists; non-uniform scales are averaged as in ObjectType.get_size
+    if isinstance(value, dict):
+        value = [value[axis] for axis in ("x", "y", "z") if axis in value]
+    if isinstance(value, (list, tuple)):
+        value = sum(float(v) for v in value) / len(value) if value else None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return round(float(value), SCALE_DIGITS)
+    return None
+
+
+def _object_row(role: str, obj: Dict[str, Any]) -> Tuple[str, Optional[str], Optional[str], Optional[str], Optional[float]]:
+    color = obj.get("color_name", obj.get("color"))
+    material = obj.get("material")
+    return (role, obj.get("model_name", obj.get("type")), color if isinstance(color, str) else None,
+            material if isinstance(material, str) else None,
+            _scale(obj.get("scale_factor", obj.get("size", obj.get("scale")))))
+
+
+def _as_list(value: Any) -> List[Any]:
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def describe_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The catalog fields of a record, whatever the generator that wrote it.
+
+    :return: {"scene", "image_path", "sample_key", "objects": [(role, model_name, color, material, scale)],
+              "cameras": [camera], "frames": [(kind, path)], "answer": (question, answer, choices) or None}
+    """
+    objects = []
+    for key, role in (("objects_info", "object"), ("objects", "object"), ("main_obj", "main"),
+                      ("other_objs", "other"), ("moving", "moving"), ("reference", "reference")):
+        objects.extend(_object_row(role, obj) for obj in _as_list(record.get(key)) if isinstance(obj, dict))
+    if "model_name" in record:
+        # visual_attribute records are the attributes of their object
+        objects.append(_object_row("object", record))
+    if "obj_names" in record:
+        # relative_position metadata: one value for all the objects, or one per object
+        names = _as_list(record["obj_names"])
+        columns = [_as_list(record.get(key)) for key in ("colors", "sizes")]
+        columns = [column if len(column) == len(names) else column[:1] * len(names) for column in columns]
+        for name, color, size in zip(names, *[column or [None] * len(names) for column in columns]):
+            objects.append(_object_row("object", {"model_name": name, "color": color, "size": size}))
+
+    cameras = [str(record[key]) for key in ("camera_view", "camera_id", "camera_direction") if record.get(key) is not None]
+
+    frames = []
+    for key, kind in (("image_path", "image"), ("source_dir", "source"), ("source", "source"),
+                      ("query", "query"), ("candidates", "candidate")):
+        frames.extend((kind, path) for path in _as_list(record.get(key)) if isinstance(path, str))
+
+    answer = None
+    question = record.get("question")
+    value = record.get("gt_answer", record.get("answer"))
+    choices = record.get("choices", record.get("choice"))
+    if question is not None or value is not None:
+        answer = (question, value if value is None or isinstance(value, str) else dumps(value),
+                  dumps(choices) if choices is not None else None)
+
+    image_path = record.get("image_path") if isinstance(record.get("image_path"), str) else None
+    scene = record.get("scene", record.get("background"))
+    return {"scene": scene if isinstance(scene, str) else None,
+            "image_path": image_path,
+            "sample_key": sample_id(image_path) if image_path else (str(record["scene_id"]) if "scene_id" in record else None),
+            "objects": objects, "cameras": cameras, "frames": frames, "answer": answer}
+
+
+def iter_jsonl_lines(path: str, offset: int = 0) -> Iterator[Tuple[int, Optional[str], Dict[str, Any]]]:
+    """
+    Stream the (end offset, section, record) of the complete lines of a .jsonl after offset.
+    A torn last line (a run still writing it) stops the iteration, so it is read again next time.
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                return
+            offset += len(line)
+            if not line.strip():
+                continue
+            try:
+                record = loads(line)
+            except ValueError:
+                return
+            section, record = split_record(record)
+            yield offset, section, record
+
+
+class Catalog:
+    """
+    The catalog database. Use it as a context manager, or close() it.
+    """
+
+    def __init__(self, path: str = DEFAULT_DB):
+        """
+        :param path: The SQLite file. It is created if it does not exist.
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    # Ingestion
+
+    @staticmethod
+    def _head(path: str, size: int) -> str:
+        with open(path, "rb") as f:
+            return hashlib.blake2b(f.read(min(size, HEAD_SIZE)), digest_size=16).hexdigest()
+
+    def ingest(self, path: str, benchmark: str = None) -> int:
+        """
+        Ingest an index, or what was appended to it since the last ingestion.
+
+        :param path: A .json or .jsonl index.
+        :param benchmark: The benchmark of its samples. Defaults to benchmark_name(path).
+        :return: The number of new samples.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        row = self.conn.execute("SELECT * FROM sources WHERE path = ?", (path,)).fetchone()
+        if row is not None and row["size"] == stat.st_size and row["mtime_ns"] == stat.st_mtime_ns:
+            return 0
+        with self.conn:
+            if (row is not None and path.endswith(".jsonl") and stat.st_size >= row["offset"]
+                    and self._head(path, row["offset"]) == row["head"]):
+                # Appended since the last ingestion
+                source_id, offset, count = row["id"], row["offset"], row["records"]
+            else:
+                if row is not None:
+                    self.conn.execute("DELETE FROM sources WHERE id = ?", (row["id"],))
+                source_id = self.conn.execute(
+                    "INSERT INTO sources (path, benchmark, size, mtime_ns, offset, head, records) VALUES (?, ?, 0, 0, 0, '', 0)",
+                    (path, benchmark or benchmark_name(path))).lastrowid
+                offset, count = 0, 0
+            benchmark = self.conn.execute("SELECT benchmark FROM sources WHERE id = ?", (source_id,)).fetchone()[0]
+
+            if path.endswith(".jsonl"):
+                records = iter_jsonl_lines(path, offset)
+            else:
+                records = ((stat.st_size, section, record) for section, record in iter_json_records(path))
+            added = self._insert(path, source_id, benchmark, count, records)
+            offset = added[1] if added[0] else offset
+            self.conn.execute("UPDATE sources SET size = ?, mtime_ns = ?, offset = ?, head = ?, records = ? WHERE id = ?",
+                              (stat.st_size, stat.st_mtime_ns, offset, self._head(path, offset), count + added[0], source_id))
+        return added[0]
+
+    def _insert(self, path: str, source_id: int, benchmark: str, count: int,
+                records: Iterator[Tuple[int, Optional[str], Dict[str, Any]]]) -> Tuple[int, int]:
+        added, offset = 0, 0
+        children = {"objects": [], "cameras": [], "frames": [], "answers": []}
+        for offset, section, record in records:
+            info = describe_record(record)
+            # A stable pseudo-random key per sample, used to draw subsets
+            shuffle_key = int.from_bytes(hashlib.blake2b(f"{path}:{count + added}".encode("utf-8"), digest_size=7).digest(), "big")
+            sample = self.conn.execute(
+                "INSERT INTO samples (source_id, benchmark, section, sample_key, scene, image_path, shuffle_key, record) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (source_id, benchmark, section, info["sample_key"], info["scene"], info["image_path"], shuffle_key,
+                 dumps(record))).lastrowid
+            children["objects"].extend((sample,) + obj for obj in info["objects"])
+            children["cameras"].extend((sample, camera) for camera in info["cameras"])
+            children["frames"].extend((sample,) + frame for frame in info["frames"])
+            if info["answer"] is not None:
+                children["answers"].append((sample,) + info["answer"])
+            added += 1
+            if added % INSERT_BATCH_SIZE == 0:
+                self._insert_children(children)
+        self._insert_children(children)
+        return added, offset
+
+    def _insert_children(self, children: Dict[str, List[tuple]]):
+        statements = {"objects": "INSERT INTO objects VALUES (?, ?, ?, ?, ?, ?)",
+                      "cameras": "INSERT INTO cameras VALUES (?, ?)",
+                      "frames": "INSERT INTO frames VALUES (?, ?, ?)",
+                      "answers": "INSERT INTO answers VALUES (?, ?, ?, ?)"}
+        for table, rows in children.items():
+            if rows:
+                self.conn.executemany(statements[table], rows)
+                rows.clear()
+
+    def ingest_tree(self, root: str) -> Dict[str, int]:
+        """
+        Ingest every index found under root (see find_indexes).
+
+        :return: {path: number of new samples}
+        """
+        return {path: self.ingest(path) for path in find_indexes(root)}
+
+    # Queries
+
+    @staticmethod
+    def _where(filters: Dict[str, Any]) -> Tuple[str, List[Any]]:
+        clauses, params = [], []
+        object_clauses, object_params = [], []
+        for key, value in filters.items():
+            if value is None:
+                continue
+            if key in SAMPLE_FILTERS:
+                clauses.append(SAMPLE_FILTERS[key])
+                params.append(value)
+            elif key in OBJECT_FILTERS:
+                object_clauses.append(OBJECT_FILTERS[key])
+                object_params.append(_scale(value) if key == "scale" else value)
+            else:
+                raise ValueError(f"Unknown filter {key}, expected one of {list(SAMPLE_FILTERS) + list(OBJECT_FILTERS)}")
+        if object_clauses:
+            clauses.append(f"s.id IN (SELECT o.sample_id FROM objects o WHERE {' AND '.join(object_clauses)})")
+            params.extend(object_params)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    @staticmethod
+    def _sample(row: sqlite3.Row) -> Dict[str, Any]:
+        return {"id": row["id"], "benchmark": row["benchmark"], "section": row["section"], "scene": row["scene"],
+                "image_path": row["image_path"], "record": loads(row["record"])}
+
+    def query(self, limit: int = None, **filters) -> List[Dict[str, Any]]:
+        """
+        The samples that match the filters, e.g. query(scene="box_room_2018", model_name="prim_cyl", scale=0.4).
+
+        :param limit: The maximum number of samples.
+        :param filters: Keys of SAMPLE_FILTERS and OBJECT_FILTERS. The object filters must hold for the same object.
+        :return: [{"id", "benchmark", "section", "scene", "image_path", "record"}]
+        """
+        where, params = self._where(filters)
+        sql = f"SELECT s.* FROM samples s{where} ORDER BY s.id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [self._sample(row) for row in self.conn.execute(sql, params)]
+
+    def count(self, **filters) -> int:
+        """
+        The number of samples that match the filters (see query).
+        """
+        where, params = self._where(filters)
+        return self.conn.execute(f"SELECT COUNT(*) FROM samples s{where}", params).fetchone()[0]
+
+    def values(self, by: str, **filters) -> Dict[Any, int]:
+        """
+        The number of samples per value of a BALANCE_COLUMNS column, among the samples that match the filters.
+        """
+        where, params = self._where(filters)
+        rows = self.conn.execute(f"SELECT {BALANCE_COLUMNS[by]} AS value, COUNT(*) FROM samples s{where} GROUP BY value", params)
+        return {value: n for value, n in rows}
+
+    def balanced_subset(self, by: str, per_value: int, seed: int = 0, **filters) -> List[Dict[str, Any]]:
+        """
+        Draw the same number of samples for every value of a column, e.g. 100 samples per scene.
+
+        :param by: A key of BALANCE_COLUMNS.
+        :param per_value: The number of samples per value (fewer if a value does not have that many).
+        :param seed: The seed of the draw. The same seed draws the same subset.
+        :param filters: As in query.
+        """
+        if by not in BALANCE_COLUMNS:
+            raise ValueError(f"Unknown column {by}, expected one of {list(BALANCE_COLUMNS)}")
+        where, params = self._where(filters)
+        # shuffle_key XOR a key of the seed: a different order per seed, without a full sort in Python
+        seed_key = int.from_bytes(hashlib.blake2b(str(seed).encode("utf-8"), digest_size=7).digest(), "big")
+        # The draw only reads the indexes and shuffle keys; the records of the drawn samples are read afterwards
+        sql = (f"SELECT * FROM samples WHERE id IN (SELECT id FROM (SELECT s.id, ROW_NUMBER() OVER "
+               f"(PARTITION BY {BALANCE_COLUMNS[by]} ORDER BY (s.shuffle_key | ?) - (s.shuffle_key & ?)) AS draw "
+               f"FROM samples s{where}) WHERE draw <= ?) ORDER BY id")
+        rows = self.conn.execute(sql, [seed_key, seed_key] + params + [per_value])
+        return [self._sample(row) for row in rows]
+
+    @staticmethod
+    def export(samples: List[Dict[str, Any]], path: str) -> int:
+        """
+        Write samples as JSONL lines {"benchmark", "section", "record"}, atomically.
+
+        :return: The number of samples written.
+        """
+        with open(path + ".tmp", "w") as f:
+            for sample in samples:
+                f.write(dumps({"benchmark": sample["benchmark"], "section": sample["section"], "record": sample["record"]}) + "\n")
+        os.replace(path + ".tmp", path)
+        return len(samples)
+
+
+def _add_filter_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--benchmark", type=str, default=None, help="The benchmark, e.g. discrete_counting.")
+    parser.add_argument("--section", type=str, default=None, help="The section, e.g. shape_section.")
+    parser.add_argument("--scene", type=str, default=None, help="The scene, e.g. box_room_2018.")
+    parser.add_argument("--camera", type=str, default=None, help="The camera id.")
+    parser.add_argument("--answer", type=str, default=None, help="The ground truth answer.")
+    parser.add_argument("--model_name", type=str, default=None, help="An object model (or type), e.g. prim_cyl.")
+    parser.add_argument("--color", type=str, default=None, help="The color name of that object.")
+    parser.add_argument("--material", type=str, default=None, help="The material of that object.")
+    parser.add_argument("--scale", type=float, default=None, help="The scale of that object.")
+    parser.add_argument("--role", type=str, default=None, help="The role of that object, e.g. moving or main.")
+
+
+def _filters(args: argparse.Namespace) -> Dict[str, Any]:
+    return {key: getattr(args, key) for key in list(SAMPLE_FILTERS) + list(OBJECT_FILTERS)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SQLite catalog of the generated benchmarks.")
+    parser.add_argument("--db", type=str, default=DEFAULT_DB, help="The catalog database.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = subparsers.add_parser("ingest", help="Ingest indexes, or the indexes found in directories.")
+    ingest_parser.add_argument("paths", type=str, nargs="+", help="Index files or directories.")
+    ingest_parser.add_argument("--benchmark", type=str, default=None, help="The benchmark of the index files.")
+
+    query_parser = subparsers.add_parser("query", help="Print the samples that match the filters.")
+    _add_filter_arguments(query_parser)
+    query_parser.add_argument("--limit", type=int, default=20, help="The maximum number of samples printed.")
+    query_parser.add_argument("--count", action="store_true", help="Only print the number of samples.")
+
+    export_parser = subparsers.add_parser("export", help="Export a subset balanced over a column to JSONL.")
+    export_parser.add_argument("output", type=str, help="The JSONL file.")
+    export_parser.add_argument("--by", type=str, default="scene", choices=list(BALANCE_COLUMNS.keys()),
+                               help="The column to balance.")
+    export_parser.add_argument("--per_value", type=int, default=100, help="The number of samples per value.")
+    export_parser.add_argument("--seed", type=int, default=0, help="The seed of the draw.")
+    _add_filter_arguments(export_parser)
+    args = parser.parse_args()
+
+    start = time.time()
+    with Catalog(args.db) as catalog:
+        if args.command == "ingest":
+            for path in args.paths:
+                added = catalog.ingest_tree(path) if os.path.isdir(path) else {path: catalog.ingest(path, args.benchmark)}
+                for index_path, count in added.items():
+                    print(f"{index_path}: {count} new samples")
+        elif args.command == "query":
+            if args.count:
+                print(catalog.count(**_filters(args)))
+            else:
+                for sample in catalog.query(limit=args.limit, **_filters(args)):
+                    print(dumps(sample))
+        else:
+            samples = catalog.balanced_subset(args.by, args.per_value, seed=args.seed, **_filters(args))
+            print(f"Exported {catalog.export(samples, args.output)} samples to {args.output}")
+    print(f"Done in {time.time() - start:.2f}s")
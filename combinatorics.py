@@ -0,0 +1,166 @@
+import random
+from collections.abc import Sequence
+from math import perm, prod
+from typing import Any, Callable, Iterator
+
+# Lazy attribute-combination spaces.
+# PermutationSpace and ProductSpace index itertools.permutations / itertools.product arithmetically (same order),
+# and ShuffledView walks any such space in a pseudo-random order without materializing it: memory stays constant
+# no matter how many colors, shapes or materials are added.
+
+_MASK64 = (1 << 64) - 1
+
+
+def _mix64(x: int) -> int:
+    """
+    splitmix64 finalizer, used as the round function of the Feistel permutation.
+    """
+    x = (x + 0x9E3779B97F4A7C15) & _MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return x ^ (x >> 31)
+
+
+class PermutationSpace(Sequence):
+    """
+    The k-permutations of choices, in the order of itertools.permutations(choices, k).
+    """
+    def __init__(self, choices, k: int = None):
+        self.choices = choices if isinstance(choices, Sequence) else list(choices)
+        self.k = len(self.choices) if k is None else k
+        self._size = perm(len(self.choices), self.k)
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._size))]
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("PermutationSpace index out of range")
+        # Unrank over positions of choices, skipping the ones already taken: O(k^2), independent of len(choices),
+        # so a lazy space (e.g. a ProductSpace) can be permuted without being materialized
+        taken = []
+        item = []
+        for position in range(self.k):
+            block = perm(len(self.choices) - 1 - position, self.k - 1 - position)
+            digit, index = divmod(index, block)
+            for used in sorted(taken):
+                if used <= digit:
+                    digit += 1
+            taken.append(digit)
+            item.append(self.choices[digit])
+        return tuple(item)
+
+    def __repr__(self):
+        return f"PermutationSpace(n={len(self.choices)}, k={self.k}, size={self._size})"
+
+
+class ProductSpace(Sequence):
+    """
+    The cartesian product of several choice lists, in the order of itertools.product(*choices).
+    Factors that are already sequences (including other spaces) are indexed in place, not copied.
+    """
+    def __init__(self, *choices, repeat: int = 1):
+        self.factors = [c if isinstance(c, Sequence) else list(c) for c in choices] * repeat
+        self._size = prod(len(f) for f in self.factors)
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._size))]
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("ProductSpace index out of range")
+        item = []
+        for factor in reversed(self.factors):
+            index, digit = divmod(index, len(factor))
+            item.append(factor[digit])
+        return tuple(reversed(item))
+
+    def __repr__(self):
+        return f"ProductSpace(factors={[len(f) for f in self.factors]}, size={self._size})"
+
+
+class ShuffledView(Sequence):
+    """
+    A space visited in a pseudo-random order: a uniform draw without replacement, produced lazily.
+
+    Position i maps to space[permute(i)], where permute is a keyed Feistel permutation of [0, len(space)),
+    so any element, prefix or shard is computed on demand. Iterating twice gives the same order.
+    """
+    ROUNDS = 4
+
+    def __init__(self, space: Sequence, key: int, transform: Callable[[Any], Any] = None):
+        self.space = space
+        self.key = key
+        self.transform = transform
+        self._size = len(space)
+        bits = max(2, (max(self._size - 1, 1)).bit_length())
+        bits += bits % 2
+        self._half_bits = bits // 2
+        self._half_mask = (1 << self._half_bits) - 1
+        self._round_keys = [_mix64(key ^ (r * 0x9E3779B97F4A7C15 & _MASK64)) for r in range(self.ROUNDS)]
+
+    def _feistel(self, x: int) -> int:
+        left, right = x >> self._half_bits, x & self._half_mask
+        for round_key in self._round_keys:
+            left, right = right, left ^ (_mix64(right ^ round_key) & self._half_mask)
+        return (left << self._half_bits) | right
+
+    def permute(self, position: int) -> int:
+        """
+        Index in the underlying space of the element at this position. Cycle-walks until the result is in range.
+        """
+        index = self._feistel(position)
+        while index >= self._size:
+            index = self._feistel(index)
+        return index
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(self._size))]
+        if position < 0:
+            position += self._size
+        if not 0 <= position < self._size:
+            raise IndexError("ShuffledView index out of range")
+        item = self.space[self.permute(position)]
+        return item if self.transform is None else self.transform(item)
+
+    def __iter__(self) -> Iterator:
+        for position in range(self._size):
+            yield self[position]
+
+    def shard(self, shard_id: int, num_shards: int) -> Iterator:
+        """
+        Lazily yield the elements of one shard. The shards are disjoint and together cover the whole view.
+        """
+        for position in range(shard_id, self._size, num_shards):
+            yield self[position]
+
+    def __repr__(self):
+        return f"ShuffledView({self.space!r}, key={self.key})"
+
+
+def sample_permutations(choices, k: int, rng=random, transform: Callable[[Any], Any] = None) -> ShuffledView:
+    """
+    Lazy replacement of `pairs = list(itertools.permutations(choices, k)); random.shuffle(pairs)`.
+    The order is drawn from rng, so seeding the global random module keeps runs reproducible.
+    """
+    return ShuffledView(PermutationSpace(choices, k), rng.getrandbits(64), transform)
+
+
+def sample_product(*choices, repeat: int = 1, rng=random, transform: Callable[[Any], Any] = None) -> ShuffledView:
+    """
+    Lazy replacement of `pairs = list(itertools.product(*choices)); random.shuffle(pairs)`.
+    """
+    return ShuffledView(ProductSpace(*choices, repeat=repeat), rng.getrandbits(64), transform)
+
@@ -0,0 +1,217 @@
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+from tdw.controller import Controller
+from tdw.librarian import MaterialLibrarian, ModelLibrarian, ModelRecord
+
+from interface import AVAILABLE_COLOR, ObjectType
+
+# Per-model templates of the commands that add an object, filled in for every instance.
+# Controller.get_add_physics_object() looks the model up in its library (a scan of every record), derives its
+# default physics values (another scan, of models_full.json) and builds the commands from the record, for every
+# object of every sample; TDWUtils.set_visual_material() looks the material up for every material slot of the model.
+# The CommandCompiler does that once per model and per variant of the commands (rotation or not, kinematic or
+# not...), and then only copies the template with the instance fields filled in: object id, position, rotation,
+# scale, physics values, color and material. The commands are the same as the TDW helpers', in the same order.
+#
+# commands.extend(COMPILER.add_object("prim_cone", object_id, position=position, library="models_special.json"))
+# commands.extend(COMPILER.object_commands(obj, gravity=False))       # add_object + material + texture + color
+# commands.extend(COMPILER.sample_commands(objects, gravity=False))   # every object of a sample
+
+# The object id and the instance values the templates are built with, replaced for every instance
+TEMPLATE_ID = 0
+_ORIGIN = {"x": 0, "y": 0, "z": 0}
+_SCALE_TYPES = ("scale_object_and_mass", "scale_object")
+
+
+class ModelTemplate:
+    def __init__(self, record: ModelRecord, library: str):
+        """
+        :param record: The record of the model.
+        :param library: The library of the record.
+        """
+        self.record = record
+        self.library = library
+        self.name = record.name
+        self.substructure_names = [sub_object["name"] for sub_object in record.substructure]
+        # (object_name, material_index) of every visual material slot
+        self.material_slots = [(sub_object["name"], i) for sub_object in record.substructure
+                               for i in range(len(sub_object["materials"]))]
+        # The add_object commands by variant, see CommandCompiler.add_object
+        self.variants: Dict[tuple, List[dict]] = {}
+
+
+class CommandCompiler:
+    def __init__(self, libraries: Sequence[str] = ("models_special.json", "models_core.json")):
+        """
+        :param libraries: The model libraries a model is looked up in, in order, when no library is given.
+        """
+        self.libraries = list(libraries)
+        self.templates: Dict[Tuple[str, str], ModelTemplate] = {}
+        self.materials: Dict[Tuple[str, str], dict] = {}
+        self.model_librarians: Dict[str, ModelLibrarian] = {}
+        self.material_librarians: Dict[str, MaterialLibrarian] = {}
+        self.lock = threading.Lock()
+
+    def _model_librarian(self, library: str) -> ModelLibrarian:
+        if library not in self.model_librarians:
+            if library not in Controller.MODEL_LIBRARIANS:
+                Controller.MODEL_LIBRARIANS[library] = ModelLibrarian(library)
+            self.model_librarians[library] = Controller.MODEL_LIBRARIANS[library]
+        return self.model_librarians[library]
+
+    def template(self, model_name: str, library: str = None) -> ModelTemplate:
+        """
+        The template of a model, built on the first call.
+
+        :param library: The library of the model. Default: the first of self.libraries that has it.
+        """
+        if library == "":
+            # As in Controller.get_add_physics_object()
+            library = "models_core.json"
+        key = (model_name, library)
+        template = self.templates.get(key)
+        if template is None:
+            with self.lock:
+                template = self.templates.get(key)
+                if template is None:
+                    for candidate in ([library] if library else self.libraries):
+                        record = self._model_librarian(candidate).get_record(model_name)
+                        if record is not None:
+                            template = ModelTemplate(record, candidate)
+                            break
+                    if template is None:
+                        raise ValueError(f"Model {model_name} not found in {[library] if library else self.libraries}")
+                    self.templates[key] = template
+        return template
+
+    def model_record(self, model_name: str, library: str = None) -> Tuple[str, ModelRecord]:
+        """
+        :return: The library of a model and its record.
+        """
+        template = self.template(model_name, library)
+        return template.library, template.record
+
+    def add_material(self, material: str, library: str = "materials_med.json") -> dict:
+        """
+        The add_material command of a material, built on the first call. The same dict is returned every time.
+        """
+        key = (material, library)
+        command = self.materials.get(key)
+        if command is None:
+            with self.lock:
+                if library not in self.material_librarians:
+                    if library not in Controller.MATERIAL_LIBRARIANS:
+                        Controller.MATERIAL_LIBRARIANS[library] = MaterialLibrarian(library)
+                    self.material_librarians[library] = Controller.MATERIAL_LIBRARIANS[library]
+                record = self.material_librarians[library].get_record(material)
+                if record is None:
+                    raise ValueError(f"Material {material} not found in {library}")
+                command = self.materials[key] = {"$type": "add_material", "name": material, "url": record.get_url()}
+        return command
+
+    def add_object(self, model_name: str, object_id: int, position: Dict[str, float] = None,
+                   rotation: Dict[str, float] = None, library: str = None, scale_factor: Dict[str, float] = None,
+                   kinematic: bool = False, gravity: bool = True, default_physics_values: bool = True,
+                   mass: float = 1, dynamic_friction: float = 0.3, static_friction: float = 0.3,
+                   bounciness: float = 0.7, scale_mass: bool = True) -> List[dict]:
+        """
+        The commands of Controller.get_add_physics_object(), with the same parameters.
+
+        :param library: The library of the model. Default: the first of self.libraries that has it.
+        """
+        template = self.template(model_name, library)
+        rotation_type = None if rotation is None else ("quaternion" if "w" in rotation else "euler")
+        variant = (rotation_type, kinematic, gravity, default_physics_values, scale_factor is None, scale_mass)
+        commands = template.variants.get(variant)
+        if commands is None:
+            rotation_placeholder = None if rotation is None else dict(rotation)
+            commands = Controller.get_add_physics_object(model_name=template.name, object_id=TEMPLATE_ID,
+                                                         position=_ORIGIN, rotation=rotation_placeholder,
+                                                         library=template.library,
+                                                         scale_factor=None if scale_factor is None else _ORIGIN,
+                                                         kinematic=kinematic, gravity=gravity,
+                                                         default_physics_values=default_physics_values,
+                                                         scale_mass=scale_mass)
+            template.variants[variant] = commands
+        if position is None:
+            position = {"x": 0, "y": 0, "z": 0}
+        filled = []
+        for command in commands:
+            command = dict(command)
+            command["id"] = object_id
+            command_type = command["$type"]
+            if command_type == "add_object":
+                command["position"] = position
+            elif command_type == "rotate_object_to":
+                command["rotation"] = rotation
+            elif command_type == "rotate_object_to_euler_angles":
+                command["euler_angles"] = rotation
+            elif command_type in _SCALE_TYPES:
+                command["scale_factor"] = scale_factor
+            elif "container_id" in command:
+                command["container_id"] = int(Controller.get_unique_id())
+            elif not default_physics_values:
+                if command_type == "set_mass":
+                    command["mass"] = mass
+                elif command_type == "set_physic_material":
+                    command["dynamic_friction"] = dynamic_friction
+                    command["static_friction"] = static_friction
+                    command["bounciness"] = bounciness
+            filled.append(command)
+        return filled
+
+    def set_visual_material(self, model_name: str, object_id: int, material: str, library: str = None,
+                            quality: str = "med") -> List[dict]:
+        """
+        The commands of TDWUtils.set_visual_material(): every material slot of the model set to one material.
+        """
+        add_material = self.add_material(material, library="materials_" + quality + ".json")
+        commands = []
+        for object_name, material_index in self.template(model_name, library).material_slots:
+            commands.extend([add_material,
+                             {"$type": "set_visual_material",
+                              "id": object_id,
+                              "material_name": material,
+                              "object_name": object_name,
+                              "material_index": material_index}])
+        return commands
+
+    def set_texture_scale(self, model_name: str, object_id: int, texture_scale: float,
+                          library: str = None) -> List[dict]:
+        """
+        A set_texture_scale command per substructure of the model.
+        """
+        return [{"$type": "set_texture_scale", "object_name": object_name, "id": object_id,
+                 "scale": {"x": texture_scale, "y": texture_scale}}
+                for object_name in self.template(model_name, library).substructure_names]
+
+    def object_commands(self, obj: ObjectType, **physics) -> List[dict]:
+        """
+        The commands that add an object with its material, texture scale and color, as
+        ObjectTask.generate_regular_object() sends them. obj.object_id must be set.
+
+        :param physics: The other parameters of add_object(), e.g. gravity=False, mass=2.
+        """
+        commands = self.add_object(obj.model_name, obj.object_id, position=obj.position, rotation=obj.rotation,
+                                   library=obj.library, scale_factor=obj.scale_factor, **physics)
+        if obj.material is not None:
+            commands.append(self.add_material(obj.material))
+            commands.extend(self.set_visual_material(obj.model_name, obj.object_id, obj.material, obj.library))
+        if obj.texture_scale != 1:
+            commands.extend(self.set_texture_scale(obj.model_name, obj.object_id, obj.texture_scale, obj.library))
+        commands.append({"$type": "set_color", "color": AVAILABLE_COLOR[obj.color_name], "id": obj.object_id})
+        return commands
+
+    def sample_commands(self, objects: Sequence[ObjectType], **physics) -> List[dict]:
+        """
+        The commands of every object of a sample, in one list.
+        """
+        commands = []
+        for obj in objects:
+            commands.extend(self.object_commands(obj, **physics))
+        return commands
+
+
+# Shared by the tasks and generators: the templates only depend on the libraries
+COMPILER = CommandCompiler()
@@ -18,6 +18,7 @@ from tdw.output_data import OutputData, AvatarKinematic
 
 from task_abstract import MoveObject
 from task_object import ObjectTask, ObjectType
+from combinatorics import PermutationSpace, sample_product
 import cv2
 import shutil
 import numpy as np
@@ -31,9 +32,18 @@ from tdw_object_utils import get_cameras, get_camera_views, numpy_to_python, get
 import itertools
 import random
 import yaml
+from render_cache import RenderCache, CACHE_DIR_NAME, sample_spec, spec_hash, spec_seed
+from index_writer import IndexWriter
+from scene_config import get_scene_settings
+from pipeline import DeferredImageCapture, SamplePipeline
+from scene_snapshot import SceneSnapshot
+from trajectory_replay import Trajectory, TrajectoryStore, TRAJECTORY_DIR_NAME
 
 MOVE_STEP = 12
+# Frame-skip mode: the physics steps rendered one by one after a collision is detected
+COLLISION_RENDER_STEPS = 3
 PIC_NUM = 4 # the number of pictures serving as the query
+GENERATOR_VERSION = 2 # bump when the rendering changes, to invalidate the render cache
         
 
 class ObjectInteractionTask(ObjectTask):
@@ -52,8 +62,18 @@ class ObjectInteractionTask(ObjectTask):
         super().__init__(output_path=output_path, port=port, 
                          display=display, scene=scene, 
                          screen_size=screen_size, physics=physics, 
-                         render_quality=render_quality, name=name, library=library, camera=camera)
+                         render_quality=render_quality, name=name, library=library, camera=camera,
+                         timings=kwargs.get("timings"))
         self.num_objects = 3
+        self.render_cache = RenderCache(os.path.join(self.output_path, CACHE_DIR_NAME), enabled=kwargs.get("render_cache", True))
+        self.pipeline_depth = kwargs.get("pipeline_depth", 1)
+        # Physics steps per round trip, >1 for the frame-skip mode (see simulate), and the physics steps
+        # between two rendered keyframes in that mode (None: only the first and the last frame)
+        self.frame_skip = kwargs.get("frame_skip", 1)
+        self.keyframe_interval = kwargs.get("keyframe_interval")
+        # The simulated trajectories, replayed for the settings that only differ in colors, materials or textures
+        self.trajectories = TrajectoryStore(os.path.join(self.output_path, TRAJECTORY_DIR_NAME), enabled=kwargs.get("replay", True))
+        self.trajectory = None
         self.attr_generate_func = {
             "color": self.generate_color_pair,
             "shape": self.generate_attr_pair,
@@ -65,11 +85,12 @@ class ObjectInteractionTask(ObjectTask):
     def set_scene_get_camera_config(self, background):
         self.scene = background
         self.c.communicate(self.c.get_add_scene(self.scene))
-        with open('/data/shared/sim/benchmark/benchmark_TDW/scene_settings.yaml', 'r') as file:
-            config = yaml.safe_load(file)[self.scene]['camera']
-            return config
+        return get_scene_settings(self.scene).camera_config()
         
-    def add_managers(self, output_pth):
+    def add_managers(self, output_pth, deferred=False, physics=True):
+        """
+        :param physics: If False (replay), only the cameras: no collisions nor transforms are sent.
+        """
         
         ### Lightning
         # interior_lighting = InteriorSceneLighting()
@@ -78,19 +99,26 @@ class ObjectInteractionTask(ObjectTask):
             
         ### Cameras
         self.camera = ["top_front"] 
-        add_cameras(self.c, self.camera, output_pth, self.scene)
+        self.capture = add_cameras(self.c, self.camera, output_pth, self.scene, deferred=deferred, 
+                                   on_demand=deferred and self.frame_skip > 1)
         self.image_ticks = 0
+        # The physics step of every image, and the physics steps at which collisions were detected
+        self.physics_steps = 0
+        self.frame_steps = []
+        self.collision_steps = []
+        self.collison_frames = []
         #print("Cameras added!")
+        if not physics:
+            return
         
             
         ### Collison Manager
         self.collision_manager = CollisionManager(enter=True, stay=False, exit=False, objects=True, environment=True)
         self.c.add_ons.append(self.collision_manager)
-        self.collison_frames = []
         
         
         #Object manager.
-        self.object_manager = ObjectManager(transforms=False, rigidbodies=True)
+        self.object_manager = ObjectManager(transforms=True, rigidbodies=True)
         self.c.add_ons.append(self.object_manager)
     
     def generate_color_pair(self, choices=SELECTED_COLORS):
@@ -98,7 +126,7 @@ class ObjectInteractionTask(ObjectTask):
         for color in choices.keys():
             #this is iterating the color used for the fixed object
             other_colors = [c for c in SELECTED_COLORS.keys() if c != color]
-            other_color_pairs = random.choice(list(itertools.permutations(other_colors, self.num_objects - 1)))
+            other_color_pairs = random.choice(PermutationSpace(other_colors, self.num_objects - 1))
             
             color_pair = list(other_color_pairs) + [color]
             color_pairs.append(color_pair)
@@ -106,11 +134,8 @@ class ObjectInteractionTask(ObjectTask):
         return color_pairs
     
     def generate_size_pair(self, choices=SELECTED_SIZES):
-        size_pairs = list(itertools.product(choices, repeat=self.num_objects-1))
         #Replicate the size for the first two moving objects
-        size_pairs = [[s[0]] + list(s) for s in size_pairs]
-        random.shuffle(size_pairs)
-        return size_pairs
+        return sample_product(choices, repeat=self.num_objects-1, transform=lambda s: [s[0]] + list(s))
     
     def transport_object(self, object_id, direction, magnitude):
         movement = {k: v * magnitude for k, v in direction.items()}
@@ -142,6 +167,77 @@ class ObjectInteractionTask(ObjectTask):
                             "value": True})
         self.step()
         
+    def step_frames(self, frames=1, render=True):
+        """
+        One round trip that advances the physics by frames steps. Images are captured on every round trip, unless
+        the capture is on demand (frame-skip mode): then only if render is True.
+        """
+        if frames > 1:
+            self.commands.append({"$type": "step_physics", "frames": frames - 1})
+        if render and getattr(self.capture, "on_demand", False):
+            self.capture.request()
+        resp = self.step()
+        self.physics_steps += frames
+        if render or not getattr(self.capture, "on_demand", False):
+            self.frame_steps.append(self.physics_steps)
+            if self.trajectory is not None:
+                self.trajectory.record(self.object_manager, self.object_ids)
+        return resp
+    
+    def simulate(self, objects, physic_type, stop_at_collision=False, render_until=0):
+        """
+        Step the physics until the end of the cell, MOVE_STEP steps after the objects were added (sequence_end).
+        By default every step is a round trip and is rendered. In frame-skip mode (frame_skip > 1) the steps go in
+        round trips of frame_skip steps, without rendering them except: the keyframes (every keyframe_interval steps
+        and the last step), and the COLLISION_RENDER_STEPS steps after a collision, which are rendered one by one.
+        The collisions and the rigidbodies of the skipped steps are sent at the end of their round trip: the
+        collision steps are known to frame_skip steps.
+        
+        :param physic_type: What happens at a collision, see branch().
+        :param stop_at_collision: Return at the first collision, once it is recorded but before branch().
+        :param render_until: Render every step until this physics step (frame-skip mode).
+        :return: True if stopped at a collision.
+        """
+        while self.physics_steps < self.sequence_end:
+            if self.frame_skip == 1 or self.physics_steps < render_until:
+                frames, render = 1, True
+            else:
+                frames = min(self.frame_skip, self.sequence_end - self.physics_steps)
+                if self.keyframe_interval:
+                    # Stop at the next keyframe
+                    done = self.physics_steps - (self.sequence_end - MOVE_STEP)
+                    frames = min(frames, self.keyframe_interval - done % self.keyframe_interval)
+                    render = (done + frames) % self.keyframe_interval == 0
+                else:
+                    render = False
+                render = render or self.physics_steps + frames == self.sequence_end
+            self.step_frames(frames, render)
+            if(len(self.collision_manager.obj_collisions) > 0):
+                self.collision_steps.append(self.physics_steps)
+                # The image of this step, or else the next one
+                self.collison_frames.append(len(self.frame_steps) - 1 if render else len(self.frame_steps))
+                if stop_at_collision:
+                    return True
+                if self.branch(objects, physic_type):
+                    break
+                render_until = self.physics_steps + COLLISION_RENDER_STEPS
+        return False
+    
+    def branch(self, objects, physic_type):
+        """
+        What a physic type does at a collision. Returns True if the cell ends there.
+        """
+        # if(physic_type == "non_physics"):
+        #     self.render_non_physics_move(object_ids[:-1], self.object_manager, move_steps=3)
+        #     return True
+        if(physic_type == "countefactual_pulse_1"):
+            self.add_pulse_render(objects, move_steps=3, z=15)
+            return True
+        elif(physic_type == "countefactual_pulse_2"):
+            self.add_pulse_render(objects, move_steps=3, z=-15)
+            return True
+        return False
+    
     def apply_force_scale(self, forces, force_scale):
         forces = [{"x": f["x"]*force_scale, "y": f["y"]*force_scale, "z": f["z"]*force_scale} for f in forces]
         return forces
@@ -163,23 +259,70 @@ class ObjectInteractionTask(ObjectTask):
         self.commands.append({"$type": "set_velocity",
                             "id": objects[-1].object_id,
                             "velocity": {"x": 5, "y":0, "z": 0}})
-        self.step()
+        self.step_frames()
 
         self.commands.append({"$type": "set_velocity",
                             "id": objects[-1].object_id,
                             "velocity": {"x": 15, "y":0, "z": z}})
         for i in range(move_steps):
-            self.step()
+            self.step_frames()
 
         # self.commands.append({"$type": "apply_force_to_object",
         #                     "id": objects[-1].object_id,
         #                     "force": {"x": 0, "y":0.0001, "z": 0.00010}})
         
         # self.step()
+    
+    def add_objects(self, planned_objects, size_pair):
+        objects = []
+        for planned, size in zip(planned_objects, size_pair):
+            object_info = self.generate_regular_object(planned.model_name, position=planned.position, scale=size, color=planned.color_name, rotation=planned.rotation, 
+                                                    material=planned.material, texture_scale=planned.texture_scale, mass=16*size**3, bounciness=1)
+            objects.append(object_info)
+        self.object_ids = [obj.object_id for obj in objects]
+        return objects
+    
+    def replay(self, planned_objects, size_pair, trajectories, output_pths):
+        """
+        Render recorded trajectories with other visuals: physics is paused and the objects are teleported to their
+        recorded pose on every frame. Like the simulation, the frames that the trajectories share (before the physic
+        types branch) are rendered once. Returns the objects and the images of each trajectory.
+        """
+        shared = 0
+        while all(shared < len(trajectory) and trajectory.frames[shared] == trajectories[0].frames[shared] for trajectory in trajectories):
+            shared += 1
+        
+        self.add_managers(output_pths[0], deferred=True, physics=False)
+        objects = self.add_objects(planned_objects, size_pair)
+        self.commands.append({"$type": "simulate_physics", "value": False})
+        for frame in range(shared):
+            self.commands.extend(trajectories[0].replay_commands(frame, self.object_ids))
+            self.step_frames()
+        prefix_images = self.capture.pop_pending()
+        prefix_frame = self.capture.frame
+        
+        images = []
+        for trajectory, output_pth in zip(trajectories, output_pths):
+            self.capture.frame = prefix_frame
+            for frame in range(shared, len(trajectory)):
+                self.commands.extend(trajectory.replay_commands(frame, self.object_ids))
+                self.step_frames()
+            images.append(self.move_images(prefix_images + self.capture.pop_pending(), output_pth))
+        self.reset_scene(self.object_ids)
+        # Sent with the first round trip of the next sample
+        self.commands.append({"$type": "simulate_physics", "value": True})
+        return objects, images
+    
+    def move_images(self, images, output_pth):
+        """
+        Images popped from the capture, moved from the directory they were captured into to output_pth.
+        """
+        return [(os.path.join(output_pth, os.path.relpath(directory, str(self.capture.path))), filename, frame)
+                for directory, filename, frame in images]
         
 
     def trial(self, background, colors, shapes, materials, textures, sizes, force_scales, physic_types,
-              trial_id=0, index_name="index.jsonl", flush=True):
+              trial_id=0, index_writer=None, flush=True):
         
         ### Set the scene
         #print("start setting scene")
@@ -193,77 +336,132 @@ class ObjectInteractionTask(ObjectTask):
         #### Object position
         positions = [{"x": -1, "y": 0.05, "z": 1}, {"x": -1, "y": 0.05, "z": -1}, {"x": 0, "y": 0.05, "z": 0}]
         positions = self.adapt_center_position(positions, scene_center)
+        output_dir = os.path.join(self.output_path, self.name)
         
-        scene_id = 0
-        scene_setting_id = 0
-        for color_pair in colors:
-            for shape_pair in shapes:
-                for material_pair in materials:
-                    for texture_pair in textures:
-                        for size_pair in sizes:
-                            for force_scale in force_scales:
-                                scene_setting_id += 1
-                                for physic_type in physic_types: #
-                                    
-                                    np.random.seed(trial_id*10000 + scene_id)
-                                    random.seed(trial_id*10000 + scene_id)
-                                    
-                                    output_dir = os.path.join(self.output_path, self.name)
-                                    output_pth = os.path.join(output_dir, "images", f"{background}-scene_{scene_id:04d}-{force_scale}-{physic_type}")
-                                    if os.path.exists(output_pth) and flush:
-                                        shutil.rmtree(output_pth)
-                                    
-                                    self.add_managers(output_pth)
-                                    
-                                    objects = []
-                                    
-                                    for i, (color, shape, size, material, texture_scale) in enumerate(zip(color_pair, shape_pair, size_pair, material_pair, texture_pair)):
-                                        
-                                        positions_cyl = [{"x": -1, "y": 0.05+size/2, "z": 1}, {"x": -1, "y": 0.05+size/2, "z": -1}, {"x": 0, "y": 0.05+size/2, "z": 0}]
-                                        positions_cyl = self.adapt_center_position(positions_cyl, scene_center)
-                                        object_info = self.generate_regular_object(shape, position=positions_cyl[i] if shape == 'prim_cyl' else positions[i], scale=size, color=color, rotation={"x": 0, "y": np.random.uniform(-90, 90), "z": 0}, 
-                                                                                material=material, texture_scale=texture_scale, mass=16*size**3, bounciness=1)
-                                        objects.append(object_info)
-                                    object_ids = [obj.object_id for obj in objects]
-
-
-                                    
-                                    #print("Objects generated!")
-                                    self.step()
-                                    
-                                    #Currently hardcoded the forces
-                                    self.apply_force(objects, force_scale)
-                                        
-                                        
-                                        
-                                    for i in range(MOVE_STEP):
-                                        
-                                        resp = self.step()
-                                        if(len(self.collision_manager.obj_collisions) > 0): 
-                                            self.collison_frames.append(self.image_ticks-1)
-                                            
-                                            # if(physic_type == "non_physics"):
-                                            #     self.render_non_physics_move(object_ids[:-1], self.object_manager, move_steps=3)
-                                            #     break
-                                            if(physic_type == "countefactual_pulse_1"):
-                                                self.add_pulse_render(objects, move_steps=3, z=15)
-                                                break
-                                            elif(physic_type == "countefactual_pulse_2"):
-                                                self.add_pulse_render(objects, move_steps=3, z=-15)
-                                                break
-                                        
-                                    with open(os.path.join(output_dir, index_name), "a") as f:
-                                        output_dict = {"source_dir": output_pth, "scene_id": scene_id, "setting_id": f"{background}-{scene_setting_id}", "background": self.scene, 
-                                                       "force_scale": force_scale, "physic_type": physic_type, "collison_frames": self.collison_frames,
-                                                    "objects": [obj.get_attributes() for obj in objects], 
-                                                    }
-                                        json.dump(output_dict, f)
-                                        f.write("\n")
-                            
-
-                                    scene_id += 1
-                                    pbar.update(1)
-                                    self.reset_scene([obj_info.object_id for obj_info in objects])
+        ### Every setting is planned, rendered and persisted by a SamplePipeline, so the build renders a setting while the
+        ### next one is planned and the images of the previous one are written. A setting is a cell per physic type
+        def plan(item):
+            setting_index, (scene_setting_id, (color_pair, shape_pair, material_pair, texture_pair, size_pair, force_scale)) = item
+            
+            ### Seed from the content of the setting rather than its position, so that unchanged settings draw the same rotations
+            ### (and hit the render cache) when another factor changes. The physic types share the objects, see render_setting,
+            ### and the settings that only differ in colors, materials or textures share their motion, see replay
+            rng = np.random.RandomState(spec_seed([trial_id, background, shape_pair, size_pair, force_scale]))
+            
+            planned_objects = []
+            for i, (color, shape, size, material, texture_scale) in enumerate(zip(color_pair, shape_pair, size_pair, material_pair, texture_pair)):
+                
+                positions_cyl = [{"x": -1, "y": 0.05+size/2, "z": 1}, {"x": -1, "y": 0.05+size/2, "z": -1}, {"x": 0, "y": 0.05+size/2, "z": 0}]
+                positions_cyl = self.adapt_center_position(positions_cyl, scene_center)
+                planned_objects.append(ObjectType(model_name=shape, position=positions_cyl[i] if shape == 'prim_cyl' else positions[i], 
+                                                  rotation={"x": 0, "y": rng.uniform(-90, 90), "z": 0}, scale_factor=size, color=color, 
+                                                  material=material, texture_scale=texture_scale))
+            ### The frame-skip mode renders other frames, the default mode keeps the specs (and the cache) of earlier runs
+            frame_skip = {"frame_skip": self.frame_skip, "keyframe_interval": self.keyframe_interval} if self.frame_skip > 1 else {}
+            
+            cells = []
+            for j, physic_type in enumerate(physic_types):
+                scene_id = setting_index * len(physic_types) + j
+                output_pth = os.path.join(output_dir, "images", f"{background}-scene_{scene_id:04d}-{force_scale}-{physic_type}")
+                spec = sample_spec(self.name, GENERATOR_VERSION, self.scene, planned_objects, {"top_front": camera_config.get("top_front")}, 
+                                   self.screen_size, self.render_quality, force_scale=force_scale, physic_type=physic_type, move_step=MOVE_STEP, 
+                                   **frame_skip)
+                cache_key = spec_hash(spec)
+                ### What drives the physics of the cell: the key of its trajectory
+                trajectory_key = spec_hash({"generator": self.name, "version": GENERATOR_VERSION, "scene": self.scene, 
+                                            "objects": [{"model_name": obj.model_name, "position": obj.position, "rotation": obj.rotation, "scale_factor": obj.scale_factor} 
+                                                        for obj in planned_objects], 
+                                            "force_scale": force_scale, "physic_type": physic_type, "move_step": MOVE_STEP, **frame_skip})
+                cached = self.render_cache.fetch(cache_key, output_pth)
+                cells.append({"scene_id": scene_id, "physic_type": physic_type, "output_pth": output_pth, "spec": spec, "cache_key": cache_key, 
+                              "trajectory_key": trajectory_key, "meta": cached["meta"] if cached is not None else None})
+            return {"scene_setting_id": scene_setting_id, "force_scale": force_scale, "planned_objects": planned_objects, "size_pair": size_pair, 
+                    "cells": cells, "objects": None}
+        
+        def render(sample):
+            if all(cell["meta"] is not None for cell in sample["cells"]):
+                return sample
+            ### A setting whose build dies is rendered again on a new build, or skipped (see supervised_controller.py)
+            self.c.run_sample(f"{background}-{sample['scene_setting_id']}", render_setting, sample)
+            return sample
+        
+        def render_setting(sample):
+            self.timings.set_sample(f"{background}-{sample['scene_setting_id']}")
+            cells = [cell for cell in sample["cells"] if cell["meta"] is None]
+            
+            ### A motion simulated before, with other colors, materials or textures, is replayed instead of simulated
+            self.trajectory = None
+            trajectories = [self.trajectories.fetch(cell["trajectory_key"]) for cell in cells]
+            if all(trajectory is not None for trajectory in trajectories):
+                sample["objects"], images = self.replay(sample["planned_objects"], sample["size_pair"], trajectories, 
+                                                        [cell["output_pth"] for cell in cells])
+                for cell, trajectory, cell_images in zip(cells, trajectories, images):
+                    cell.update(meta=trajectory.meta, images=cell_images)
+                return sample
+            
+            self.add_managers(cells[0]["output_pth"], deferred=True)
+            objects = self.add_objects(sample["planned_objects"], sample["size_pair"])
+            object_ids = self.object_ids
+            self.trajectory = Trajectory()
+            
+            #print("Objects generated!")
+            self.step_frames()
+            self.sequence_end = self.physics_steps + MOVE_STEP
+            
+            #Currently hardcoded the forces
+            self.apply_force(objects, sample["force_scale"])
+            
+            ### The physic types only differ from the first collision on: the frames before it are simulated and rendered
+            ### once, then every physic type branches from a snapshot of the objects at the collision
+            collided = self.simulate(objects, None, stop_at_collision=True)
+            prefix_images = self.capture.pop_pending()
+            snapshot = SceneSnapshot.take(self.object_manager, object_ids) if collided else None
+            prefix = (self.physics_steps, self.image_ticks, self.capture.frame, list(self.frame_steps), list(self.collision_steps), list(self.collison_frames))
+            prefix_frames = len(self.trajectory)
+            
+            for n, cell in enumerate(cells):
+                if n > 0 and collided:
+                    self.commands.extend(snapshot.restore_commands())
+                    self.physics_steps, self.image_ticks, self.capture.frame = prefix[:3]
+                    self.frame_steps, self.collision_steps, self.collison_frames = (list(steps) for steps in prefix[3:])
+                    self.trajectory.truncate(prefix_frames)
+                if collided and not self.branch(objects, cell["physic_type"]):
+                    self.simulate(objects, cell["physic_type"], render_until=self.physics_steps + COLLISION_RENDER_STEPS)
+                
+                meta = {"collison_frames": list(self.collison_frames)}
+                if self.frame_skip > 1:
+                    meta.update(frame_steps=list(self.frame_steps), collision_steps=list(self.collision_steps))
+                ### The images were captured into the directory of the first cell
+                cell.update(meta=meta, images=self.move_images(prefix_images + self.capture.pop_pending(), cell["output_pth"]))
+                self.trajectories.store(cell["trajectory_key"], self.trajectory.copy(meta))
+            self.trajectory = None
+            sample["objects"] = objects
+            self.reset_scene(object_ids)
+            return sample
+        
+        def persist(sample):
+            for cell in sample["cells"]:
+                if "images" in cell:
+                    if os.path.exists(cell["output_pth"]) and flush:
+                        shutil.rmtree(cell["output_pth"])
+                    DeferredImageCapture.save_images(cell.pop("images"))
+                    self.render_cache.store(cell["cache_key"], cell["output_pth"], cell["spec"], meta=cell["meta"])
+            return sample
+        
+        def commit(sample):
+            objects = sample["objects"] or sample["planned_objects"]
+            for cell in sample["cells"]:
+                if(index_writer is not None and cell["meta"] is not None):
+                    output_dict = {"source_dir": cell["output_pth"], "scene_id": cell["scene_id"], "setting_id": f"{background}-{sample['scene_setting_id']}", "background": self.scene, 
+                                   "force_scale": sample["force_scale"], "physic_type": cell["physic_type"], **cell["meta"],
+                                "objects": [obj.get_attributes() for obj in objects], 
+                                }
+                    index_writer.write(output_dict)
+                pbar.update(1)
+        
+        settings = enumerate(enumerate(itertools.product(colors, shapes, materials, textures, sizes, force_scales), start=1))
+        stats = SamplePipeline(plan, render, persist, commit, depth=self.pipeline_depth).run(settings)
+        print(f"{background}: {stats['samples']} settings in {stats['wall_s']:.1f}s, build idle {stats['render_idle_s']:.1f}s")
                             
                             
                             
@@ -300,13 +498,12 @@ class ObjectInteractionTask(ObjectTask):
         if(not os.path.exists(output_dir)):
             os.makedirs(output_dir, exist_ok=True)
         
-        with open(os.path.join(output_dir, f"{self.name}_index.jsonl"), "w") as f:
-            pass
+        index_writer = IndexWriter(os.path.join(output_dir, f"{self.name}_index.jsonl"))
 
-        backgrounds = SELECTED_SCENES
-        backgrounds.remove("ruin")
+        # Without mutating the shared list, which may not hold "ruin"
+        backgrounds = [scene for scene in SELECTED_SCENES if scene != "ruin"]
         
-        for background in tqdm(SELECTED_SCENES):
+        for background in tqdm(backgrounds):
             
             print(color_pairs)
             print(shape_pairs)
@@ -317,16 +514,19 @@ class ObjectInteractionTask(ObjectTask):
             
             self.trial(background, color_pairs, shape_pairs, material_pairs, texture_pairs, size_pairs, 
                         force_scales, physic_types,
-                        index_name=f"{self.name}_index.jsonl", flush=flush)
+                        index_writer=index_writer, flush=flush)
             count += len(color_pairs) * len(shape_pairs) * len(material_pairs) * len(texture_pairs) * len(size_pairs) \
                     * len(force_scales)
             
             break
         
+        index_writer.close()
+        
         print(f"Total number of trials: {count}") 
            
             
         self.c.communicate({"$type": "terminate"})
+        self.write_timings()
     
     def run(self, task_name:str = "two_spheres", flush: bool = True):
         if(task_name == "two_spheres"):
@@ -386,6 +386,9 @@
 
 from utils import *
 from consts import COLORS
+from run_journal import RunJournal
+from index_writer import IndexWriter
+from instrumentation import RoundTripRecorder
 from tdw.controller import Controller
 from tdw.tdw_utils import TDWUtils
 from tdw.add_ons.third_person_camera import ThirdPersonCamera
@@ -534,6 +537,8 @@ def main(args):
     try:
         # Launch TDW Build
         c = Controller(port=1075, launch_build=False)
+        timings = RoundTripRecorder(enabled=args.timings is not None)
+        timings.attach(c)
 
         output_path = args.output_path
         os.makedirs(output_path, exist_ok=True) 
@@ -564,8 +569,8 @@ def main(args):
         # Define Size
         size = 0.25
 
-        # Initialize image info
-        images_info = []
+        # Stream image info to disk, it is converted to direction.json at the end
+        images_info = IndexWriter(os.path.join(output_path, "direction.jsonl"), append=args.resume)
 
         # Number of data per scene
         num_data = 20
@@ -577,7 +582,11 @@ def main(args):
         # collision_manager = CollisionManager(enter=True, exit=True, stay=True)
         # c.add_ons.append(collision_manager)
 
-        count = 0
+        journal = RunJournal(os.path.join(output_path, "direction.journal"), resume=args.resume)
+        journal.replay(images_info)
+        # Samples without a reachable destination are not recorded, so count the attempts separately
+        count = len(images_info)
+        sample_id = 0
 
         for scene in tqdm(scenes, desc="Processing scenes"):
             if scene == "box_room_2018":
@@ -590,6 +599,11 @@ def main(args):
                 for n in tqdm(num_obj, leave=False):
                     for material in tqdm(object_materials, leave=False):
                         for _ in tqdm(range(num_data), leave=False):
+                            sample_id += 1
+                            # generate_objects draws from the previous sample's objects
+                            if journal.skip(sample_id - 1, state={"objects": objects}):
+                                continue
+                            timings.set_sample(sample_id - 1)
                             image_info = {}
                             positions = []
                             objects_info = []
@@ -737,25 +751,28 @@ def main(args):
                             answer_index = next(i for i, element in enumerate(selections) if answer in element)
                             image_info["answer"] = answer_index
 
-                            images_info.append(copy.deepcopy(image_info))
+                            images_info.write(image_info)
+                            journal.commit(sample_id - 1, images_info)
                             count += 1
 
                             # Reset for the next loop
                             c.add_ons.clear() 
                             c.communicate({"$type": "destroy_all_objects"})
                             c.communicate(TDWUtils.create_empty_room(12, 12))
-        
+        journal.close()
+
     finally:
         # Save object info to JSON
         output_path = args.output_path
-        with open(os.path.join(output_path, "direction.json"), 'w') as f:
-            json.dump(images_info, f, indent=4)
+        images_info.finalize(os.path.join(output_path, "direction.json"))
+        images_info.close()
 
         l = len(images_info)
         print(f"{l} scenarios generated.")
 
         # Terminate the server after the job is done
         c.communicate({"$type": "terminate"})
+        timings.write(args.timings)
         server_process.terminate()
         server_process.wait()
 
@@ -768,6 +785,9 @@ if __name__ == "__main__":
     parser.add_argument("--output_path", type=str, required=True, help="The path to save the outputs to.")
     # Render Quality
     parser.add_argument("--render_quality", type=int, default=5, help="The Render Quality of the output.")
+    # Resume
+    parser.add_argument("--resume", action="store_true", help="Continue an interrupted run from its journal instead of starting over.")
+    parser.add_argument("--timings", type=str, default=None, help="Write the round trip timings of the run to this JSON file.")
 
     args = parser.parse_args()
 
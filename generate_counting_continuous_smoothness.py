@@ -8,13 +8,17 @@ from tdw.tdw_utils import TDWUtils
 from tdw.add_ons.third_person_camera import ThirdPersonCamera
 from tdw.add_ons.image_capture import ImageCapture
 from tdw.add_ons.collision_manager import CollisionManager
-from tdw.librarian import ModelLibrarian
 from tdw.librarian import MaterialLibrarian
+from command_compiler import COMPILER
 import shutil
 import itertools
 from tdw.output_data import Raycast
 import copy
 from tdw.add_ons.interior_scene_lighting import InteriorSceneLighting
+from run_journal import RunJournal
+from index_writer import IndexWriter
+from instrumentation import RoundTripRecorder
+from scene_geometry import SceneGeometry
 
 # Initiate a tdw server:
 # sudo nohup Xorg :4 -config /etc/X11/xorg.conf
@@ -71,6 +75,9 @@ def main(args):
     os.makedirs(output_path, exist_ok=True) 
 
     c = Controller(launch_build=False, port=1071)
+    scene_geometry = SceneGeometry()
+    timings = RoundTripRecorder(enabled=args.timings is not None)
+    timings.attach(c)
 
     # Add interior lighting
     interior_lighting = InteriorSceneLighting()
@@ -86,8 +93,8 @@ def main(args):
     # Define scenes
     scenes = ["tdw_room", "monkey_physics_room", "box_room_2018"]
 
-    # Define  tables
-    tables = {"marble_table": 0.5, "trapezoidal_table": 0.6, "small_table_green_marble": 1.4}
+    # The table tops, measured once (see scene_geometry.py). Objects are dropped from 5 cm above them
+    tables = {table: scene_geometry.top(c, table, scale=1.5) + 0.05 for table in ["marble_table", "trapezoidal_table", "small_table_green_marble"]}
 
     # Define colors
     object_colors = {
@@ -109,10 +116,8 @@ def main(args):
 
     material_tuples = list(itertools.permutations(object_materials, 2))
 
-    # Initialize image info
-    images_info = {}
-    images_info["shape_section"] = []    
-    images_info["color_section"] = []
+    # Stream image info to disk, it is converted to continuous_quantity_smoothness.json at the end
+    images_info = IndexWriter(os.path.join(output_path, "continuous_quantity_smoothness.jsonl"), sections=["shape_section", "color_section"], append=args.resume)
 
     image_id = 0
 
@@ -120,12 +125,23 @@ def main(args):
     collision_manager = CollisionManager(enter=True, exit=True, stay=True)
     c.add_ons.append(collision_manager)
 
+    journal = RunJournal(os.path.join(output_path, "continuous_quantity_smoothness.journal"), resume=args.resume)
+    journal.replay(images_info)
+    if journal.next_index > 0:
+        # Completed samples end with c.add_ons.clear(): resume with the same add-ons
+        c.add_ons.clear()
+
     for scene in tqdm(scenes, desc="Processing scenes"):
         interior_lighting.reset(hdri_skybox="old_apartments_walkway_4k", aperture=8, focus_distance=2.5, ambient_occlusion_intensity=0.125, ambient_occlusion_thickness_modifier=3.5, shadow_strength=1)
         for color_tuple in tqdm(color_tuples, desc="Processing colors", leave=False):
             for material_tuple in tqdm(material_tuples, desc="Processing materials", leave=False):
                 for table, table_height in tqdm(tables.items(), desc="Processing tables", leave=False):
                     for shape_tuple in tqdm(shape_tuples, desc="Processing shapes", leave=False):
+                        if journal.skip(image_id, state={"camera_positions": camera_positions}):
+                            image_id += 1
+                            continue
+
+                        timings.set_sample(image_id)
                         # General rendering configurations
                         commands = [{"$type": "set_screen_size", "width": args.screen_size[0], "height": args.screen_size[1]},
                                     {"$type": "set_render_quality", "render_quality": args.render_quality}]
@@ -166,7 +182,6 @@ def main(args):
 
                         for object_name in tqdm(shape_tuple, desc="Processing objects", leave=False):
                             lib = "models_special.json"
-                            model_record = ModelLibrarian(lib).get_record(object_name)
 
                             # obj_num = obj_num_1 if obj_type == 0 else obj_num_2
                             material = material_tuple[0] if obj_type == 0 else material_tuple[1]
@@ -195,15 +210,15 @@ def main(args):
                             scale = round(scale, 2)
 
                             # Place object with physics and check for collisions
-                            commands.extend(c.get_add_physics_object(model_name=object_name,
-                                                                library=lib,
-                                                                position=position,
-                                                                default_physics_values=False,
-                                                                scale_factor={"x": scale, "y": scale, "z": scale},
-                                                                object_id=object_id))
+                            commands.extend(COMPILER.add_object(model_name=object_name,
+                                                           library=lib,
+                                                           position=position,
+                                                           default_physics_values=False,
+                                                           scale_factor={"x": scale, "y": scale, "z": scale},
+                                                           object_id=object_id))
                             
                             # Set the object's material
-                            commands.extend(TDWUtils.set_visual_material(c=c, substructure=model_record.substructure, material=material, object_id=object_id))
+                            commands.extend(COMPILER.set_visual_material(model_name=object_name, library=lib, material=material, object_id=object_id))
                             commands.append({
                                 "$type": "set_color",
                                 "id": object_id,
@@ -251,37 +266,40 @@ def main(args):
                             image_info["objects_info"] = objects_info
                             image_info["table"] = table
 
-                            images_info["shape_section"].append(copy.deepcopy(image_info))
-                            images_info["color_section"].append(copy.deepcopy(image_info))
+                            shape_record = dict(image_info)
+                            color_record = dict(image_info)
                             # images_info["material_section"].append(copy.deepcopy(image_info))
 
                             object_shape_1 = objects_info[0]["type"].split("_")[1]
                             object_shape_1 = "cylinder" if object_shape_1 == "cyl" else object_shape_1
                             object_shape_2 = objects_info[1]["type"].split("_")[1]
                             object_shape_2 = "cylinder" if object_shape_2 == "cyl" else object_shape_2
-                            images_info["shape_section"][-1]["question"] = f"Which object has a smoother surface in the image, the {object_shape_1} or the {object_shape_2}? Answer with the letter of your choice: A. {object_shape_1} B. {object_shape_2} C. The same"
+                            shape_record["question"] = f"Which object has a smoother surface in the image, the {object_shape_1} or the {object_shape_2}? Answer with the letter of your choice: A. {object_shape_1} B. {object_shape_2} C. The same"
                             if object_materials.index(objects_info[0]["material"]) < object_materials.index(objects_info[1]["material"]):
-                                images_info["shape_section"][-1]["gt_answer"] = "A"
+                                shape_record["gt_answer"] = "A"
                             elif object_materials.index(objects_info[0]["material"]) > object_materials.index(objects_info[1]["material"]):
-                                images_info["shape_section"][-1]["gt_answer"] = "B"
+                                shape_record["gt_answer"] = "B"
                             else:
-                                images_info["shape_section"][-1]["gt_answer"] = "C"
+                                shape_record["gt_answer"] = "C"
 
                             object_color_1 = objects_info[0]["color"]
                             object_color_2 = objects_info[1]["color"]                    
-                            images_info["color_section"][-1]["question"] = f"Which object has a smoother surface in the image, the {object_color_1} one or the {object_color_2} one? Answer with the letter of your choice: A. {object_color_1} B. {object_color_2} C. The same"
+                            color_record["question"] = f"Which object has a smoother surface in the image, the {object_color_1} one or the {object_color_2} one? Answer with the letter of your choice: A. {object_color_1} B. {object_color_2} C. The same"
                             if object_materials.index(objects_info[0]["material"]) < object_materials.index(objects_info[1]["material"]):
-                                images_info["color_section"][-1]["gt_answer"] = "A"
+                                color_record["gt_answer"] = "A"
                             elif object_materials.index(objects_info[0]["material"]) > object_materials.index(objects_info[1]["material"]):
-                                images_info["color_section"][-1]["gt_answer"] = "B"
+                                color_record["gt_answer"] = "B"
                             else:
-                                images_info["color_section"][-1]["gt_answer"] = "C"      
+                                color_record["gt_answer"] = "C"      
 
                             # object_material_1 = objects_info[0]["material"].split("_")[0]
                             # object_material_2 = objects_info[1]["material"].split("_")[0]
                             # images_info["material_section"][-1]["question"] = f"Which material has more objects in the image, {object_material_1} or {object_material_2}? Answer with the letter of your choice: A. {object_material_1} B. {object_material_2}"
                             # images_info["material_section"][-1]["gt_answer"] = "A" if object_materials.index(objects_info[0]["material"]) < object_materials.index(objects_info[1]["material"]) else "B"          
 
+                            images_info.write(shape_record, section="shape_section")
+                            images_info.write(color_record, section="color_section")
+
                             # Copy image
                             source_path = f"{image_folder}/{camera_position}/img_0000.png"
                             destination_path = f"{output_path}/{image_info['image_path']}"
@@ -292,16 +310,19 @@ def main(args):
                         c.communicate({"$type": "destroy_all_objects"})
                         c.communicate(TDWUtils.create_empty_room(12, 12))
 
+                        journal.commit(image_id, images_info)
                         image_id += 1
 
     # Save object info to JSON
-    with open(os.path.join(output_path, "continuous_quantity_smoothness.json"), 'w') as f:
-        json.dump(images_info, f, indent=4)
+    images_info.finalize(os.path.join(output_path, "continuous_quantity_smoothness.json"))
+    images_info.close()
+    journal.close()
 
-    print(f"{len(images_info['shape_section'])} images generated.")
+    print(f"{images_info.counts['shape_section']} images generated.")
 
     # Clean up
     c.communicate({"$type": "terminate"})
+    timings.write(args.timings)
 
 if __name__ == "__main__":
     random.seed(42)
@@ -309,6 +330,8 @@ if __name__ == "__main__":
     parser.add_argument("--screen_size", type=int, nargs='+', default=(512, 512), help="Width and Height of Screen. (W, H)")
     parser.add_argument("--output_path", type=str, default="./output", help="The path to save the outputs to.")
     parser.add_argument("--render_quality", type=int, default=5, help="The Render Quality of the output.")
+    parser.add_argument("--resume", action="store_true", help="Continue an interrupted run from its journal in output_path.")
+    parser.add_argument("--timings", type=str, default=None, help="Write the round trip timings of the run to this JSON file.")
 
     args = parser.parse_args()
     main(args)
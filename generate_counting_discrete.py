@@ -8,13 +8,17 @@ from tdw.tdw_utils import TDWUtils
 from tdw.add_ons.third_person_camera import ThirdPersonCamera
 from tdw.add_ons.image_capture import ImageCapture
 from tdw.add_ons.collision_manager import CollisionManager
-from tdw.librarian import ModelLibrarian
 from tdw.librarian import MaterialLibrarian
+from command_compiler import COMPILER
 import shutil
 import itertools
-from tdw.output_data import Raycast
 import copy
 from tdw.add_ons.interior_scene_lighting import InteriorSceneLighting
+from stratified_sampler import StratifiedSampler, marginals
+from run_journal import RunJournal
+from index_writer import IndexWriter
+from instrumentation import RoundTripRecorder
+from scene_geometry import SceneGeometry
 
 # Initiate a tdw server:
 # DISPLAY=:4 /data/shared/sim/benchmark/tdw/build/TDW.x86_64 -port 1071
@@ -30,30 +34,10 @@ from tdw.add_ons.interior_scene_lighting import InteriorSceneLighting
 # 2. remove default light in the scenes.
 # 3. determine how to describe the color (yellow or brown)
 # 4. use 3 camera views instead of 5.
-# 5. make sure the number of questions is between 600 and 2000.
+# 5. make sure the number of questions is between 600 and 2000 (use --budget).
 # 6. for each question, use one color and two shapes.
 
 
-def get_floor_height(controller: Controller) -> float:
-    raycast_command = {
-        "$type": "send_raycast",
-        "origin": {"x": 0, "y": 2.5, "z": 0},  
-        "direction": {"x": 0, "y": -1, "z": 0},  
-        "id": 0,
-        "collision_types": ["environment"]  
-    }
-    
-    response = controller.communicate([raycast_command])
-    
-    for res in response:
-        r = Raycast(res)  
-        if r.get_hit():
-            hit_position = r.get_point()
-            return hit_position[1]  
-    
-    # If no hit is detected, return a default floor height
-    return 0
-
 def avoid_adjacency(position, positions):
     while True:
         adjacent_flag = False
@@ -70,11 +54,50 @@ def avoid_adjacency(position, positions):
         if adjacent_flag == False:
             break
 
+def plan_cells(args, scenes, color_names, material_tuples, table_names, shape_tuples, cameras):
+    """
+    The cells to render. Without a budget, this is the full product of the factors, rendered from every camera.
+    With --budget, a stratified plan meets even quotas on the scene, the answer letter, the total object count
+    and the camera (one camera per cell), so no over-represented cell is rendered just to balance the others.
+    """
+    if args.budget is None:
+        return [{"scene": scene, "color": color_name, "material": material_tuple, "table": table, "shape": shape_tuple,
+                 "counts": None, "cameras": cameras}
+                for scene in scenes
+                for color_name in color_names
+                for material_tuple in material_tuples
+                for table in table_names
+                for shape_tuple in shape_tuples]
+
+    sampler = StratifiedSampler(
+        strata={"scene": scenes,
+                "counts": list(itertools.permutations(range(1, 5), 2)),
+                "camera": cameras},
+        derived={"answer": lambda cell: "A" if cell["counts"][0] > cell["counts"][1] else "B",
+                 "object_count": lambda cell: sum(cell["counts"])},
+        free={"color": color_names, "material": material_tuples, "table": table_names, "shape": shape_tuples},
+        seed=args.seed)
+    quota_factors = ["scene", "answer", "object_count", "camera"]
+    sampler.quotas = sampler.uniform_quotas(quota_factors, args.budget)
+    cells = sampler.plan(args.budget)
+    if sampler.unmet:
+        print(f"Quotas not met within a budget of {args.budget}: {sampler.unmet}")
+    print(f"Planned {len(cells)} cells: {marginals(cells, quota_factors)}")
+
+    for cell in cells:
+        cell["cameras"] = [cell["camera"]]
+    # Keep the scenes grouped, in their original order
+    cells.sort(key=lambda cell: scenes.index(cell["scene"]))
+    return cells
+
 def main(args):
     output_path = args.output_path
     os.makedirs(output_path, exist_ok=True) 
 
     c = Controller(launch_build=False, port=1071)
+    scene_geometry = SceneGeometry()
+    timings = RoundTripRecorder(enabled=args.timings is not None)
+    timings.attach(c)
 
     # Add interior lighting
     interior_lighting = InteriorSceneLighting()
@@ -90,8 +113,8 @@ def main(args):
     # Define scenes
     scenes = ["tdw_room", "monkey_physics_room", "box_room_2018"]
 
-    # Define tables
-    tables = {"marble_table": 0.45, "trapezoidal_table": 0.55, "small_table_green_marble": 1.33}
+    # The table tops, measured once (see scene_geometry.py)
+    tables = {table: scene_geometry.top(c, table, scale=1.5) for table in ["marble_table", "trapezoidal_table", "small_table_green_marble"]}
 
     # Define colors
     object_colors = {
@@ -114,11 +137,8 @@ def main(args):
     object_materials = ["limestone_white", "metal_brushed_copper", "wood_american_cherry"]
     material_tuples = list(itertools.permutations(object_materials, 2))
 
-    # Initialize image info
-    images_info = {}
-    images_info["shape_section"] = []    
-    # images_info["color_section"] = []
-    # images_info["material_section"] = []
+    # Stream image info to disk, it is converted to discrete_counting_info.json at the end
+    images_info = IndexWriter(os.path.join(output_path, "discrete_counting_info.jsonl"), sections=["shape_section"], append=args.resume)
 
     # Add CollisionManager to track object collisions
     collision_manager = CollisionManager(enter=True, exit=True, stay=True)
@@ -126,181 +146,201 @@ def main(args):
 
     image_id = 0
 
-    for scene in tqdm(scenes, desc="Processing scenes"):
-        interior_lighting.reset(hdri_skybox="old_apartments_walkway_4k", aperture=8, focus_distance=2.5, ambient_occlusion_intensity=0.125, ambient_occlusion_thickness_modifier=3.5, shadow_strength=1)
-        for color_name in tqdm(object_colors, desc="Processing colors", leave=False):
-            for material_tuple in tqdm(material_tuples, desc="Processing materials", leave=False):
-                for table, table_height in tqdm(tables.items(), desc="Processing tables", leave=False):
-                    for shape_tuple in tqdm(shape_tuples, desc="Processing shapes", leave=False):
-                        # General rendering configurations
-                        commands = [{"$type": "set_screen_size", "width": args.screen_size[0], "height": args.screen_size[1]},
-                                    {"$type": "set_render_quality", "render_quality": args.render_quality}]
-
-                        # Initialize scene
-                        commands.append(c.get_add_scene(scene))
-                        c.communicate(commands)
-
-                        # Add table
-                        table_id = c.get_unique_id()
-                        commands.extend(c.get_add_physics_object(model_name=table,
-                                    library="models_core.json",
-                                    object_id=table_id,
-                                    scale_factor={"x": 1.5, "y": 1.5, "z": 1.5},
-                                    position={"x": 0, "y": 0, "z": 0}))
-                        try:
-                            c.communicate(commands)
-                        except Exception as e:
-                            print(f"Error communicating with TDW: {e}")
-
-                        # Setup camera
-                        if table:
-                            camera_positions["left"]["y"] = table_height + 0.5
-                            camera_positions["front"]["y"] = table_height + 0.5
-
-                        if scene == "monkey_physics_room":
-                            camera_positions["top"]["y"] = 2.5
-                            camera_positions["left"]["x"] = -2.5
-                            camera_positions["front"]["z"] = -2.5
-
-                        # Get colors
-                        color = object_colors[color_name]
-
-                        # Generate num of objects
-                        obj_num_1 = random.randint(1, 4)
-                        obj_num_2 = obj_num_1
-                        while obj_num_2 == obj_num_1:
-                            obj_num_2 = random.randint(1, 4)
-
-                        obj_type = 0
-                        image_info = {}
-                        objects_info = []
-                        positions = []
-                        
-                        for object_name in tqdm(shape_tuple, desc="Processing objects", leave=False):
-                            lib = "models_special.json"
-                            model_record = ModelLibrarian(lib).get_record(object_name)
-
-                            obj_num = obj_num_1 if obj_type == 0 else obj_num_2
-                            material = material_tuple[0] if obj_type == 0 else material_tuple[1]
-
-                            for _ in range(obj_num):
-                                object_id = c.get_unique_id()
-
-                                position = {
-                                    "x": random.uniform(-0.8, 0.8),
-                                    "y": table_height,
-                                    "z": random.uniform(-0.35, 0.35)
-                                }
-
-                                if positions == []:
-                                    positions.append(position)
-                                else:
-                                    avoid_adjacency(position, positions)
-                                    positions.append(position)
-
-                                if object_name == "prim_cyl" and table == "small_table_green_marble":
-                                    position["y"] += 0.05
-
-                                scale = random.uniform(0.1, 0.15)
-                                scale = round(scale, 2)
-
-                                # Place object with physics and check for collisions
-                                commands.extend(c.get_add_physics_object(model_name=object_name,
-                                                                    library=lib,
-                                                                    position=position,
-                                                                    default_physics_values=False,
-                                                                    scale_factor={"x": scale, "y": scale, "z": scale},
-                                                                    object_id=object_id))
-                                
-                                # Set the object's material
-                                commands.extend(TDWUtils.set_visual_material(c=c, substructure=model_record.substructure, material=material, object_id=object_id))
-                                commands.append({
-                                    "$type": "set_color",
-                                    "id": object_id,
-                                    "color": color  
-                                })
-
-                                object_shape = object_name.split("_")[1]
-                                object_shape = "cylinder" if object_shape == "cyl" else object_shape
-
-                                # Record object info
-                                object_info = {
-                                    "type": object_shape,
-                                    "material": material,
-                                    "color": color_name,
-                                    "size": scale,
-                                    "position": position
-                                }
-
-                                # Record object info
-                                objects_info.append(object_info)
-
-                            obj_type += 1
-
-                        for camera_position in tqdm(camera_positions, desc="Processing camera positions", leave=False):
-                            for add_on in c.add_ons:
-                                if isinstance(add_on, ThirdPersonCamera):
-                                    c.add_ons.remove(add_on)
-
-                            camera = ThirdPersonCamera(position=camera_positions[camera_position], avatar_id=camera_position, look_at={"x": 0, "y": table_height, "z": 0}, field_of_view=55)
-                            if scene == "monkey_physics_room" and camera_position == "top" and table == "small_table_green_marble":
-                                camera = ThirdPersonCamera(position=camera_positions[camera_position], avatar_id=camera_position, look_at={"x": 0, "y": table_height, "z": 0}, field_of_view=80)
-                            elif scene == "monkey_physics_room":
-                                camera = ThirdPersonCamera(position=camera_positions[camera_position], avatar_id=camera_position, look_at={"x": 0, "y": table_height, "z": 0}, field_of_view=60)
-                            elif scene == "box_room_2018" and camera_position == "top" and table == "small_table_green_marble":
-                                camera = ThirdPersonCamera(position=camera_positions[camera_position], avatar_id=camera_position, look_at={"x": 0, "y": table_height, "z": 0}, field_of_view=75)
-
-                            c.add_ons.append(camera)
-
-                            # Add the ImageCapture add-on only after all objects have been placed
-                            image_folder = f"{output_path}//original"
-                            os.makedirs(image_folder, exist_ok=True)
-                            c.add_ons.append(ImageCapture(path=image_folder, avatar_ids=[camera.avatar_id], png=True))
-
-                            # Render the image
-                            c.communicate(commands)
-
-                            image_info["image_path"] = f"{scene}_{camera_position}_{image_id}.png"
-                            image_info["scene"] = scene
-                            image_info["color"] = color_name
-                            image_info["camera_view"] = camera.avatar_id
-                            image_info["objects_info"] = objects_info
-
-                            images_info["shape_section"].append(copy.deepcopy(image_info))
-                            # images_info["material_section"].append(copy.deepcopy(image_info))
-
-                            # object_shape_1 = shape_tuple[0].split("_")[1]
-                            # object_shape_1 = "cylinder" if object_shape_1 == "cyl" else object_shape_1
-                            # object_shape_2 = shape_tuple[1].split("_")[1]
-                            # object_shape_2 = "cylinder" if object_shape_2 == "cyl" else object_shape_2
-                            # images_info["shape_section"][-1]["question"] = f"Which are more numerous in the image, {object_shape_1}s or {object_shape_2}s? Answer with the letter of your choice: A. {object_shape_1}s B. {object_shape_2}s"
-                            # images_info["shape_section"][-1]["gt_answer"] = "A" if obj_num_1 > obj_num_2 else "B"
-
-                            # object_material_1 = objects_info[0]["material"].split("_")[0]
-                            # object_material_2 = objects_info[1]["material"].split("_")[0]
-                            # images_info["material_section"][-1]["question"] = f"Which material has more objects in the image, {object_material_1} or {object_material_2}? Answer with the letter of your choice: A. {object_material_1} B. {object_material_2}"
-                            # images_info["material_section"][-1]["gt_answer"] = "A" if obj_num_1 > obj_num_2 else "B"           
-
-                            # Copy image
-                            source_path = f"{image_folder}/{camera_position}/img_0000.png"
-                            destination_path = f"{output_path}/{image_info['image_path']}"
-                            shutil.copy(source_path, destination_path)
-
-                        # Reset for the next loop
-                        c.add_ons.clear() 
-                        c.communicate({"$type": "destroy_all_objects"})
-                        c.communicate(TDWUtils.create_empty_room(12, 12))
-
-                        image_id += 1
+    cells = plan_cells(args, scenes, list(object_colors.keys()), material_tuples, list(tables.keys()), shape_tuples, list(camera_positions.keys()))
+
+    journal = RunJournal(os.path.join(output_path, "discrete_counting_info.journal"), resume=args.resume)
+    journal.replay(images_info)
+    if journal.next_index > 0:
+        # Every completed sample ends with c.add_ons.clear(): resume with the same add-ons
+        c.add_ons.clear()
+
+    current_scene = None
+    for cell in tqdm(cells, desc="Processing cells"):
+        if journal.skip(image_id, state={"camera_positions": camera_positions}):
+            image_id += 1
+            continue
+
+        timings.set_sample(image_id)
+        scene, color_name, material_tuple, table, shape_tuple = cell["scene"], cell["color"], cell["material"], cell["table"], cell["shape"]
+        table_height = tables[table]
+        if scene != current_scene:
+            interior_lighting.reset(hdri_skybox="old_apartments_walkway_4k", aperture=8, focus_distance=2.5, ambient_occlusion_intensity=0.125, ambient_occlusion_thickness_modifier=3.5, shadow_strength=1)
+            current_scene = scene
+
+        # General rendering configurations
+        commands = [{"$type": "set_screen_size", "width": args.screen_size[0], "height": args.screen_size[1]},
+                    {"$type": "set_render_quality", "render_quality": args.render_quality}]
+
+        # Initialize scene
+        commands.append(c.get_add_scene(scene))
+        c.communicate(commands)
+
+        # Add table
+        table_id = c.get_unique_id()
+        commands.extend(c.get_add_physics_object(model_name=table,
+                    library="models_core.json",
+                    object_id=table_id,
+                    scale_factor={"x": 1.5, "y": 1.5, "z": 1.5},
+                    position={"x": 0, "y": 0, "z": 0}))
+        try:
+            c.communicate(commands)
+        except Exception as e:
+            print(f"Error communicating with TDW: {e}")
+
+        # Setup camera
+        if table:
+            camera_positions["left"]["y"] = table_height + 0.5
+            camera_positions["front"]["y"] = table_height + 0.5
+
+        if scene == "monkey_physics_room":
+            camera_positions["top"]["y"] = 2.5
+            camera_positions["left"]["x"] = -2.5
+            camera_positions["front"]["z"] = -2.5
+
+        # Get colors
+        color = object_colors[color_name]
+
+        # Generate num of objects (planned cells already fix them)
+        if cell["counts"] is not None:
+            obj_num_1, obj_num_2 = cell["counts"]
+        else:
+            obj_num_1 = random.randint(1, 4)
+            obj_num_2 = obj_num_1
+            while obj_num_2 == obj_num_1:
+                obj_num_2 = random.randint(1, 4)
+
+        obj_type = 0
+        image_info = {}
+        objects_info = []
+        positions = []
+        
+        for object_name in tqdm(shape_tuple, desc="Processing objects", leave=False):
+            lib = "models_special.json"
+
+            obj_num = obj_num_1 if obj_type == 0 else obj_num_2
+            material = material_tuple[0] if obj_type == 0 else material_tuple[1]
+
+            for _ in range(obj_num):
+                object_id = c.get_unique_id()
+
+                position = {
+                    "x": random.uniform(-0.8, 0.8),
+                    "y": table_height,
+                    "z": random.uniform(-0.35, 0.35)
+                }
+
+                if positions == []:
+                    positions.append(position)
+                else:
+                    avoid_adjacency(position, positions)
+                    positions.append(position)
+
+                if object_name == "prim_cyl" and table == "small_table_green_marble":
+                    position["y"] += 0.05
+
+                scale = random.uniform(0.1, 0.15)
+                scale = round(scale, 2)
+
+                # Place object with physics and check for collisions
+                commands.extend(COMPILER.add_object(model_name=object_name,
+                                               library=lib,
+                                               position=position,
+                                               default_physics_values=False,
+                                               scale_factor={"x": scale, "y": scale, "z": scale},
+                                               object_id=object_id))
+                
+                # Set the object's material
+                commands.extend(COMPILER.set_visual_material(model_name=object_name, library=lib, material=material, object_id=object_id))
+                commands.append({
+                    "$type": "set_color",
+                    "id": object_id,
+                    "color": color  
+                })
+
+                object_shape = object_name.split("_")[1]
+                object_shape = "cylinder" if object_shape == "cyl" else object_shape
+
+                # Record object info
+                object_info = {
+                    "type": object_shape,
+                    "material": material,
+                    "color": color_name,
+                    "size": scale,
+                    "position": position
+                }
+
+                # Record object info
+                objects_info.append(object_info)
+
+            obj_type += 1
+
+        for camera_position in tqdm(cell["cameras"], desc="Processing camera positions", leave=False):
+            for add_on in c.add_ons:
+                if isinstance(add_on, ThirdPersonCamera):
+                    c.add_ons.remove(add_on)
+
+            camera = ThirdPersonCamera(position=camera_positions[camera_position], avatar_id=camera_position, look_at={"x": 0, "y": table_height, "z": 0}, field_of_view=55)
+            if scene == "monkey_physics_room" and camera_position == "top" and table == "small_table_green_marble":
+                camera = ThirdPersonCamera(position=camera_positions[camera_position], avatar_id=camera_position, look_at={"x": 0, "y": table_height, "z": 0}, field_of_view=80)
+            elif scene == "monkey_physics_room":
+                camera = ThirdPersonCamera(position=camera_positions[camera_position], avatar_id=camera_position, look_at={"x": 0, "y": table_height, "z": 0}, field_of_view=60)
+            elif scene == "box_room_2018" and camera_position == "top" and table == "small_table_green_marble":
+                camera = ThirdPersonCamera(position=camera_positions[camera_position], avatar_id=camera_position, look_at={"x": 0, "y": table_height, "z": 0}, field_of_view=75)
+
+            c.add_ons.append(camera)
+
+            # Add the ImageCapture add-on only after all objects have been placed
+            image_folder = f"{output_path}//original"
+            os.makedirs(image_folder, exist_ok=True)
+            c.add_ons.append(ImageCapture(path=image_folder, avatar_ids=[camera.avatar_id], png=True))
+
+            # Render the image
+            c.communicate(commands)
+
+            image_info["image_path"] = f"{scene}_{camera_position}_{image_id}.png"
+            image_info["scene"] = scene
+            image_info["color"] = color_name
+            image_info["camera_view"] = camera.avatar_id
+            image_info["objects_info"] = objects_info
+
+            images_info.write(image_info, section="shape_section")
+            # images_info.write(image_info, section="material_section")
+
+            # object_shape_1 = shape_tuple[0].split("_")[1]
+            # object_shape_1 = "cylinder" if object_shape_1 == "cyl" else object_shape_1
+            # object_shape_2 = shape_tuple[1].split("_")[1]
+            # object_shape_2 = "cylinder" if object_shape_2 == "cyl" else object_shape_2
+            # images_info["shape_section"][-1]["question"] = f"Which are more numerous in the image, {object_shape_1}s or {object_shape_2}s? Answer with the letter of your choice: A. {object_shape_1}s B. {object_shape_2}s"
+            # images_info["shape_section"][-1]["gt_answer"] = "A" if obj_num_1 > obj_num_2 else "B"
+
+            # object_material_1 = objects_info[0]["material"].split("_")[0]
+            # object_material_2 = objects_info[1]["material"].split("_")[0]
+            # images_info["material_section"][-1]["question"] = f"Which material has more objects in the image, {object_material_1} or {object_material_2}? Answer with the letter of your choice: A. {object_material_1} B. {object_material_2}"
+            # images_info["material_section"][-1]["gt_answer"] = "A" if obj_num_1 > obj_num_2 else "B"           
+
+            # Copy image
+            source_path = f"{image_folder}/{camera_position}/img_0000.png"
+            destination_path = f"{output_path}/{image_info['image_path']}"
+            shutil.copy(source_path, destination_path)
+
+        # Reset for the next loop
+        c.add_ons.clear() 
+        c.communicate({"$type": "destroy_all_objects"})
+        c.communicate(TDWUtils.create_empty_room(12, 12))
+
+        journal.commit(image_id, images_info)
+        image_id += 1
 
     # Save object info to JSON
-    with open(os.path.join(output_path, "discrete_counting_info.json"), 'w') as f:
-        json.dump(images_info, f, indent=4)
+    images_info.finalize(os.path.join(output_path, "discrete_counting_info.json"))
+    images_info.close()
+    journal.close()
 
-    print(f"{len(images_info['shape_section'])} images generated.")
+    print(f"{images_info.counts['shape_section']} images generated.")
 
     # Clean up
     c.communicate({"$type": "terminate"})
+    timings.write(args.timings)
 
 if __name__ == "__main__":
     random.seed(39)
@@ -308,6 +348,10 @@ if __name__ == "__main__":
     parser.add_argument("--screen_size", type=int, nargs='+', default=(512, 512), help="Width and Height of Screen. (W, H)")
     parser.add_argument("--output_path", type=str, default="./output", help="The path to save the outputs to.")
     parser.add_argument("--render_quality", type=int, default=5, help="The Render Quality of the output.")
+    parser.add_argument("--budget", type=int, default=None, help="Total number of images. If set, render a stratified plan balanced over scene, answer, object count and camera instead of the full product.")
+    parser.add_argument("--seed", type=int, default=39, help="Seed of the stratified plan.")
+    parser.add_argument("--resume", action="store_true", help="Continue an interrupted run from its journal in output_path.")
+    parser.add_argument("--timings", type=str, default=None, help="Write the round trip timings of the run to this JSON file.")
 
     args = parser.parse_args()
     main(args)
@@ -8,13 +8,16 @@ from tdw.tdw_utils import TDWUtils
 from tdw.add_ons.third_person_camera import ThirdPersonCamera
 from tdw.add_ons.image_capture import ImageCapture
 from tdw.add_ons.collision_manager import CollisionManager
-from tdw.librarian import ModelLibrarian
 from tdw.librarian import MaterialLibrarian
+from command_compiler import COMPILER
 import shutil
 import itertools
-from tdw.output_data import Raycast
 import copy
 from tdw.add_ons.interior_scene_lighting import InteriorSceneLighting
+from run_journal import RunJournal
+from index_writer import IndexWriter
+from instrumentation import RoundTripRecorder
+from scene_geometry import SceneGeometry
 
 # Initiate a tdw server:
 # DISPLAY=:4 /data/shared/sim/benchmark/tdw/build/TDW.x86_64 -port 1071
@@ -32,26 +35,6 @@ from tdw.add_ons.interior_scene_lighting import InteriorSceneLighting
 
 
 
-def get_floor_height(controller: Controller) -> float:
-    raycast_command = {
-        "$type": "send_raycast",
-        "origin": {"x": 0, "y": 2.5, "z": 0},  
-        "direction": {"x": 0, "y": -1, "z": 0},  
-        "id": 0,
-        "collision_types": ["environment"]  
-    }
-    
-    response = controller.communicate([raycast_command])
-    
-    for res in response:
-        r = Raycast(res)  
-        if r.get_hit():
-            hit_position = r.get_point()
-            return hit_position[1]  
-    
-    # If no hit is detected, return a default floor height
-    return 0
-
 
 def generate_color_shape_distribution(combined_tuples):
     color_shape_dic = {}
@@ -106,6 +89,9 @@ def main(args):
     os.makedirs(output_path, exist_ok=True) 
 
     c = Controller(launch_build=False, port=1071)
+    scene_geometry = SceneGeometry()
+    timings = RoundTripRecorder(enabled=args.timings is not None)
+    timings.attach(c)
 
     # Add interior lighting
     interior_lighting = InteriorSceneLighting()
@@ -121,8 +107,8 @@ def main(args):
     # Define scenes
     scenes = ["tdw_room", "monkey_physics_room", "box_room_2018"]
 
-    # Define tables
-    tables = {"marble_table": 0.45, "trapezoidal_table": 0.55, "small_table_green_marble": 1.33}
+    # The table tops, measured once (see scene_geometry.py)
+    tables = {table: scene_geometry.top(c, table, scale=1.5) for table in ["marble_table", "trapezoidal_table", "small_table_green_marble"]}
 
     # Define colors
     object_colors = {
@@ -144,11 +130,8 @@ def main(args):
     # Define materials
     object_materials = ["limestone_white", "glass_chopped_strands", "sand_covered_stone_ground"]
 
-    # Initialize image info
-    images_info = {}
-    images_info["shape_section"] = []    
-    images_info["color_section"] = []
-    images_info["material_section"] = []
+    # Stream image info to disk, it is converted to relative_counting_info.json at the end
+    images_info = IndexWriter(os.path.join(output_path, "relative_counting_info.jsonl"), sections=["shape_section", "color_section", "material_section"], append=args.resume)
 
     # Add CollisionManager to track object collisions
     collision_manager = CollisionManager(enter=True, exit=True, stay=True)
@@ -156,12 +139,23 @@ def main(args):
 
     image_id = 0
 
+    journal = RunJournal(os.path.join(output_path, "relative_counting_info.journal"), resume=args.resume)
+    journal.replay(images_info)
+    if journal.next_index > 0:
+        # Completed samples end with c.add_ons.clear(): resume with the same add-ons
+        c.add_ons.clear()
+
     for scene in tqdm(scenes, desc="Processing scenes"):
         interior_lighting.reset(hdri_skybox="old_apartments_walkway_4k", aperture=8, focus_distance=2.5, ambient_occlusion_intensity=0.125, ambient_occlusion_thickness_modifier=3.5, shadow_strength=1)
         for shape_tuple in tqdm(shape_tuples, desc="Processing shapes", leave=False):
             for color_tuple in tqdm(color_tuples, desc="Processing colors", leave=False):
                 for material in tqdm(object_materials, desc="Processing materials", leave=False):
                     for table, table_height in tqdm(tables.items(), desc="Processing tables", leave=False):
+                        if journal.skip(image_id, state={"camera_positions": camera_positions}):
+                            image_id += 1
+                            continue
+
+                        timings.set_sample(image_id)
                         combined_tuples = list(itertools.product(color_tuple, shape_tuple))
                         
                         while True:
@@ -206,7 +200,6 @@ def main(args):
                         
                         for (color_name, object_name), obj_num in tqdm(color_shape_dic.items(), desc="Processing objects", leave=False):
                             lib = "models_special.json"
-                            model_record = ModelLibrarian(lib).get_record(object_name)
 
                             for _ in range(obj_num):
                                 object_id = c.get_unique_id()
@@ -232,15 +225,15 @@ def main(args):
                                 scale = round(scale, 2)
 
                                 # Place object with physics and check for collisions
-                                commands.extend(c.get_add_physics_object(model_name=object_name,
-                                                                    library=lib,
-                                                                    position=position,
-                                                                    default_physics_values=False,
-                                                                    scale_factor={"x": scale, "y": scale, "z": scale},
-                                                                    object_id=object_id))
+                                commands.extend(COMPILER.add_object(model_name=object_name,
+                                                               library=lib,
+                                                               position=position,
+                                                               default_physics_values=False,
+                                                               scale_factor={"x": scale, "y": scale, "z": scale},
+                                                               object_id=object_id))
                                 
                                 # Set the object's material
-                                commands.extend(TDWUtils.set_visual_material(c=c, substructure=model_record.substructure, material=material, object_id=object_id))
+                                commands.extend(COMPILER.set_visual_material(model_name=object_name, library=lib, material=material, object_id=object_id))
                                 commands.append({
                                     "$type": "set_color",
                                     "id": object_id,
@@ -285,9 +278,9 @@ def main(args):
                             image_info["objects_info"] = objects_info
                             image_info["table"] = table
 
-                            images_info["shape_section"].append(copy.deepcopy(image_info))
-                            images_info["color_section"].append(copy.deepcopy(image_info))
-                            images_info["material_section"].append(copy.deepcopy(image_info))
+                            shape_record = dict(image_info)
+                            color_record = dict(image_info)
+                            material_record = dict(image_info)
 
                             color_counts = {color: 0 for color in color_tuple}
                             shape_counts = {shape: 0 for shape in shape_tuple}
@@ -301,23 +294,27 @@ def main(args):
                             object_shape_2 = object_name_2.split("_")[1]
                             object_shape_1 = "cylinder" if object_shape_1 == "cyl" else object_shape_1
                             object_shape_2 = "cylinder" if object_shape_2 == "cyl" else object_shape_2
-                            images_info["shape_section"][-1]["question"] = f"Which are more numerous in the image, {object_shape_1}s or {object_shape_2}s? Answer with the letter of your choice: A. {object_shape_1}s B. {object_shape_2}s C. The same"
+                            shape_record["question"] = f"Which are more numerous in the image, {object_shape_1}s or {object_shape_2}s? Answer with the letter of your choice: A. {object_shape_1}s B. {object_shape_2}s C. The same"
                         
                             if shape_counts[object_name_1] > shape_counts[object_name_2]:
-                                images_info["shape_section"][-1]["gt_answer"] = "A" 
+                                shape_record["gt_answer"] = "A" 
                             elif shape_counts[object_name_1] < shape_counts[object_name_2]:
-                                images_info["shape_section"][-1]["gt_answer"] = "B"
+                                shape_record["gt_answer"] = "B"
                             else:
-                                images_info["shape_section"][-1]["gt_answer"] = "C"      
+                                shape_record["gt_answer"] = "C"      
                            
                             object_color_1, object_color_2 = color_counts.keys()                  
-                            images_info["color_section"][-1]["question"] = f"Which color has more objects in the image, {object_color_1} or {object_color_2}? Answer with the letter of your choice: A. {object_color_1} B. {object_color_2} C. The same"
+                            color_record["question"] = f"Which color has more objects in the image, {object_color_1} or {object_color_2}? Answer with the letter of your choice: A. {object_color_1} B. {object_color_2} C. The same"
                             if color_counts[object_color_1] > color_counts[object_color_2]:
-                                images_info["color_section"][-1]["gt_answer"] = "A"
+                                color_record["gt_answer"] = "A"
                             elif color_counts[object_color_1] < color_counts[object_color_2]:
-                                images_info["color_section"][-1]["gt_answer"] = "B"
+                                color_record["gt_answer"] = "B"
                             else:
-                                images_info["color_section"][-1]["gt_answer"] = "C"       
+                                color_record["gt_answer"] = "C"       
+
+                            images_info.write(shape_record, section="shape_section")
+                            images_info.write(color_record, section="color_section")
+                            images_info.write(material_record, section="material_section")
 
                             # Copy image
                             source_path = f"{image_folder}/{camera_position}/img_0000.png"
@@ -329,16 +326,19 @@ def main(args):
                         c.communicate({"$type": "destroy_all_objects"})
                         c.communicate(TDWUtils.create_empty_room(12, 12))
 
+                        journal.commit(image_id, images_info)
                         image_id += 1
 
     # Save object info to JSON
-    with open(os.path.join(output_path, "relative_counting_info.json"), 'w') as f:
-        json.dump(images_info, f, indent=4)
+    images_info.finalize(os.path.join(output_path, "relative_counting_info.json"))
+    images_info.close()
+    journal.close()
 
-    print(f"{len(images_info['shape_section'])} images generated.")
+    print(f"{images_info.counts['shape_section']} images generated.")
 
     # Clean up
     c.communicate({"$type": "terminate"})
+    timings.write(args.timings)
 
 if __name__ == "__main__":
     random.seed(39)
@@ -346,6 +346,8 @@ if __name__ == "__main__":
     parser.add_argument("--screen_size", type=int, nargs='+', default=(512, 512), help="Width and Height of Screen. (W, H)")
     parser.add_argument("--output_path", type=str, default="./output", help="The path to save the outputs to.")
     parser.add_argument("--render_quality", type=int, default=5, help="The Render Quality of the output.")
+    parser.add_argument("--resume", action="store_true", help="Continue an interrupted run from its journal in output_path.")
+    parser.add_argument("--timings", type=str, default=None, help="Write the round trip timings of the run to this JSON file.")
 
     args = parser.parse_args()
     main(args)
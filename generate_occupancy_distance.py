@@ -8,13 +8,17 @@ from tdw.tdw_utils import TDWUtils
 from tdw.add_ons.third_person_camera import ThirdPersonCamera
 from tdw.add_ons.image_capture import ImageCapture
 from tdw.add_ons.collision_manager import CollisionManager
-from tdw.librarian import ModelLibrarian
 from tdw.librarian import MaterialLibrarian
+from command_compiler import COMPILER
 import shutil
 import itertools
 from tdw.output_data import Raycast
 import copy
 from tdw.add_ons.interior_scene_lighting import InteriorSceneLighting
+from run_journal import RunJournal
+from index_writer import IndexWriter
+from instrumentation import RoundTripRecorder
+from scene_geometry import SceneGeometry
 
 # Initiate a tdw server:
 # DISPLAY=:4 /data/shared/sim/benchmark/tdw/build/TDW.x86_64 -port=1071
@@ -45,6 +49,9 @@ def main(args):
     os.makedirs(output_path, exist_ok=True) 
 
     c = Controller(launch_build=False, port=1071)
+    scene_geometry = SceneGeometry()
+    timings = RoundTripRecorder(enabled=args.timings is not None)
+    timings.attach(c)
 
     # Add interior lighting
     interior_lighting = InteriorSceneLighting()
@@ -67,8 +74,8 @@ def main(args):
     # Define scenes
     scenes = ["tdw_room", "monkey_physics_room", "box_room_2018"]
 
-    # Define tables
-    tables = {"marble_table": 0.45, "trapezoidal_table": 0.55, "small_table_green_marble": 1.33}
+    # The table tops, measured once (see scene_geometry.py)
+    tables = {table: scene_geometry.top(c, table, scale=1.5) for table in ["marble_table", "trapezoidal_table", "small_table_green_marble"]}
 
     # Define colors 
     object_colors = {
@@ -85,26 +92,28 @@ def main(args):
     # Define materials
     object_materials = ["limestone_white", "glass_chopped_strands", "sand_covered_stone_ground"]
 
-    # Initialize image info
-    images_info = {}
-    # images_info["shape_section"] = []    
-    # images_info["color_section"] = []
-    # images_info["material_section"] = []
-    images_info["position_section"] = []    
-
     # Add CollisionManager to track object collisions
     collision_manager = CollisionManager(enter=True, exit=True, stay=True)
     c.add_ons.append(collision_manager)
 
-    # Clear the output folder
-    for filename in os.listdir(output_path):
-        file_path = os.path.join(output_path, filename)
-        if os.path.isfile(file_path):
-            os.remove(file_path)
+    # Clear the output folder, unless an interrupted run is resumed
+    if not args.resume:
+        for filename in os.listdir(output_path):
+            file_path = os.path.join(output_path, filename)
+            if os.path.isfile(file_path):
+                os.remove(file_path)
 
 
     image_id = 0
     output = ""
+    # After clearing the output folder: stream image info to disk, it is converted to position.json at the end
+    images_info = IndexWriter(os.path.join(output_path, "position.jsonl"), sections=["position_section"], append=args.resume)
+    journal = RunJournal(os.path.join(output_path, "position.journal"), resume=args.resume)
+    journal.replay(images_info)
+    if journal.next_index > 0:
+        # Completed samples end with c.add_ons.clear(): resume with the same add-ons
+        c.add_ons.clear()
+
     for scene in tqdm(scenes, desc="Processing scenes"):
         interior_lighting.reset(hdri_skybox="old_apartments_walkway_4k", aperture=8, focus_distance=2.5, ambient_occlusion_intensity=0.125, ambient_occlusion_thickness_modifier=3.5, shadow_strength=1)
         for shape_tuple in tqdm(shape_tuples, desc="Processing shapes", leave=False):
@@ -112,7 +121,12 @@ def main(args):
                 for material in tqdm(object_materials, desc="Processing materials", leave=False):
                     for table, table_height in tqdm(tables.items(), desc="Processing tables", leave=False):
                         for question_type in ['near', 'far']:
+                            if journal.skip(image_id, state={"camera_positions": camera_positions}):
+                                image_id += 1
+                                continue
+
 
+                            timings.set_sample(image_id)
                             combined_tuples = list(itertools.product(color_tuple, shape_tuple))
                             color_shape_dic = generate_color_shape_distribution(color_tuple, shape_tuple, combined_tuples)
 
@@ -185,7 +199,6 @@ def main(args):
                                     continue
 
                                 lib = "models_special.json"
-                                model_record = ModelLibrarian(lib).get_record(object_name)
 
                                 # for _ in range(obj_num):
                                 object_id = c.get_unique_id()
@@ -224,15 +237,15 @@ def main(args):
                                 
 
                                 # Place object with physics and check for collisions
-                                commands.extend(c.get_add_physics_object(model_name=object_name,
-                                                                    library=lib,
-                                                                    position=position,
-                                                                    default_physics_values=False,
-                                                                    scale_factor={"x": scale, "y": scale, "z": scale},
-                                                                    object_id=object_id))
+                                commands.extend(COMPILER.add_object(model_name=object_name,
+                                                               library=lib,
+                                                               position=position,
+                                                               default_physics_values=False,
+                                                               scale_factor={"x": scale, "y": scale, "z": scale},
+                                                               object_id=object_id))
                                 
                                 # Set the object's material
-                                commands.extend(TDWUtils.set_visual_material(c=c, substructure=model_record.substructure, material=material, object_id=object_id))
+                                commands.extend(COMPILER.set_visual_material(model_name=object_name, library=lib, material=material, object_id=object_id))
                                 commands.append({
                                     "$type": "set_color",
                                     "id": object_id,
@@ -289,14 +302,17 @@ def main(args):
                                 # images_info["shape_section"].append(copy.deepcopy(image_info))
                                 # images_info["color_section"].append(copy.deepcopy(image_info))
                                 # images_info["material_section"].append(copy.deepcopy(image_info))
-                                images_info["position_section"].append(copy.deepcopy(image_info))
+                                position_record = dict(image_info)
 
 
-                                images_info["position_section"][-1]["question"] = f"Is a third {object_full_name} of the same size can be placed in between the two {object_full_name}s?"
+                                position_record["question"] = f"Is a third {object_full_name} of the same size can be placed in between the two {object_full_name}s?"
                                 if question_type == "near":
-                                    images_info["position_section"][-1]["gt_answer"] = "No."
+                                    position_record["gt_answer"] = "No."
                                 elif question_type == "far":
-                                    images_info["position_section"][-1]["gt_answer"] = "Yes."
+                                    position_record["gt_answer"] = "Yes."
+      
+                                images_info.write(position_record, section="position_section")
+
       
 
                                 # Copy image
@@ -310,6 +326,7 @@ def main(args):
                                 c.communicate({"$type": "destroy_all_objects"})
                                 c.communicate(TDWUtils.create_empty_room(12, 12))
 
+                            journal.commit(image_id, images_info)
                             image_id += 1
 
         #         break
@@ -317,14 +334,16 @@ def main(args):
         # break
 
     # Save object info to JSON
-    with open(os.path.join(output_path, "position.json"), 'w') as f:
-        json.dump(images_info, f, indent=4)
+    images_info.finalize(os.path.join(output_path, "position.json"))
+    images_info.close()
+    journal.close()
 
-    print(f"{len(images_info['position_section'])} images generated.")
+    print(f"{images_info.counts['position_section']} images generated.")
     print(output)
 
     # Clean up
     c.communicate({"$type": "terminate"})
+    timings.write(args.timings)
 
 if __name__ == "__main__":
     random.seed(39)
@@ -332,6 +351,8 @@ if __name__ == "__main__":
     parser.add_argument("--screen_size", type=int, nargs='+', default=(512, 512), help="Width and Height of Screen. (W, H)")
     parser.add_argument("--output_path", type=str, default="./occupancy/distance", help="The path to save the outputs to.")
     parser.add_argument("--render_quality", type=int, default=5, help="The Render Quality of the output.")
+    parser.add_argument("--resume", action="store_true", help="Continue an interrupted run from its journal in output_path.")
+    parser.add_argument("--timings", type=str, default=None, help="Write the round trip timings of the run to this JSON file.")
 
     args = parser.parse_args()
     main(args)
@@ -0,0 +1,531 @@
+import argparse
+import json
+import os
+import random
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from serialization import dumps, loads
+
+# Evaluation indexes from the generator outputs, in a single pass.
+# The generators write one record per rendered image, in sections (shape_section, color_section...). An evaluation
+# index has one entry per sample: the images of a sample (same id, the last "_" field of image_path) are grouped,
+# then a question is built from the objects of the sample.
+#
+# Each question type is a plugin: the section it reads, how it groups the objects of a sample and how it builds an
+# entry. extract() reads the input once and feeds every record to the plugins of its section, so all the question
+# types of a dataset come out of the same pass. The legacy .json layout is parsed incrementally; the .jsonl files
+# written next to it by IndexWriter can also be split into byte ranges, extracted by a pool of processes.
+# The choices of every entry are shuffled with a random.Random seeded by (seed, plugin, sample id), so the output
+# does not depend on the number of processes.
+
+DATASET_ROOT = "/data/shared/sim/benchmark/evaluation/datasets"
+BACKGROUND_MAP = {"tdw_room": 0, "monkey_physics_room": 1, "box_room_2018": 2}
+READ_CHUNK_SIZE = 1 << 20
+
+
+def sample_id(image_path: str) -> str:
+    """
+    The id of the sample an image belongs to: "{scene}_{camera}_{image_id}.png" -> image_id.
+    """
+    return image_path.split('_')[-1].split('.')[0]
+
+
+def short_shape(model_name: str) -> str:
+    """
+    "prim_cyl" -> "cylinder", "prim_cube" -> "cube".
+    """
+    shape = model_name.split("_")[1]
+    return "cylinder" if shape == "cyl" else shape
+
+
+class ExtractorPlugin:
+    """
+    One question type. Subclasses set name, section and output, and implement object_key, object_entry and entry.
+    """
+    name: str = None
+    section: str = None
+    output: str = None
+
+    def __init__(self, image_root: str):
+        """
+        :param image_root: The directory of the images in the evaluation dataset, prefixed to image_path.
+        """
+        self.image_root = os.path.join(image_root, "")
+
+    def object_key(self, obj: Dict[str, Any]) -> str:
+        """
+        The key the objects of a sample are grouped by, e.g. their shape.
+        """
+        raise NotImplementedError
+
+    def object_entry(self, obj: Dict[str, Any]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def new_group(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        The group of a sample, from its first record.
+        """
+        group = {"source": [], "objects": {}, "scene": record["scene"]}
+        for obj in record["objects_info"]:
+            group["objects"].setdefault(self.object_key(obj), []).append(self.object_entry(obj))
+        return group
+
+    def add(self, groups: Dict[str, Dict[str, Any]], record: Dict[str, Any]):
+        suffix = sample_id(record["image_path"])
+        if suffix not in groups:
+            groups[suffix] = self.new_group(record)
+        groups[suffix]["source"].append(self.image_root + record["image_path"])
+
+    def entry(self, group: Dict[str, Any], rng: random.Random) -> Dict[str, Any]:
+        """
+        The index entry of a sample.
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def two_keys(group: Dict[str, Any]) -> Tuple[str, str]:
+        keys = list(group["objects"].keys())
+        return keys[0], keys[1] if len(keys) > 1 else keys[0]
+
+
+class DiscreteCountPlugin(ExtractorPlugin):
+    """
+    How many objects are there? Four numbers to choose from.
+    """
+    name = "discrete_shape"
+    section = "shape_section"
+    output = "index.jsonl"
+
+    def object_key(self, obj):
+        return obj["type"]
+
+    def object_entry(self, obj):
+        return {"type": obj["type"], "size": obj["size"], "color": obj["color"], "material": obj["material"]}
+
+    def new_group(self, record):
+        group = super().new_group(record)
+        group["color"] = record["color"]
+        group["sizes"] = [obj["size"] for obj in record["objects_info"]]
+        group["obj_names"] = [obj["type"] for obj in record["objects_info"]]
+        group["poses_final"] = [obj["position"] for obj in record["objects_info"]]
+        return group
+
+    def entry(self, group, rng):
+        num_objects = sum(len(objs) for objs in group["objects"].values())
+        remaining_numbers = sorted(set(range(1, 9)) - {num_objects})
+        choices = [num_objects] + rng.sample(remaining_numbers, 3)
+        rng.shuffle(choices)
+        return {
+            "source": group["source"],
+            "color": group["color"],
+            "num_objects": num_objects,
+            "background": BACKGROUND_MAP.get(group["scene"], -1),
+            "round": 0,
+            "sizes": group["sizes"],
+            "obj_names": group["obj_names"],
+            "poses_final": group["poses_final"],
+            "choices": choices,
+            "answer": choices.index(num_objects) + 1
+        }
+
+
+class RelativeCountPlugin(ExtractorPlugin):
+    """
+    Which are more numerous, the objects of the first or of the second shape (or color)? The answer is computed
+    from the object counts.
+    """
+    output_keys = {"shape": ("shape1", "shape2"), "color": ("color1", "color2")}
+
+    def __init__(self, image_root: str, attribute: str):
+        """
+        :param attribute: "shape" or "color", the attribute the objects are compared by.
+        """
+        super().__init__(image_root)
+        self.attribute = attribute
+        self.name = f"relative_{attribute}"
+        self.section = f"{attribute}_section"
+        self.output = f"index_{attribute}.jsonl"
+
+    def object_key(self, obj):
+        return short_shape(obj["type"]) if self.attribute == "shape" else obj["color"]
+
+    def object_entry(self, obj):
+        return {"type": short_shape(obj["type"]), "size": obj["size"]}
+
+    def entry(self, group, rng):
+        key_1, key_2 = self.two_keys(group)
+        choices = [key_1, key_2, "They are the same"]
+        rng.shuffle(choices)
+
+        num_objects = [len(objs) for objs in group["objects"].values()]
+        if len(set(num_objects)) > 1:
+            answer = choices.index(key_2 if num_objects.index(max(num_objects)) == 1 else key_1) + 1
+        else:
+            answer = choices.index("They are the same") + 1
+
+        name_1, name_2 = self.output_keys[self.attribute]
+        return {
+            "source": group["source"],
+            name_1: key_1,
+            name_2: key_2,
+            "num_objects1": num_objects[0],
+            "num_objects2": num_objects[1] if len(num_objects) > 1 else num_objects[0],
+            "background": BACKGROUND_MAP.get(group["scene"], -1),
+            "round": 0,
+            "objects": group["objects"],
+            "choices": choices,
+            "answer": answer
+        }
+
+
+class ContinuousQuantityPlugin(RelativeCountPlugin):
+    """
+    Which object is smoother (or of a deeper tone)? The answer letter comes from the gt_answer of the generator.
+    """
+    def __init__(self, image_root: str, attribute: str, quantity: str, short_shapes: bool = True):
+        """
+        :param quantity: "smoothness" or "tone".
+        :param short_shapes: If True, object types are written as "cube" rather than "prim_cube".
+        """
+        super().__init__(image_root, attribute)
+        self.name = f"{quantity}_{attribute}"
+        self.short_shapes = short_shapes
+
+    def object_key(self, obj):
+        if self.attribute == "color":
+            return obj["color"]
+        return short_shape(obj["type"]) if self.short_shapes else obj["type"]
+
+    def object_entry(self, obj):
+        obj_type = short_shape(obj["type"]) if self.short_shapes else obj["type"]
+        return {"type": obj_type, "size": obj["size"], "color": obj["color"], "material": obj["material"]}
+
+    def new_group(self, record):
+        group = super().new_group(record)
+        group["gt_answer"] = record["gt_answer"]
+        return group
+
+    def entry(self, group, rng):
+        key_1, key_2 = self.two_keys(group)
+        combined = list(zip(["A", "B", "C"], [key_1, key_2, "They are the same"]))
+        rng.shuffle(combined)
+        choices_character = [character for character, _ in combined]
+
+        name_1, name_2 = self.output_keys[self.attribute]
+        return {
+            "source": group["source"],
+            name_1: key_1,
+            name_2: key_2,
+            "background": BACKGROUND_MAP.get(group["scene"], -1),
+            "round": 0,
+            "objects": group["objects"],
+            "choices": [choice for _, choice in combined],
+            "answer": choices_character.index(group["gt_answer"]) + 1
+        }
+
+
+# task: (generator output, image directory in DATASET_ROOT, plugin factory)
+TASKS = {
+    "discrete": ("counting_discrete/discrete_counting_info.json", "discrete_counting_tdw",
+                 lambda root: [DiscreteCountPlugin(root)]),
+    "relative": ("counting_relative/relative_counting_info.json", "relative_counting_tdw",
+                 lambda root: [RelativeCountPlugin(root, "shape"), RelativeCountPlugin(root, "color")]),
+    "smoothness": ("counting_smoothness/continuous_quantity_smoothness.json", "continuous_counting_smoothness_tdw",
+                   lambda root: [ContinuousQuantityPlugin(root, "shape", "smoothness", short_shapes=False),
+                                 ContinuousQuantityPlugin(root, "color", "smoothness", short_shapes=False)]),
+    "tone": ("counting_tone/continuous_quantity_tone.json", "continuous_counting_tone_tdw",
+             lambda root: [ContinuousQuantityPlugin(root, "shape", "tone")]),
+}
+
+
+class _JSONStream:
+    """
+    Incremental reader of a JSON document: values are decoded one at a time from a buffered file.
+    """
+    def __init__(self, f, chunk_size: int = READ_CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+
+    def _fill(self) -> bool:
+        more = self.f.read(self.chunk_size)
+        if not more:
+            return False
+        self.buf = self.buf[self.pos:] + more
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """
+        The next non-whitespace character, "" at the end of the file.
+        """
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf) or not self._fill():
+                return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, chars: str) -> str:
+        c = self.peek()
+        if not c or c not in chars:
+            raise ValueError(f"Expected one of {chars!r}, found {c!r}")
+        self.pos += 1
+        return c
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number at the end of the buffer may continue in the next chunk
+            if end == len(self.buf) and self._fill():
+                continue
+            self.pos = end
+            return obj
+
+    def array(self) -> Iterator[Any]:
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(",]") == "]":
+                return
+
+
+def iter_json_records(path: str) -> Iterator[Tuple[Optional[str], Dict[str, Any]]]:
+    """
+    Stream the (section, record) pairs of a legacy index: {"section": [record, ...], ...} or [record, ...].
+    """
+    with open(path, "r") as f:
+        stream = _JSONStream(f)
+        if stream.peek() == "[":
+            for record in stream.array():
+                yield None, record
+            return
+        stream.expect("{")
+        if stream.peek() == "}":
+            return
+        while True:
+            section = stream.value()
+            stream.expect(":")
+            for record in stream.array():
+                yield section, record
+            if stream.expect(",}") == "}":
+                return
+
+
+def split_record(record: Dict[str, Any]) -> Tuple[Optional[str], Dict[str, Any]]:
+    """
+    Split a decoded IndexWriter line into (section, record).
+    """
+    # IndexWriter lines with sections are {section: record}
+    if len(record) == 1 and isinstance(next(iter(record.values())), dict):
+        (section, record), = record.items()
+        return section, record
+    return None, record
+
+
+def iter_jsonl_records(path: str, start: int = 0, end: int = None,
+                       sections: List[str] = None) -> Iterator[Tuple[Optional[str], Dict[str, Any]]]:
+    """
+    Stream the (section, record) pairs of the lines of an IndexWriter file that start in [start, end).
+
+    :param sections: If given, the lines of other "*_section" sections are skipped without being decoded.
+    """
+    wanted = {section.encode("utf-8") for section in sections} if sections is not None else None
+    with open(path, "rb") as f:
+        if start > 0:
+            # The line that contains start belongs to the previous range
+            f.seek(start - 1)
+            f.readline()
+        pos = f.tell()
+        while end is None or pos < end:
+            line = f.readline()
+            if not line:
+                return
+            pos += len(line)
+            if wanted is not None and line.startswith(b'{"'):
+                key = line[2:line.find(b'"', 2)]
+                if key.endswith(b"_section") and key not in wanted:
+                    continue
+            try:
+                record = loads(line)
+            except ValueError:
+                return
+            yield split_record(record)
+
+
+def group_records(records: Iterator[Tuple[Optional[str], Dict[str, Any]]],
+                  plugins: List[ExtractorPlugin]) -> Dict[str, "OrderedDict[str, dict]"]:
+    """
+    Feed every record to the plugins of its section.
+
+    :return: {plugin name: {sample id: group}}, samples in order of first appearance.
+    """
+    by_section = {}
+    for plugin in plugins:
+        by_section.setdefault(plugin.section, []).append(plugin)
+    groups = {plugin.name: OrderedDict() for plugin in plugins}
+    for section, record in records:
+        for plugin in by_section.get(section, ()):
+            plugin.add(groups[plugin.name], record)
+    return groups
+
+
+def build_entries(groups: Dict[str, "OrderedDict[str, dict]"], plugins: List[ExtractorPlugin], seed: int = 0) -> Dict[str, List[str]]:
+    """
+    Build the entry of every sample, serialized.
+
+    :return: {plugin name: [JSON line]}.
+    """
+    rng = random.Random()
+    lines = {}
+    for plugin in plugins:
+        lines[plugin.name] = []
+        for suffix, group in groups[plugin.name].items():
+            rng.seed(f"{seed}:{plugin.name}:{suffix}")
+            lines[plugin.name].append(dumps(plugin.entry(group, rng)) + "\n")
+    return lines
+
+
+def _line_sample_id(line: bytes) -> str:
+    record = loads(line)
+    if len(record) == 1 and isinstance(next(iter(record.values())), dict):
+        record = next(iter(record.values()))
+    return sample_id(record["image_path"])
+
+
+def _sample_boundary(f, offset: int) -> int:
+    """
+    The offset of the first line at or after offset that starts a new sample, so that no sample is cut in two.
+    """
+    if offset <= 0:
+        return 0
+    f.seek(offset - 1)
+    f.readline()
+    pos = f.tell()
+    previous = None
+    while True:
+        line = f.readline()
+        if not line:
+            return pos
+        try:
+            current = _line_sample_id(line)
+        except ValueError:
+            return pos
+        if previous is not None and current != previous:
+            return pos
+        previous = current
+        pos += len(line)
+
+
+def _extract_range(args) -> Dict[str, List[str]]:
+    path, start, end, plugins, seed = args
+    records = iter_jsonl_records(path, start, end, sections=[plugin.section for plugin in plugins])
+    return build_entries(group_records(records, plugins), plugins, seed)
+
+
+def extract(input_path: str, plugins: List[ExtractorPlugin], processes: int = 1, seed: int = 0) -> Dict[str, List[str]]:
+    """
+    Extract the entries of all the plugins from a generator output, in one pass.
+
+    :param input_path: The generator output, .json (legacy layout) or .jsonl (IndexWriter).
+    :param plugins: The question types to extract.
+    :param processes: The number of processes for a .jsonl input. The file is split into byte ranges at sample
+                      boundaries; the records of a sample are contiguous in the files IndexWriter writes.
+    :param seed: The seed of the choice order.
+    :return: {plugin name: [JSON line]}.
+    """
+    if not input_path.endswith(".jsonl"):
+        return build_entries(group_records(iter_json_records(input_path), plugins), plugins, seed)
+    size = os.path.getsize(input_path)
+    # No more ranges than bytes
+    processes = min(processes, size)
+    if processes <= 1:
+        return _extract_range((input_path, 0, None, plugins, seed))
+
+    with open(input_path, "rb") as f:
+        bounds = [0] + [_sample_boundary(f, size * i // processes) for i in range(1, processes)] + [size]
+    ranges = [(input_path, bounds[i], bounds[i + 1], plugins, seed) for i in range(processes) if bounds[i] < bounds[i + 1]]
+    lines = {plugin.name: [] for plugin in plugins}
+    # multiprocessing is only loaded by the runs that use a pool
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        for range_lines in executor.map(_extract_range, ranges):
+            for name, plugin_lines in range_lines.items():
+                lines[name].extend(plugin_lines)
+    return lines
+
+
+def write_indexes(lines: Dict[str, List[str]], plugins: List[ExtractorPlugin], output_dir: str) -> Dict[str, int]:
+    """
+    Write one index per plugin, atomically.
+
+    :return: {plugin name: number of entries}.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    for plugin in plugins:
+        path = os.path.join(output_dir, plugin.output)
+        with open(path + ".tmp", "w") as f:
+            f.writelines(lines[plugin.name])
+        os.replace(path + ".tmp", path)
+    return {plugin.name: len(lines[plugin.name]) for plugin in plugins}
+
+
+def extract_index(task: str, input_path: str = None, output_dir: str = ".", image_root: str = None,
+                  processes: int = 1, seed: int = 0) -> Dict[str, int]:
+    """
+    Regenerate the evaluation indexes of a task.
+
+    :param task: A key of TASKS.
+    :param input_path: The generator output. Defaults to the one of the task; its .jsonl is used if it exists.
+    :param output_dir: The directory of the indexes.
+    :param image_root: The image directory prefixed to image_path. Defaults to the one of the task in DATASET_ROOT.
+    :param processes: The number of processes (only used for .jsonl inputs).
+    :param seed: The seed of the choice order.
+    """
+    default_input, image_dir, make_plugins = TASKS[task]
+    if input_path is None:
+        input_path = default_input
+        jsonl_path = os.path.splitext(input_path)[0] + ".jsonl"
+        if os.path.exists(jsonl_path):
+            input_path = jsonl_path
+    plugins = make_plugins(image_root if image_root is not None else os.path.join(DATASET_ROOT, image_dir, "images"))
+    lines = extract(input_path, plugins, processes=processes, seed=seed)
+    return write_indexes(lines, plugins, output_dir)
+
+
+def main(task: str = None):
+    """
+    Command line entry point. The extract_*_index_info.py scripts call it with their task.
+    """
+    parser = argparse.ArgumentParser(description="Extract the evaluation indexes from a generator output.")
+    if task is None:
+        parser.add_argument("task", type=str, choices=list(TASKS.keys()), help="The generator output to extract.")
+    parser.add_argument("--input_path", type=str, default=None,
+                        help="The generator output (.json or .jsonl). Defaults to the usual path of the task.")
+    parser.add_argument("--output_dir", type=str, default=".", help="The directory of the indexes.")
+    parser.add_argument("--image_root", type=str, default=None, help="The image directory prefixed to image paths.")
+    parser.add_argument("--processes", type=int, default=1, help="Number of processes for .jsonl inputs.")
+    parser.add_argument("--seed", type=int, default=0, help="The seed of the choice order.")
+    args = parser.parse_args()
+
+    start = time.time()
+    counts = extract_index(task or args.task, args.input_path, args.output_dir, args.image_root, args.processes, args.seed)
+    for name, count in counts.items():
+        print(f"{name}: {count} entries")
+    print(f"Done in {time.time() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
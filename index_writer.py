@@ -0,0 +1,154 @@
+import json
+import os
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from serialization import dumps, loads
+
+# Streaming index of generated samples.
+# Records are written as compact JSON lines as soon as a sample is done, instead of being collected in memory and
+# dumped at the end of the run, so memory does not grow with the size of the run. Writes are buffered and fsync'd
+# every few records; finalize() converts the JSONL into the legacy JSON layout (a list, or a dict of sections such
+# as {"shape_section": [...]}) through a temporary file and a rename, so readers never see a half-written index.
+#
+# With sections, every line is a single-key object {section: record}.
+
+WRITE_BUFFER_SIZE = 1 << 16
+FSYNC_EVERY = 64
+
+
+class IndexWriter:
+    def __init__(self, path: str, sections: List[str] = None, append: bool = False, fsync_every: int = FSYNC_EVERY):
+        """
+        :param path: The JSONL file.
+        :param sections: The sections of the legacy layout, e.g. ["shape_section"]. None for a flat list.
+        :param append: If True, keep the records already in the file. Otherwise start a new file.
+        :param fsync_every: fsync the file every fsync_every records (0 to only sync on sync() and close()).
+        """
+        self.path = path
+        self.sections = sections
+        self.fsync_every = fsync_every
+        self.counts: Dict[Optional[str], int] = {section: 0 for section in (sections or [None])}
+        self._pending = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if append and os.path.exists(path):
+            self._count_records()
+        self._file = open(path, "a" if append else "w", buffering=WRITE_BUFFER_SIZE)
+
+    def _count_records(self):
+        for section, _ in self.read():
+            self.counts[section] = self.counts.get(section, 0) + 1
+
+    def __len__(self):
+        return sum(self.counts.values())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, record: Dict[str, Any], section: str = None):
+        """
+        :param record: A JSON-serializable record. numpy scalars and arrays are converted.
+        :param section: The section of the record, required if the writer has sections.
+        """
+        if self.sections is not None:
+            if section not in self.sections:
+                raise ValueError(f"Unknown section {section}, expected one of {self.sections}")
+            record = {section: record}
+        self._file.write(dumps(record) + "\n")
+        self.counts[section] += 1
+        self._pending += 1
+        if self.fsync_every and self._pending >= self.fsync_every:
+            self.sync()
+
+    def sync(self):
+        """
+        Flush the buffered records and fsync them.
+        """
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+
+    def tell(self) -> int:
+        """
+        The size of the file once the buffered records are written, e.g. to record a checkpoint.
+        """
+        self._file.flush()
+        return self._file.tell()
+
+    def truncate(self, size: int):
+        """
+        Drop the records after the first size bytes, e.g. those of a sample that was interrupted.
+        """
+        self.sync()
+        self._file.truncate(size)
+        self._file.seek(size)
+        self.counts = {section: 0 for section in (self.sections or [None])}
+        self._count_records()
+
+    def read(self) -> Iterator[Tuple[Optional[str], Dict[str, Any]]]:
+        """
+        Iterate over the (section, record) pairs written so far. A torn last line is ignored.
+        """
+        if not self._file_closed():
+            self._file.flush()
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    record = loads(line)
+                except ValueError:
+                    break
+                if self.sections is None:
+                    yield None, record
+                else:
+                    (section, record), = record.items()
+                    yield section, record
+
+    def _file_closed(self) -> bool:
+        return not hasattr(self, "_file") or self._file.closed
+
+    def finalize(self, json_path: str, indent: int = 4, ensure_ascii: bool = True):
+        """
+        Write the records in the legacy JSON layout, atomically. The output is the same as json.dump(..., indent=indent)
+        of the whole index, but records are streamed, one section at a time.
+
+        :param json_path: The JSON file.
+        :param indent: The indentation of the JSON file.
+        :param ensure_ascii: As in json.dump.
+        """
+        tmp_path = json_path + ".tmp"
+        with open(tmp_path, "w", buffering=WRITE_BUFFER_SIZE) as f:
+            if self.sections is None:
+                self._write_array(f, None, 0, indent, ensure_ascii)
+            else:
+                f.write("{")
+                for i, section in enumerate(self.sections):
+                    f.write("," if i else "")
+                    f.write("\n" + " " * indent + json.dumps(section, ensure_ascii=ensure_ascii) + ": ")
+                    self._write_array(f, section, indent, indent, ensure_ascii)
+                f.write("\n}" if self.sections else "}")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, json_path)
+
+    def _write_array(self, f, section: Optional[str], level: int, indent: int, ensure_ascii: bool):
+        if not self.counts.get(section):
+            f.write("[]")
+            return
+        prefix = " " * (level + indent)
+        f.write("[")
+        first = True
+        for record_section, record in self.read():
+            if record_section != section:
+                continue
+            text = json.dumps(record, indent=indent, ensure_ascii=ensure_ascii)
+            f.write(("\n" if first else ",\n") + prefix + text.replace("\n", "\n" + prefix))
+            first = False
+        f.write("\n" + " " * level + "]")
+
+    def close(self):
+        if not self._file_closed():
+            self.sync()
+            self._file.close()
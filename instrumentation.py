@@ -0,0 +1,161 @@
+import json
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+
+from serialization import dumps
+
+# Timing of the round trips to the TDW build.
+# attach() wraps controller.communicate so every round trip is recorded, whoever calls it (AbstractTask.step, the
+# generator loops, add-ons, MoveObject...): latency, number of commands, payload and response bytes, images returned.
+# Each round trip is tagged with a phase and with the current sample. The phase is the one set with
+# `with recorder.phase(...)` if any, otherwise it is inferred from the commands (PHASE_COMMANDS, first match in
+# order), or "capture" if the only thing the round trip did was returning images.
+# write() exports per-phase percentiles and latency histograms, and the breakdown of every sample.
+
+PHASE_COMMANDS = {
+    "teardown": ("destroy_all_objects", "destroy_object", "terminate", "unload_asset_bundles"),
+    "scene_load": ("add_scene", "load_scene", "create_exterior_walls", "set_screen_size", "set_render_quality",
+                   "add_hdri_skybox", "set_field_of_view"),
+    "object_add": ("add_object", "add_physics_object", "set_mass", "set_physic_material", "set_kinematic_state"),
+    "material": ("add_material", "set_visual_material", "set_color", "scale_object", "set_texture_scale"),
+    "motion_frame": ("teleport_object", "rotate_object_to", "rotate_object_by", "apply_force", "apply_force_to_object",
+                     "apply_torque_to_object", "set_velocity", "object_look_at", "step_physics", "send_raycast"),
+}
+# Upper bounds of the latency histogram buckets, in milliseconds (None for the last one in the report)
+HISTOGRAM_BUCKETS_MS = [0.25, 0.5, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, float("inf")]
+PERCENTILES = (50, 95, 99)
+IMAGE_DATA_ID = b"imag"
+
+
+def infer_phase(commands: List[Dict[str, Any]], images: int) -> str:
+    """
+    The phase of a round trip from its commands: the first phase of PHASE_COMMANDS one of them belongs to.
+    """
+    types = {command.get("$type") for command in commands if isinstance(command, dict)}
+    for phase, phase_types in PHASE_COMMANDS.items():
+        if not types.isdisjoint(phase_types):
+            return phase
+    return "capture" if images else "other"
+
+
+class RoundTripRecorder:
+    """
+    Records the round trips of a controller. A disabled recorder does nothing, so the calls to phase() and
+    set_sample() can stay in the code.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.start = time.time()
+        self._phase: Optional[str] = None
+        self._sample: Optional[str] = None
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.totals: Dict[str, Dict[str, int]] = defaultdict(lambda: {"commands": 0, "payload_bytes": 0, "response_bytes": 0, "images": 0})
+        self.samples: Dict[str, Dict[str, List[float]]] = defaultdict(lambda: defaultdict(lambda: [0, 0.0]))
+
+    def attach(self, controller):
+        """
+        Wrap controller.communicate. Returns the controller.
+        """
+        if not self.enabled:
+            return controller
+        communicate = controller.communicate
+
+        def timed_communicate(commands: Union[dict, List[dict]]):
+            start = time.perf_counter()
+            resp = communicate(commands)
+            self.record(commands, resp, time.perf_counter() - start)
+            return resp
+
+        controller.communicate = timed_communicate
+        return controller
+
+    @contextmanager
+    def phase(self, name: Optional[str]):
+        """
+        Tag the round trips of the block with a phase. None keeps the current one.
+        """
+        previous = self._phase
+        if name is not None:
+            self._phase = name
+        try:
+            yield
+        finally:
+            self._phase = previous
+
+    def set_sample(self, sample: Any):
+        """
+        Attribute the next round trips to a sample (None for none).
+        """
+        self._sample = None if sample is None else str(sample)
+
+    def record(self, commands: Union[dict, List[dict]], resp: Any, seconds: float):
+        """
+        Record one round trip.
+
+        :param commands: The commands sent.
+        :param resp: The response of the build (a list of bytes).
+        :param seconds: The latency.
+        """
+        if isinstance(commands, dict):
+            commands = [commands]
+        responses = [r for r in resp if isinstance(r, (bytes, bytearray))] if isinstance(resp, list) else []
+        images = sum(1 for r in responses if r[4:8] == IMAGE_DATA_ID)
+        phase = self._phase or infer_phase(commands, images)
+
+        self.latencies[phase].append(seconds)
+        totals = self.totals[phase]
+        totals["commands"] += len(commands)
+        totals["payload_bytes"] += len(dumps(commands))
+        totals["response_bytes"] += sum(len(r) for r in responses)
+        totals["images"] += images
+        if self._sample is not None:
+            breakdown = self.samples[self._sample][phase]
+            breakdown[0] += 1
+            breakdown[1] += seconds
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Per-phase statistics: round trips, total and mean latency, percentiles, histogram and totals.
+        Latencies are in milliseconds.
+        """
+        phases = {}
+        for phase, latencies in self.latencies.items():
+            ms = np.asarray(latencies) * 1000
+            counts, _ = np.histogram(ms, bins=[0] + HISTOGRAM_BUCKETS_MS)
+            phases[phase] = {"round_trips": len(ms), "total_ms": float(ms.sum()), "mean_ms": float(ms.mean()),
+                             **{f"p{q}_ms": float(v) for q, v in zip(PERCENTILES, np.percentile(ms, PERCENTILES))},
+                             "max_ms": float(ms.max()),
+                             "histogram_ms": [[bound if np.isfinite(bound) else None, int(n)]
+                                              for bound, n in zip(HISTOGRAM_BUCKETS_MS, counts) if n],
+                             **self.totals[phase]}
+        return {"wall_s": time.time() - self.start,
+                "round_trips": sum(len(latencies) for latencies in self.latencies.values()),
+                "phases": dict(sorted(phases.items(), key=lambda item: -item[1]["total_ms"]))}
+
+    def write(self, path: str):
+        """
+        Write the summary and the per-sample breakdown ({sample: {phase: {"round_trips", "total_ms"}}}) to a JSON
+        file, atomically. Does nothing if the recorder is disabled or path is None.
+        """
+        if not self.enabled or path is None:
+            return
+        report = self.summary()
+        report["samples"] = {sample: {phase: {"round_trips": n, "total_ms": seconds * 1000} for phase, (n, seconds) in phases.items()}
+                             for sample, phases in self.samples.items()}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump(report, f, indent=4)
+        os.replace(path + ".tmp", path)
+
+    def print_summary(self):
+        if not self.enabled:
+            return
+        for phase, stats in self.summary()["phases"].items():
+            print(f"{phase}: {stats['round_trips']} round trips, {stats['total_ms'] / 1000:.1f}s, "
+                  f"p50 {stats['p50_ms']:.1f}ms, p95 {stats['p95_ms']:.1f}ms, p99 {stats['p99_ms']:.1f}ms")
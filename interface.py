@@ -1,6 +1,9 @@
-from typing import Literal
-from dataclasses import dataclass
-from tdw.librarian import ModelRecord, MaterialLibrarian, ModelLibrarian
+from collections.abc import Mapping
+from typing import TYPE_CHECKING, Literal
+
+if TYPE_CHECKING:
+    # Only for the annotations: the records come from the librarians of the tasks
+    from tdw.librarian import ModelRecord
 
 AVAILABLE_SCENE = ["empty_scene", "box_room_2018", "box_room_4x5", "building_site"]
 # AVAILABLE_OBJECT = [
@@ -70,33 +73,75 @@ AVAILABLE_CAMERA_POS = {
     "front": {"x": 0, "z": -4, "y": 0.2},
     "back": {"x": 0, "z": 4, "y": 0.2},
 }
-@dataclass
+def vector_key(value) -> tuple:
+    """
+    A position or rotation as a hashable tuple: the (axis, value) items of a dict, in their order, or the values.
+    """
+    if isinstance(value, Mapping):
+        return tuple(value.items())
+    return tuple(value)
+
+
 class ObjectType:
+    """
+    An object of a sample. The attributes are slots, and the scale is kept as one number and the color as its name:
+    scale_factor and color, the dicts the TDW commands take, are built when they are read, i.e. when the commands
+    are sent, so that planning many samples does not allocate them for every object.
+    Objects are equal and hash alike if they have the same key(), i.e. they describe the same object whatever their
+    object_id: do not change an object that is a dict key or in a set.
+    """
+    __slots__ = ("model_name", "position", "rotation", "scale", "object_id", "library", "model_record",
+                 "material", "texture_scale", "color_name", "motion")
+
     def __init__(self, model_name:str, 
                  position:dict, 
                  rotation:dict, 
                  scale_factor: float=1, 
                  library:str = "models_core.json",
-                 model_record:ModelRecord = None,
+                 model_record:"ModelRecord" = None,
                  object_id:int = None, 
                  material:str = None,
                  texture_scale:float = 1,
                  color: str = "red",
                  motion: str = "static"):
+        if color not in AVAILABLE_COLOR:
+            raise KeyError(color)
         self.model_name = model_name
         self.position = position
         self.rotation = rotation
-        self.scale_factor = {"x": scale_factor, "y": scale_factor, "z": scale_factor}
+        self.scale = scale_factor
         self.object_id = object_id
         self.library = library
         self.model_record = model_record
         self.material = material
         self.texture_scale = texture_scale
-        self.color = AVAILABLE_COLOR[color]
         self.color_name = color
         self.motion = motion
-        
-        
+
+    @property
+    def scale_factor(self) -> dict:
+        return {"x": self.scale, "y": self.scale, "z": self.scale}
+
+    @property
+    def color(self) -> dict:
+        # Shared with AVAILABLE_COLOR: read it, do not change it
+        return AVAILABLE_COLOR[self.color_name]
+
+    def key(self) -> tuple:
+        """
+        What defines the object, as a hashable tuple: everything but its object_id and model record.
+        """
+        return (self.model_name, self.library, vector_key(self.position), vector_key(self.rotation), self.scale,
+                self.material, self.texture_scale, self.color_name, self.motion)
+
+    def __eq__(self, other):
+        if not isinstance(other, ObjectType):
+            return NotImplemented
+        return self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
     def __str__(self):
         return f"ObjectType(model_name={self.model_name}, library={self.library}, position={self.position}, rotation={self.rotation}, scale_factor={self.scale_factor}, object_id={self.object_id})"
     
@@ -132,8 +177,7 @@ class ObjectType:
         }
 
     def get_size(self):
-        scale_avg = (float(self.scale_factor["x"]) + float(self.scale_factor["y"]) + float(self.scale_factor["z"])) / 3
-        return scale_avg
+        return float(self.scale)
 
 
 
@@ -517,6 +561,7 @@ AvailableMaterialType = Literal[
 ]
 
 if __name__ == "__main__":
+    from tdw.librarian import MaterialLibrarian
     lib = MaterialLibrarian()
     material_types = lib.get_material_types()
     print(material_types[0:3]) # Ceramic
\ No newline at end of file
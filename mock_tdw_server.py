@@ -0,0 +1,441 @@
+import argparse
+import json
+import multiprocessing as mp
+import struct
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import zmq
+from tdw import flatbuffers
+from tdw.FBOutput import Bounds, Collision, ContactPoint, ImagePass, Images, Raycast, Rigidbodies, Transforms, Vector3, Version
+
+# Stand-in for the TDW build, to run the tasks and the generators offline (see benchmarks/bench_tdw_mock.py).
+# It speaks the controller socket protocol: it connects to the port the Controller binds, sends the first message
+# and then answers every list of commands with output data and the frame number, until "terminate", after which it
+# waits for the next Controller on the same port (TemporalPositioning creates one per case).
+# stats() counts the round trips and their bytes, and the time between the first and the last one (elapsed_s).
+# Nothing is simulated: the server only keeps track of what it needs to answer plausibly - the avatars and their
+# pass masks, the image size, the objects and their positions, and the data requested with send_* commands.
+#   send_version                     Version
+#   send_raycast                     Raycast, hitting the floor (y=0) under the origin
+#   send_images / send_collisions    Images, one PNG per pass: a flat background and a square per object, so
+#                                    frames change when objects move
+#   send_collisions                  Collision "enter" between two objects, at collision_rate per frame
+#   send_rigidbodies                 Rigidbodies of all objects, at rest
+#   send_transforms                  Transforms of all objects, at their last position, unrotated
+#   send_bounds                      Bounds of the requested objects, a 1 m cube standing on their position
+# Other output data (segmentation colors...) is never sent; the add-ons do without.
+# The latency of a frame is latency + the command_latency of each of its commands + image_latency per image.
+
+PASS_MASKS = {"_img": 1, "_id": 2, "_category": 4, "_mask": 8, "_depth": 16, "_normals": 32, "_flow": 64,
+              "_depth_simple": 128, "_albedo": 512}
+PNG_EXTENSION = 1
+COLLISION_ENTER = 1
+TDW_VERSION = "1.12.0"
+UNITY_VERSION = "2020.3.24f1"
+# The counters of stats(), shared with the server process
+STAT_FIELDS = ("sessions", "round_trips", "commands", "request_bytes", "response_bytes", "images", "collisions",
+               "raycasts")
+POLL_MS = 100
+
+
+def encode_png(image: np.ndarray) -> bytes:
+    """
+    Encode an RGB image (height, width, 3) as a PNG, with fast compression: the images only have to be valid.
+    """
+    height, width, _ = image.shape
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff)
+
+    rows = np.hstack([np.zeros((height, 1), dtype=np.uint8), image.reshape(height, width * 3)])
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(rows.tobytes(), 1)) + chunk(b"IEND", b""))
+
+
+def finish(builder: flatbuffers.Builder, root: int, identifier: bytes) -> bytes:
+    """
+    Finish a buffer with its 4-byte identifier (b"imag", b"rayc"...), which the controller reads at [4:8].
+    """
+    builder.Prep(builder.minalign, 8)
+    for byte in reversed(identifier):
+        builder.PrependUint8(byte)
+    builder.PrependUOffsetTRelative(root)
+    builder.finished = True
+    return bytes(builder.Output())
+
+
+def version_data() -> bytes:
+    builder = flatbuffers.Builder(64)
+    unity, tdw = builder.CreateString(UNITY_VERSION), builder.CreateString(TDW_VERSION)
+    Version.VersionStart(builder)
+    Version.VersionAddUnity(builder, unity)
+    # Version.VersionAddTdw shadows the tdw module with its argument
+    builder.PrependUOffsetTRelativeSlot(1, tdw, 0)
+    Version.VersionAddStandalone(builder, True)
+    return finish(builder, Version.VersionEnd(builder), b"vers")
+
+
+def raycast_data(raycast_id: int, origin: Dict[str, float]) -> bytes:
+    builder = flatbuffers.Builder(64)
+    Raycast.RaycastStart(builder)
+    Raycast.RaycastAddHit(builder, True)
+    Raycast.RaycastAddHitObject(builder, False)
+    Raycast.RaycastAddRaycastId(builder, raycast_id)
+    Raycast.RaycastAddObjectId(builder, 0)
+    Raycast.RaycastAddNormal(builder, Vector3.CreateVector3(builder, 0, 1, 0))
+    Raycast.RaycastAddPoint(builder, Vector3.CreateVector3(builder, origin.get("x", 0), 0, origin.get("z", 0)))
+    return finish(builder, Raycast.RaycastEnd(builder), b"rayc")
+
+
+def bounds_data(objects: Dict[int, Dict[str, float]]) -> bytes:
+    builder = flatbuffers.Builder(64 + 96 * len(objects))
+    flat = []
+    for p in objects.values():
+        x, y, z = (p.get(k, 0) for k in ("x", "y", "z"))
+        # front, back, right, left, top, bottom, center
+        for point in ((x, y + 0.5, z - 0.5), (x, y + 0.5, z + 0.5), (x + 0.5, y + 0.5, z), (x - 0.5, y + 0.5, z),
+                      (x, y + 1, z), (x, y, z), (x, y + 0.5, z)):
+            flat.extend(point)
+    Bounds.BoundsStartBoundPositionsVector(builder, len(flat))
+    for v in reversed(flat):
+        builder.PrependFloat32(v)
+    positions = builder.EndVector(len(flat))
+    Bounds.BoundsStartIdsVector(builder, len(objects))
+    for object_id in reversed(list(objects)):
+        builder.PrependInt32(object_id)
+    ids = builder.EndVector(len(objects))
+    Bounds.BoundsStart(builder)
+    Bounds.BoundsAddIds(builder, ids)
+    Bounds.BoundsAddBoundPositions(builder, positions)
+    return finish(builder, Bounds.BoundsEnd(builder), b"boun")
+
+
+def images_data(avatar_id: str, width: int, height: int, passes: List[Tuple[int, bytes]]) -> bytes:
+    builder = flatbuffers.Builder(sum(len(image) for _, image in passes) + 256)
+    pass_offsets = []
+    for mask, image in passes:
+        image_offset = builder.CreateByteVector(image)
+        ImagePass.ImagePassStart(builder)
+        ImagePass.ImagePassAddPassMask(builder, mask)
+        ImagePass.ImagePassAddImage(builder, image_offset)
+        ImagePass.ImagePassAddExtension(builder, PNG_EXTENSION)
+        pass_offsets.append(ImagePass.ImagePassEnd(builder))
+    Images.ImagesStartPassesVector(builder, len(pass_offsets))
+    for offset in reversed(pass_offsets):
+        builder.PrependUOffsetTRelative(offset)
+    passes_offset = builder.EndVector(len(pass_offsets))
+    avatar, sensor = builder.CreateString(avatar_id), builder.CreateString("SensorContainer")
+    Images.ImagesStart(builder)
+    Images.ImagesAddAvatarId(builder, avatar)
+    Images.ImagesAddSensorName(builder, sensor)
+    Images.ImagesAddWidth(builder, width)
+    Images.ImagesAddHeight(builder, height)
+    Images.ImagesAddPasses(builder, passes_offset)
+    return finish(builder, Images.ImagesEnd(builder), b"imag")
+
+
+def collision_data(collider_id: int, collidee_id: int, point: Dict[str, float]) -> bytes:
+    builder = flatbuffers.Builder(128)
+    Collision.CollisionStartContactsVector(builder, 1)
+    ContactPoint.CreateContactPoint(builder, 0, 1, 0, point.get("x", 0), point.get("y", 0), point.get("z", 0))
+    contacts = builder.EndVector(1)
+    Collision.CollisionStart(builder)
+    Collision.CollisionAddColliderId(builder, collider_id)
+    Collision.CollisionAddCollideeId(builder, collidee_id)
+    Collision.CollisionAddRelativeVelocity(builder, Vector3.CreateVector3(builder, 0, 0, 0))
+    Collision.CollisionAddImpulse(builder, Vector3.CreateVector3(builder, 0, 0, 0))
+    Collision.CollisionAddState(builder, COLLISION_ENTER)
+    Collision.CollisionAddContacts(builder, contacts)
+    return finish(builder, Collision.CollisionEnd(builder), b"coll")
+
+
+def rigidbodies_data(object_ids: List[int]) -> bytes:
+    builder = flatbuffers.Builder(64 + 32 * len(object_ids))
+    n = len(object_ids)
+    Rigidbodies.RigidbodiesStartSleepingsVector(builder, n)
+    for _ in range(n):
+        builder.PrependBool(True)
+    sleepings = builder.EndVector(n)
+    vectors = []
+    for _ in range(2):
+        # Flat x, y, z floats
+        Rigidbodies.RigidbodiesStartVelocitiesVector(builder, 3 * n)
+        for _ in range(3 * n):
+            builder.PrependFloat32(0)
+        vectors.append(builder.EndVector(3 * n))
+    Rigidbodies.RigidbodiesStartIdsVector(builder, n)
+    for object_id in reversed(object_ids):
+        builder.PrependInt32(object_id)
+    ids = builder.EndVector(n)
+    Rigidbodies.RigidbodiesStart(builder)
+    Rigidbodies.RigidbodiesAddIds(builder, ids)
+    Rigidbodies.RigidbodiesAddVelocities(builder, vectors[0])
+    Rigidbodies.RigidbodiesAddAngularVelocities(builder, vectors[1])
+    Rigidbodies.RigidbodiesAddSleepings(builder, sleepings)
+    return finish(builder, Rigidbodies.RigidbodiesEnd(builder), b"rigi")
+
+
+def transforms_data(objects: Dict[int, Dict[str, float]]) -> bytes:
+    builder = flatbuffers.Builder(64 + 48 * len(objects))
+    n = len(objects)
+    vectors = []
+    # Flat floats: x, y, z positions, x, y, z, w rotations and x, y, z forwards, prepended in reverse
+    for values in ([[p.get(k, 0) for k in ("x", "y", "z")] for p in objects.values()],
+                   [[0, 0, 0, 1]] * n, [[0, 0, 1]] * n):
+        flat = [v for value in values for v in value]
+        builder.StartVector(4, len(flat), 4)
+        for v in reversed(flat):
+            builder.PrependFloat32(v)
+        vectors.append(builder.EndVector(len(flat)))
+    Transforms.TransformsStartIdsVector(builder, n)
+    for object_id in reversed(list(objects)):
+        builder.PrependInt32(object_id)
+    ids = builder.EndVector(n)
+    Transforms.TransformsStart(builder)
+    Transforms.TransformsAddIds(builder, ids)
+    Transforms.TransformsAddPositions(builder, vectors[0])
+    Transforms.TransformsAddRotations(builder, vectors[1])
+    Transforms.TransformsAddForwards(builder, vectors[2])
+    return finish(builder, Transforms.TransformsEnd(builder), b"tran")
+
+
+class MockTDWServer:
+    """
+    A stand-in for the TDW build, in its own process. start() it before creating the Controller, stop() it when done.
+    """
+
+    def __init__(self, port: int = 1071, latency: float = 0.0, command_latency: Dict[str, float] = None,
+                 image_latency: float = 0.0, collision_rate: float = 0.0, host: str = "localhost", seed: int = 0):
+        """
+        :param port: The port of the Controller.
+        :param latency: The latency of every frame, in seconds.
+        :param command_latency: Additional latency per command type, e.g. {"add_object": 0.002}.
+        :param image_latency: Additional latency per image returned.
+        :param collision_rate: The probability that a frame returns a collision, if collisions are requested.
+        :param host: The host of the Controller.
+        :param seed: The seed of the collisions.
+        """
+        self.port = port
+        self.latency = latency
+        self.command_latency = command_latency or {}
+        self.image_latency = image_latency
+        self.collision_rate = collision_rate
+        self.host = host
+        self.seed = seed
+        # The counters, then the time of the first and of the last round trip
+        self._stats = mp.Array("d", len(STAT_FIELDS) + 2, lock=False)
+        self._stop = mp.Event()
+        self._process: Optional[mp.Process] = None
+
+    def start(self) -> "MockTDWServer":
+        self._stop.clear()
+        self._process = mp.Process(target=self._serve, daemon=True)
+        self._process.start()
+        return self
+
+    def stop(self):
+        if self._process is None:
+            return
+        self._stop.set()
+        self._process.join(timeout=5)
+        if self._process.is_alive():
+            self._process.terminate()
+        self._process = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {field: int(value) for field, value in zip(STAT_FIELDS, self._stats)}
+        first, last = self._stats[len(STAT_FIELDS):]
+        stats["elapsed_s"] = last - first
+        return stats
+
+    def _count(self, field: str, n: int = 1):
+        self._stats[STAT_FIELDS.index(field)] += n
+
+    def _serve(self):
+        context = zmq.Context()
+        rng = np.random.default_rng(self.seed)
+        while not self._stop.is_set():
+            socket = context.socket(zmq.REQ)
+            socket.setsockopt(zmq.LINGER, 0)
+            socket.connect(f"tcp://{self.host}:{self.port}")
+            # The first message goes to the socket of the previous Controller if it is still bound: when that socket
+            # is closed, connect again
+            monitor = socket.get_monitor_socket(zmq.EVENT_DISCONNECTED)
+            socket.send(b"ready")
+            session = _Session(self, rng)
+            while not self._stop.is_set() and not session.terminated:
+                if session.frame == 0 and monitor.poll(0):
+                    break
+                if not socket.poll(POLL_MS):
+                    continue
+                message = socket.recv_multipart()
+                if session.frame == 0:
+                    self._count("sessions")
+                commands = json.loads(message[0])
+                start = time.perf_counter()
+                frames = session.handle(commands)
+                delay = self.latency + sum(self.command_latency.get(command.get("$type"), 0) for command in commands)
+                delay += self.image_latency * session.images_sent
+                elapsed = time.perf_counter() - start
+                if delay > elapsed:
+                    time.sleep(delay - elapsed)
+                frames.append(session.frame.to_bytes(4, "big"))
+                socket.send_multipart(frames)
+                now = time.time()
+                if not self._stats[len(STAT_FIELDS)]:
+                    self._stats[len(STAT_FIELDS)] = now
+                self._stats[len(STAT_FIELDS) + 1] = now
+                self._count("round_trips")
+                self._count("commands", len(commands))
+                self._count("request_bytes", len(message[0]))
+                self._count("response_bytes", sum(len(frame) for frame in frames))
+            socket.disable_monitor()
+            monitor.close()
+            socket.close()
+        context.term()
+
+
+class _Session:
+    """
+    The state of the "build" between a Controller's first message and terminate.
+    """
+
+    def __init__(self, server: MockTDWServer, rng: np.random.Generator):
+        self.server = server
+        self.rng = rng
+        self.frame = 0
+        self.terminated = False
+        self.width, self.height = 256, 256
+        self.pass_masks: Dict[str, List[str]] = {}
+        self.send_images: Dict[str, Any] = {"frequency": "never", "ids": None}
+        self.send_collisions = False
+        self.send_rigidbodies = "never"
+        self.send_transforms = "never"
+        self.objects: Dict[int, Dict[str, float]] = {}
+        self.images_sent = 0
+        self._png_cache: Dict[Tuple, bytes] = {}
+
+    def handle(self, commands: List[Dict[str, Any]]) -> List[bytes]:
+        frames = []
+        images_once = False
+        rigidbodies_once = False
+        transforms_once = False
+        for command in commands:
+            kind = command.get("$type")
+            if kind == "send_version":
+                frames.append(version_data())
+            elif kind == "terminate":
+                self.terminated = True
+            elif kind == "set_screen_size":
+                self.width, self.height = command.get("width", self.width), command.get("height", self.height)
+            elif kind in ("create_avatar", "set_pass_masks"):
+                avatar_id = command.get("id", command.get("avatar_id", "a"))
+                self.pass_masks.setdefault(avatar_id, ["_img"])
+                if kind == "set_pass_masks":
+                    self.pass_masks[avatar_id] = command.get("pass_masks", ["_img"])
+            elif kind == "destroy_avatar":
+                self.pass_masks.pop(command.get("id", command.get("avatar_id")), None)
+            elif kind == "send_images":
+                self.send_images = {"frequency": command.get("frequency", "once"), "ids": command.get("ids")}
+                images_once = images_once or self.send_images["frequency"] == "once"
+            elif kind == "send_collisions":
+                self.send_collisions = command.get("enter", True) or command.get("stay", False)
+            elif kind == "send_rigidbodies":
+                self.send_rigidbodies = command.get("frequency", "once")
+                rigidbodies_once = rigidbodies_once or self.send_rigidbodies == "once"
+            elif kind == "send_transforms":
+                self.send_transforms = command.get("frequency", "once")
+                transforms_once = transforms_once or self.send_transforms == "once"
+            elif kind in ("add_object", "add_physics_object"):
+                self.objects[command["id"]] = dict(command.get("position", {}))
+            elif kind == "teleport_object" and command.get("id") in self.objects:
+                self.objects[command["id"]] = dict(command.get("position", {}))
+            elif kind == "destroy_object":
+                self.objects.pop(command.get("id"), None)
+            elif kind == "destroy_all_objects":
+                self.objects.clear()
+            elif kind == "send_bounds":
+                ids = command.get("ids") or list(self.objects)
+                frames.append(bounds_data({i: self.objects[i] for i in ids if i in self.objects}))
+            elif kind == "send_raycast":
+                frames.append(raycast_data(command.get("id", 0), command.get("origin", {})))
+                self.server._count("raycasts")
+
+        self.images_sent = 0
+        if images_once or self.send_images["frequency"] == "always":
+            frames.extend(self._images())
+        if self.send_collisions and len(self.objects) > 1 and self.rng.random() < self.server.collision_rate:
+            collider, collidee = list(self.objects)[:2]
+            frames.append(collision_data(collider, collidee, self.objects[collider]))
+            self.server._count("collisions")
+        if rigidbodies_once or self.send_rigidbodies == "always":
+            frames.append(rigidbodies_data(list(self.objects)))
+        if transforms_once or self.send_transforms == "always":
+            frames.append(transforms_data(self.objects))
+        if self.send_images["frequency"] == "once":
+            self.send_images["frequency"] = "never"
+        if self.send_rigidbodies == "once":
+            self.send_rigidbodies = "never"
+        if self.send_transforms == "once":
+            self.send_transforms = "never"
+        self.frame += 1
+        return frames
+
+    def _images(self) -> List[bytes]:
+        ids = self.send_images["ids"] or list(self.pass_masks)
+        layout = tuple(sorted((object_id, round(p.get("x", 0), 3), round(p.get("z", 0), 3))
+                              for object_id, p in self.objects.items()))
+        frames = []
+        for avatar_id in ids:
+            passes = [(PASS_MASKS.get(mask, 1), self._png(avatar_id, mask, layout))
+                      for mask in self.pass_masks.get(avatar_id, ["_img"])]
+            frames.append(images_data(avatar_id, self.width, self.height, passes))
+            self.images_sent += len(passes)
+        self.server._count("images", self.images_sent)
+        return frames
+
+    def _png(self, avatar_id: str, mask: str, layout: Tuple) -> bytes:
+        key = (avatar_id, mask, self.width, self.height, layout)
+        if key not in self._png_cache:
+            if len(self._png_cache) > 1024:
+                self._png_cache.clear()
+            shade = zlib.crc32(f"{avatar_id}{mask}".encode()) % 128 + 64
+            image = np.full((self.height, self.width, 3), shade, dtype=np.uint8)
+            size = max(self.width // 16, 1)
+            for object_id, x, z in layout:
+                # The floor around the origin, from above
+                u = int(np.clip((x + 2) / 4, 0, 1) * (self.width - size))
+                v = int(np.clip((z + 2) / 4, 0, 1) * (self.height - size))
+                image[v:v + size, u:u + size] = (object_id * 2654435761) % 256
+            self._png_cache[key] = encode_png(image)
+        return self._png_cache[key]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=1071)
+    parser.add_argument("--latency", type=float, default=0.0, help="The latency of every frame, in seconds.")
+    parser.add_argument("--command_latency", type=str, default="{}",
+                        help='Additional latency per command type, as JSON, e.g. \'{"add_object": 0.002}\'.')
+    parser.add_argument("--image_latency", type=float, default=0.0, help="Additional latency per image.")
+    parser.add_argument("--collision_rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = MockTDWServer(port=args.port, latency=args.latency, command_latency=json.loads(args.command_latency),
+                           image_latency=args.image_latency, collision_rate=args.collision_rate).start()
+    print(f"Mock TDW server on port {args.port}, Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(10)
+            print(server.stats())
+    except KeyboardInterrupt:
+        server.stop()
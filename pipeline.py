@@ -0,0 +1,161 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+from tdw.add_ons.image_capture import ImageCapture
+from tdw.output_data import Images, OutputData
+from tdw.tdw_utils import TDWUtils
+
+# Pipelined execution of samples.
+# A sample goes through three stages, connected by bounded queues:
+#   plan     objects, spec, render cache lookup... Python only, no controller
+#   render   the round trips with the build, on a single thread since the controller is not thread-safe
+#   persist  writing the images and the render cache entry, in a pool of threads
+# and is then committed on the event loop, in the order of the items (index records, progress bar...).
+# With depth=1, sample N+2 is planned while N+1 is rendered and N is persisted, so the build does not wait for
+# Python between samples: render_idle_s in the stats of run() is the time the render stage waited for a plan.
+# The stages run on different threads: plan must not use the global random state (np.random, random), but a
+# generator of its own, e.g. np.random.RandomState(seed), which draws the same numbers as np.random.seed(seed).
+# depth=0 runs every stage serially on the calling thread.
+
+DONE = object()
+
+
+class DeferredImageCapture(ImageCapture):
+    """
+    An ImageCapture that keeps the images of each frame instead of writing them in communicate().
+    The render stage pops them with pop_pending(), the persist stage writes them with save_images().
+    With on_demand=True, images are only captured on the first frame and on the frames request() was called before.
+    """
+
+    def __init__(self, *args, on_demand: bool = False, **kwargs):
+        super().__init__(*args, **kwargs)
+        # (directory, filename, images), in the order of the frames
+        self.pending: List[Tuple[str, str, Images]] = []
+        self.on_demand = on_demand
+
+    def on_send(self, resp: List[bytes]) -> None:
+        got_images = False
+        self.images.clear()
+        for i in range(len(resp) - 1):
+            if OutputData.get_data_type_id(resp[i]) == "imag":
+                images = Images(resp[i])
+                avatar_id = images.get_avatar_id()
+                self.images[avatar_id] = images
+                if self._save and (len(self.avatar_ids) == 0 or avatar_id in self.avatar_ids):
+                    self.pending.append((str(self.path.joinpath(avatar_id)), TDWUtils.zero_padding(self.frame, 4), images))
+                    got_images = True
+        if got_images:
+            self.frame += 1
+        if self._frequency == "always" and not self.on_demand:
+            self.commands.append({"$type": "send_images", "frequency": "once", "ids": self.avatar_ids})
+
+    def request(self):
+        """
+        Capture images on the next frame.
+        """
+        # The initialization commands already capture the first frame
+        if self.initialized:
+            self.commands.append({"$type": "send_images", "frequency": "once", "ids": self.avatar_ids})
+
+    def pop_pending(self) -> List[Tuple[str, str, Images]]:
+        pending, self.pending = self.pending, []
+        return pending
+
+    @staticmethod
+    def save_images(pending: List[Tuple[str, str, Images]]):
+        """
+        Write images popped with pop_pending(), with the names ImageCapture gives them.
+        """
+        for directory, filename, images in pending:
+            TDWUtils.save_images(images=images, output_directory=directory, filename=filename)
+
+
+class SamplePipeline:
+    def __init__(self, plan: Callable[[Any], Any], render: Callable[[Any], Any], persist: Callable[[Any], Any] = None,
+                 commit: Callable[[Any], None] = None, depth: int = 1, persist_workers: int = 2):
+        """
+        :param plan: item -> planned sample.
+        :param render: planned sample -> rendered sample. The only stage that may use the controller.
+        :param persist: rendered sample -> persisted sample. None to skip the stage.
+        :param commit: Called with each persisted sample, in the order of the items.
+        :param depth: The number of samples that can wait between two stages. 0 to run serially.
+        :param persist_workers: The number of threads of the persist stage.
+        """
+        self.plan = plan
+        self.render = render
+        self.persist = persist or (lambda sample: sample)
+        self.commit = commit or (lambda sample: None)
+        self.depth = depth
+        self.persist_workers = persist_workers
+
+    def run(self, items: Iterable[Any]) -> Dict[str, float]:
+        """
+        Run the items through the stages.
+
+        :return: The number of samples and the time spent in each stage, in seconds.
+        """
+        stats = {"samples": 0, "wall_s": 0.0, "plan_s": 0.0, "render_s": 0.0, "persist_s": 0.0, "render_idle_s": 0.0}
+        start = time.perf_counter()
+        if self.depth > 0:
+            asyncio.run(self._run(items, stats))
+        else:
+            for item in items:
+                self.commit(self._timed(stats, "persist_s", self.persist,
+                                        self._timed(stats, "render_s", self.render,
+                                                    self._timed(stats, "plan_s", self.plan, item))))
+                stats["samples"] += 1
+        stats["wall_s"] = time.perf_counter() - start
+        return stats
+
+    @staticmethod
+    def _timed(stats: Dict[str, float], key: str, function: Callable[[Any], Any], value: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            return function(value)
+        finally:
+            stats[key] += time.perf_counter() - start
+
+    async def _run(self, items: Iterable[Any], stats: Dict[str, float]):
+        loop = asyncio.get_running_loop()
+        planned = asyncio.Queue(self.depth)
+        rendered = asyncio.Queue(self.depth)
+
+        with ThreadPoolExecutor(1, "plan") as plan_pool, ThreadPoolExecutor(1, "render") as render_pool, \
+                ThreadPoolExecutor(self.persist_workers, "persist") as persist_pool:
+
+            async def plan_stage():
+                for item in items:
+                    await planned.put(await loop.run_in_executor(plan_pool, self._timed, stats, "plan_s", self.plan, item))
+                await planned.put(DONE)
+
+            async def render_stage():
+                rendered_at = None
+                while True:
+                    sample = await planned.get()
+                    if sample is DONE:
+                        break
+                    if rendered_at is not None:
+                        stats["render_idle_s"] += time.perf_counter() - rendered_at
+                    sample = await loop.run_in_executor(render_pool, self._timed, stats, "render_s", self.render, sample)
+                    rendered_at = time.perf_counter()
+                    # Persisted as soon as rendered, committed in order
+                    await rendered.put(loop.run_in_executor(persist_pool, self._timed, stats, "persist_s", self.persist, sample))
+                await rendered.put(DONE)
+
+            async def commit_stage():
+                while True:
+                    future = await rendered.get()
+                    if future is DONE:
+                        break
+                    self.commit(await future)
+                    stats["samples"] += 1
+
+            tasks = [asyncio.create_task(stage()) for stage in (plan_stage, render_stage, commit_stage)]
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                raise
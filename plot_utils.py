@@ -1,29 +1,24 @@
 from typing import List
 
-import matplotlib.pyplot as plt
 import numpy as np
-from IPython.display import HTML, display
-from matplotlib import animation
 
 import glob
 import os
 import sys
 import shutil
 import random
-import cv2
 import time
 
 #in synchronous mode, sensor data must be added to a queue
 import queue
-import matplotlib.pyplot as plt
-from PIL import Image
-import numpy as np
 import math
 import json
-import random
-from multiprocessing import Pool
+
+# matplotlib, IPython, cv2, PIL and multiprocessing are imported by the functions that use them: the video and image
+# helpers are used from scripts and worker processes that never plot
 
 def display_images(frames, instruction=""):
+    import matplotlib.pyplot as plt
     num_frames = len(frames)
     col_size = 6
     if(len(frames) < col_size):
@@ -43,6 +38,7 @@ def display_images(frames, instruction=""):
     plt.show()
 
 def carlaImage_postprocess(images):
+    from PIL import Image
     new_images = []
     for image in images:
         image = np.reshape(np.copy(image.raw_data),(image.height,image.width,4))[:, :, :3]
@@ -50,6 +46,7 @@ def carlaImage_postprocess(images):
     return new_images
 
 def generate_video(video_name, images, fps=10, color_change=True):
+    import cv2
     images = images
     end_length = len(images) #int((len(images)//fps)*fps)
     for i,image in enumerate(images):
@@ -74,6 +71,7 @@ def generate_video(video_name, images, fps=10, color_change=True):
     cv2.destroyAllWindows()
 
 def generate_video_from_ticks(image_dir, tick_start, tick_end, fps=10, color_change=True, car_id=0, render_mode=""):
+    import cv2
 
     images = get_images_from_ticks(image_dir, tick_start, tick_end, car_id=car_id, render_mode=render_mode)
 
@@ -98,6 +96,7 @@ def generate_video_from_ticks(image_dir, tick_start, tick_end, fps=10, color_cha
     return video_name
 
 def get_images_from_ticks(image_dir, tick_start, tick_end, car_id=0, render_mode=""):
+    from PIL import Image
     images = []
     for i in range(tick_start, tick_end+1):
         if(render_mode == "topdown"):
@@ -111,6 +110,7 @@ def get_images_from_ticks(image_dir, tick_start, tick_end, car_id=0, render_mode
     return images
 
 def write_images_to_video(paths, video_name, fps=10, color_change=True):
+    from PIL import Image
     images = []
     for path in paths:
         if(os.path.exists(path)):
@@ -156,6 +156,9 @@ def display_images_inVideo(images: List[np.ndarray], dpi=100.0, format="html5_vi
         http://louistiao.me/posts/notebooks/embedding-matplotlib-animations-in-jupyter-as-interactive-javascript-widgets/
         https://stackoverflow.com/questions/35532498/animation-in-ipython-notebook/46878531#46878531
     """
+    import matplotlib.pyplot as plt
+    from IPython.display import HTML, display
+    from matplotlib import animation
     h, w = images[0].shape[:2]
     fig = plt.figure(figsize=(h / dpi, w / dpi), dpi=dpi)
     fig_im = plt.figimage(images[0])
@@ -176,6 +179,7 @@ def display_images_inVideo(images: List[np.ndarray], dpi=100.0, format="html5_vi
     plt.close(fig)
 
 def save_image(info):
+    from PIL import Image
     image, path = info
     if(type(image) is not Image.Image):
         image = Image.fromarray((image* 255).astype(np.uint8))
@@ -186,6 +190,7 @@ def image_save_generator(images, image_dir):
         yield image, os.path.join(image_dir, f"image_{i}.png")
 
 def save_images_pararell(images, image_dir):
+    from multiprocessing import Pool
     os.makedirs(image_dir, exist_ok=True)
     # Number of processes
     num_processes = 16
@@ -197,6 +202,7 @@ def save_images_pararell(images, image_dir):
             pass
 
 def select_even_frames(img_dir, output_folder, num_samples=6):
+    from PIL import Image
 
     # Create the output folder if it does not exist
     if not os.path.exists(output_folder):
@@ -232,6 +238,8 @@ def select_even_frames(img_dir, output_folder, num_samples=6):
     return saved_names
 
 def extract_even_frames_from_video(video_path, output_folder, num_samples=6):
+    import cv2
+    from PIL import Image
     # Create the output folder if it does not exist
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
@@ -0,0 +1,328 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import shutil
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from catalog import describe_record
+from index_extractor import iter_json_records, iter_jsonl_records
+from index_writer import IndexWriter
+
+# Quality gate of a generator run, run after rendering.
+# Every frame referenced by the index is decoded once, in grayscale, by a pool of processes, which return a few
+# statistics instead of the image: mean, standard deviation, a 16-bin histogram, the hash of the file, a 64-bit
+# difference hash and a 32x32 thumbnail. The checks are then vectorized over the thumbnails:
+#   - blank: black or flat frames (low mean, low deviation, or one histogram bin with almost all the pixels),
+#   - unreadable: missing or undecodable files,
+#   - duplicate: a frame (or sequence) byte-identical to one of another sample (e.g. a stale image copied again),
+#   - duplicate_frames: two near-identical frames in one sample (e.g. identical candidates in temporal tasks),
+#   - out_of_frame: the frame barely differs from the background of its scene and camera, the median of the
+#     thumbnails of the run (objects out of view),
+#   - static: no difference between consecutive frames of a sequence (the objects did not move).
+# The report is written next to the index; with quarantine, the frames of the flagged samples are moved out of the
+# run, their records appended to an index of their own and removed from the index of the run (and from its legacy
+# JSON, finalized again), so that the readers of the run and a rerun of the gate only see the frames left.
+
+THUMB_SIZE = 32
+HASH_SIZE = 8
+HIST_BINS = 16
+SCAN_CHUNK_SIZE = 64
+MIN_BACKGROUND_FRAMES = 32
+MAX_BACKGROUND_FRAMES = 256
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+QUARANTINE_DIR = "quarantine"
+
+DEFAULT_THRESHOLDS = {
+    "dark_mean": 8.0,  # Mean gray level under which a frame is black
+    "flat_std": 2.0,  # Standard deviation under which a frame is flat
+    "peak_fraction": 0.98,  # Fraction of the pixels in one histogram bin above which a frame is flat
+    "duplicate_bits": 2,  # Difference hash distance (in bits) of near-identical frames
+    "duplicate_diff": 1.0,  # Mean absolute thumbnail difference of near-identical frames
+    "foreground_diff": 12.0,  # Gray level difference to the background of a foreground pixel
+    "min_foreground": 0.002,  # Fraction of foreground pixels under which the objects are out of frame
+    "static_diff": 0.5,  # Mean absolute difference of consecutive frames under which a sequence is static
+}
+
+
+def frame_stats(gray: np.ndarray) -> Dict[str, Any]:
+    """
+    The statistics of a grayscale frame.
+    """
+    hist = np.bincount(gray.ravel() // (256 // HIST_BINS), minlength=HIST_BINS)
+    small = cv2.resize(gray, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA)
+    return {"mean": float(gray.mean()),
+            "std": float(gray.std()),
+            "peak": float(hist.max() / gray.size),
+            "dhash": int.from_bytes(np.packbits(small[:, 1:] > small[:, :-1]).tobytes(), "big"),
+            "thumb": cv2.resize(gray, (THUMB_SIZE, THUMB_SIZE), interpolation=cv2.INTER_AREA)}
+
+
+def image_stats(path: str) -> Optional[Dict[str, Any]]:
+    """
+    The statistics of an image file (see frame_stats) and its hash. None if it cannot be read.
+    """
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    gray = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        return None
+    stats = frame_stats(gray)
+    stats["digest"] = hashlib.blake2b(data, digest_size=16).hexdigest()
+    return stats
+
+
+def _scan_chunk(paths: List[str]) -> List[Optional[Dict[str, Any]]]:
+    return [image_stats(path) for path in paths]
+
+
+def scan(paths: List[str], processes: int = 1) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    The statistics of every image, decoded by a pool of processes.
+    """
+    chunks = [paths[i:i + SCAN_CHUNK_SIZE] for i in range(0, len(paths), SCAN_CHUNK_SIZE)]
+    if processes > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            results = executor.map(_scan_chunk, chunks)
+            return {path: stats for chunk, chunk_stats in zip(chunks, results) for path, stats in zip(chunk, chunk_stats)}
+    return {path: stats for chunk in chunks for path, stats in zip(chunk, _scan_chunk(chunk))}
+
+
+def load_samples(index_path: str) -> List[Dict[str, Any]]:
+    """
+    The samples of an index and their frames. Relative paths are relative to the directory of the index; a
+    directory (source_dir of the attribute tasks, the scenario folder of the video tasks) is a sequence of frames.
+
+    :return: [{"section", "position", "record", "group": (scene, camera), "frames": [path], "sequence": bool}]
+    """
+    root = os.path.dirname(os.path.abspath(index_path))
+    records = iter_jsonl_records(index_path) if index_path.endswith(".jsonl") else iter_json_records(index_path)
+    samples = []
+    positions = defaultdict(int)
+    for section, record in records:
+        info = describe_record(record)
+        frames, sequence = [], False
+        for _, path in info["frames"]:
+            path = path if os.path.isabs(path) else os.path.join(root, path)
+            if os.path.isdir(path):
+                frames.extend(sorted(p for p in glob.glob(os.path.join(path, "*")) if p.lower().endswith(IMAGE_EXTENSIONS)))
+                sequence = True
+            elif path.lower().endswith(IMAGE_EXTENSIONS):
+                frames.append(path)
+        samples.append({"section": section, "position": positions[section], "record": record,
+                        "group": (info["scene"], info["cameras"][0] if info["cameras"] else None),
+                        "frames": frames, "sequence": sequence})
+        positions[section] += 1
+    return samples
+
+
+def _hamming(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return np.unpackbits((a ^ b).view(np.uint8).reshape(a.shape + (8,)), axis=-1).sum(axis=-1)
+
+
+def check_frames(stats: Dict[str, Optional[Dict[str, Any]]], samples: List[Dict[str, Any]],
+                 thresholds: Dict[str, float]) -> Dict[str, List[str]]:
+    """
+    The frame-level flags: unreadable, blank, duplicate and out_of_frame.
+
+    :return: {path: [flag]}
+    """
+    flags = defaultdict(list)
+    for path, frame in stats.items():
+        if frame is None:
+            flags[path].append("unreadable")
+        elif (frame["mean"] < thresholds["dark_mean"] or frame["std"] < thresholds["flat_std"]
+              or frame["peak"] > thresholds["peak_fraction"]):
+            flags[path].append("blank")
+
+    # Byte-identical files of different samples. A sequence is compared as a whole: its first frames can be the
+    # same setup in several samples. The same file referenced by several records (sections) is not a duplicate.
+    units = defaultdict(lambda: defaultdict(set))
+    for i, sample in enumerate(samples):
+        readable = [path for path in sample["frames"] if stats.get(path) is not None]
+        if sample["sequence"] and readable:
+            digest = hashlib.blake2b("".join(stats[path]["digest"] for path in readable).encode("utf-8"), digest_size=16).hexdigest()
+            units[digest][tuple(readable)].add(i)
+        else:
+            for path in readable:
+                units[stats[path]["digest"]][(path,)].add(i)
+    for same in units.values():
+        if len(same) > 1 and len(set.union(*same.values())) > 1:
+            for unit in same:
+                for path in unit:
+                    if "duplicate" not in flags[path]:
+                        flags[path].append("duplicate")
+
+    # Foreground against the median background of every scene and camera
+    groups = defaultdict(set)
+    for sample in samples:
+        groups[sample["group"]].update(path for path in sample["frames"] if stats.get(path) is not None)
+    for paths in groups.values():
+        if len(paths) < MIN_BACKGROUND_FRAMES:
+            continue
+        paths = sorted(paths)
+        thumbs = np.stack([stats[path]["thumb"] for path in paths]).astype(np.float32)
+        step = max(1, len(paths) // MAX_BACKGROUND_FRAMES)
+        background = np.median(thumbs[::step], axis=0)
+        foreground = (np.abs(thumbs - background) > thresholds["foreground_diff"]).mean(axis=(1, 2))
+        for path, fraction in zip(paths, foreground):
+            if fraction < thresholds["min_foreground"]:
+                flags[path].append("out_of_frame")
+    return flags
+
+
+def check_sample(sample: Dict[str, Any], stats: Dict[str, Optional[Dict[str, Any]]],
+                 frame_flags: Dict[str, List[str]], thresholds: Dict[str, float]) -> Dict[str, List[str]]:
+    """
+    The flags of a sample: the flags of its frames, duplicate_frames and static.
+
+    :return: {flag: [path]}
+    """
+    flags = defaultdict(list)
+    if not sample["frames"]:
+        # Missing image, or an empty frame directory
+        flags["unreadable"] = []
+    for path in sample["frames"]:
+        for flag in frame_flags.get(path, []):
+            if flag != "out_of_frame":
+                flags[flag].append(path)
+    # A sequence is out of frame if all its frames are, a single image if any is
+    out = [path for path in sample["frames"] if "out_of_frame" in frame_flags.get(path, [])]
+    if out and (not sample["sequence"] or len(out) == len(sample["frames"])):
+        flags["out_of_frame"] = out
+
+    paths = [path for path in sample["frames"] if stats.get(path) is not None]
+    if len(paths) < 2:
+        return flags
+    thumbs = np.stack([stats[path]["thumb"] for path in paths]).astype(np.float32)
+    if sample["sequence"]:
+        motion = np.abs(np.diff(thumbs, axis=0)).mean(axis=(1, 2))
+        if motion.max() < thresholds["static_diff"]:
+            flags["static"] = paths
+    else:
+        hashes = np.array([stats[path]["dhash"] for path in paths], dtype=np.uint64)
+        i, j = np.triu_indices(len(paths), k=1)
+        near = ((_hamming(hashes[i], hashes[j]) <= thresholds["duplicate_bits"])
+                & (np.abs(thumbs[i] - thumbs[j]).mean(axis=(1, 2)) < thresholds["duplicate_diff"]))
+        if near.any():
+            flags["duplicate_frames"] = sorted({paths[k] for k in np.concatenate([i[near], j[near]])})
+    return flags
+
+
+def rewrite_index(index_path: str, samples: List[Dict[str, Any]], dropped: List[Dict[str, Any]]):
+    """
+    Rewrite the index without the dropped samples, through a temporary file and a rename. The legacy JSON of a JSONL
+    index (<index name>.json), if there is one, is finalized again.
+    """
+    dropped_ids = {id(sample) for sample in dropped}
+    # The sections keep their order, and stay in the legacy layout even if all their records are dropped
+    sections = list(dict.fromkeys(sample["section"] for sample in samples if sample["section"] is not None)) or None
+    base = os.path.splitext(index_path)[0]
+    json_path = base + ".json"
+    tmp_path = base + ".jsonl.tmp"
+    with IndexWriter(tmp_path, sections=sections, fsync_every=0) as writer:
+        for sample in samples:
+            if id(sample) not in dropped_ids:
+                writer.write(sample["record"], section=sample["section"])
+        if os.path.exists(json_path):
+            writer.finalize(json_path)
+    if index_path.endswith(".jsonl"):
+        os.replace(tmp_path, index_path)
+    else:
+        os.remove(tmp_path)
+
+
+def quarantine(index_path: str, flagged: List[Dict[str, Any]], samples: List[Dict[str, Any]]) -> str:
+    """
+    Move the frames of the flagged samples to the quarantine directory next to the index (keeping their relative
+    paths), append their records to quarantine/<index name>.jsonl and remove them from the index.
+
+    :return: The index of the quarantined records.
+    """
+    root = os.path.dirname(os.path.abspath(index_path))
+    quarantine_root = os.path.join(root, QUARANTINE_DIR)
+    sections = sorted({sample["section"] for sample in flagged if sample["section"] is not None}) or None
+    name = os.path.splitext(os.path.basename(index_path))[0]
+    moved = set()
+    # Appended to: the records quarantined by an earlier run of the gate stay with their frames
+    with IndexWriter(os.path.join(quarantine_root, name + ".jsonl"), sections=sections, append=True) as writer:
+        for sample in flagged:
+            writer.write(sample["record"], section=sample["section"])
+            for path in sample["frames"]:
+                if path in moved or not os.path.exists(path):
+                    continue
+                relative = os.path.relpath(path, root)
+                destination = os.path.join(quarantine_root, relative if not relative.startswith("..") else os.path.basename(path))
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                shutil.move(path, destination)
+                moved.add(path)
+    rewrite_index(index_path, samples, flagged)
+    return writer.path
+
+
+def run_gate(index_path: str, processes: int = 1, thresholds: Dict[str, float] = None,
+             move: bool = False) -> Dict[str, Any]:
+    """
+    Check the frames of a run and write the report next to its index (<index name>_quality.json).
+
+    :param index_path: The index of the run (.json or .jsonl).
+    :param processes: The number of processes that decode the frames.
+    :param thresholds: Overrides of DEFAULT_THRESHOLDS.
+    :param move: If True, quarantine the flagged samples.
+    :return: The report.
+    """
+    thresholds = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+    samples = load_samples(index_path)
+    paths = sorted({path for sample in samples for path in sample["frames"]})
+    stats = scan(paths, processes)
+    frame_flags = check_frames(stats, samples, thresholds)
+
+    counts = defaultdict(int)
+    entries, flagged = [], []
+    for sample in samples:
+        flags = check_sample(sample, stats, frame_flags, thresholds)
+        if not flags:
+            continue
+        flagged.append(sample)
+        for flag in flags:
+            counts[flag] += 1
+        entries.append({"section": sample["section"], "position": sample["position"],
+                        "image_path": sample["record"].get("image_path"),
+                        "flags": {flag: [os.path.relpath(path, os.path.dirname(os.path.abspath(index_path))) for path in flag_paths]
+                                  for flag, flag_paths in flags.items()}})
+
+    report = {"index": os.path.abspath(index_path), "samples": len(samples), "frames": len(paths),
+              "flagged_samples": len(flagged), "flags": dict(counts), "thresholds": thresholds, "entries": entries}
+    if move and flagged:
+        report["quarantine"] = quarantine(index_path, flagged, samples)
+    report_path = os.path.splitext(index_path)[0] + "_quality.json"
+    with open(report_path + ".tmp", "w") as f:
+        json.dump(report, f, indent=4)
+    os.replace(report_path + ".tmp", report_path)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Flag blank, duplicate and out-of-frame samples of a generator run.")
+    parser.add_argument("index_path", type=str, help="The index of the run (.json or .jsonl).")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="Number of processes decoding the frames.")
+    parser.add_argument("--quarantine", action="store_true", help="Move the flagged samples to the quarantine directory.")
+    for key, value in DEFAULT_THRESHOLDS.items():
+        parser.add_argument(f"--{key}", type=type(value), default=value, help=f"Threshold (default {value}).")
+    args = parser.parse_args()
+
+    start = time.time()
+    report = run_gate(args.index_path, args.processes, {key: getattr(args, key) for key in DEFAULT_THRESHOLDS},
+                      move=args.quarantine)
+    print(f"{report['flagged_samples']}/{report['samples']} samples flagged ({report['frames']} frames): {report['flags']}")
+    print(f"Done in {time.time() - start:.2f}s")
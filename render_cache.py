@@ -0,0 +1,208 @@
+import hashlib
+import json
+import os
+import shutil
+from collections.abc import Mapping, Sequence
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from interface import ObjectType
+
+# Content-addressed cache of rendered samples.
+# A sample is described by a canonical spec (scene, objects, cameras, screen size, render quality, generator
+# version and whatever else drives the simulation). Its hash names a directory in the cache holding the rendered
+# files and a manifest. On a rerun, a sample whose spec is unchanged is hard-linked (or copied, across file systems)
+# into the new output instead of being rendered again, so changing one factor only re-renders the affected cells.
+
+CACHE_DIR_NAME = ".render_cache"
+MANIFEST_NAME = "manifest.json"
+FLOAT_DIGITS = 6
+# The canonical specs of the objects, by ObjectType.key(): the cells of a generator share most of their objects
+OBJECT_SPEC_CACHE_SIZE = 65536
+_object_specs: Dict[tuple, Dict[str, Any]] = {}
+
+
+def canonicalize(value: Any) -> Any:
+    """
+    Convert a spec into plain JSON types: numpy values become Python values, tuples become lists and floats are
+    rounded, so that equal specs always serialize to the same string. Other mappings and sequences, such as the
+    DictConfig and ListConfig of hydra configs, become dicts and lists.
+    """
+    if isinstance(value, ObjectType):
+        return object_spec(value)
+    if isinstance(value, Mapping):
+        return {str(k): canonicalize(v) for k, v in value.items()}
+    if isinstance(value, Sequence) and not isinstance(value, (str, bytes)):
+        return [canonicalize(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return canonicalize(value.tolist())
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        value = round(float(value), FLOAT_DIGITS)
+        return int(value) if value.is_integer() else value
+    return value
+
+
+def object_spec(obj: ObjectType) -> Dict[str, Any]:
+    """
+    The part of ObjectType.to_dict() that affects the render: the object id and the model record are left out.
+    The spec is built once per distinct object and shared: read it, do not change it.
+    """
+    try:
+        key = obj.key()
+        spec = _object_specs.get(key)
+    except TypeError:
+        # An unhashable position or rotation
+        key = spec = None
+    if spec is None:
+        spec = obj.to_dict()
+        spec.pop("object_id", None)
+        spec.pop("model_record", None)
+        spec = canonicalize(spec)
+        if key is not None and len(_object_specs) < OBJECT_SPEC_CACHE_SIZE:
+            _object_specs[key] = spec
+    return spec
+
+
+def sample_spec(generator: str, version: int, scene: str, objects: List[Any], cameras: Any,
+                screen_size, render_quality: int, **extra) -> Dict[str, Any]:
+    """
+    Build the canonical spec of a sample.
+
+    :param generator: The name of the generator.
+    :param version: The generator version. Bump it when the rendering code changes, to invalidate the cache.
+    :param scene: The scene name.
+    :param objects: The objects, as ObjectType or dicts.
+    :param cameras: The cameras, e.g. {camera_id: position}.
+    :param screen_size: (width, height).
+    :param render_quality: The render quality.
+    :param extra: Any other parameter of the simulation (forces, number of steps, seeds...).
+    """
+    return canonicalize({"generator": generator, "version": version, "scene": scene, "objects": objects,
+                         "cameras": cameras, "screen_size": screen_size, "render_quality": render_quality,
+                         "extra": extra})
+
+
+def spec_hash(spec: Any) -> str:
+    canonical = json.dumps(canonicalize(spec), sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def spec_seed(value: Any) -> int:
+    """
+    A 32-bit seed derived from a spec (or any canonicalizable value), so that random draws depend on what a cell
+    contains rather than on its position in the loops.
+    """
+    return int(spec_hash(value)[:8], 16)
+
+
+def _link_or_copy(src: str, dst: str):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _rebase(value: Any, old_root: str, new_root: str) -> Any:
+    """
+    Rewrite the paths of cached metadata from the directory they were rendered in to the new one.
+    """
+    if isinstance(value, str) and value.startswith(old_root):
+        return new_root + value[len(old_root):]
+    if isinstance(value, dict):
+        return {k: _rebase(v, old_root, new_root) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_rebase(v, old_root, new_root) for v in value]
+    return value
+
+
+class RenderCache:
+    def __init__(self, cache_dir: str, enabled: bool = True):
+        """
+        :param cache_dir: The directory of the cache. It should be on the same file system as the outputs,
+                          so that hits are hard links.
+        :param enabled: If False, every lookup misses and nothing is stored.
+        """
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+    def entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def _valid_manifest(self, key: str) -> Optional[dict]:
+        """
+        Read the manifest of an entry and check that every file is still there, unchanged.
+        """
+        entry = self.entry_path(key)
+        try:
+            with open(os.path.join(entry, MANIFEST_NAME), "r") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        for file in manifest["files"]:
+            try:
+                stat = os.stat(os.path.join(entry, file["path"]))
+            except OSError:
+                return None
+            # Outputs are hard links to the cache, so a file overwritten in place changes here too
+            if stat.st_size != file["size"] or stat.st_mtime_ns != file["mtime_ns"]:
+                return None
+        return manifest
+
+    def fetch(self, key: str, output_pth: str) -> Optional[dict]:
+        """
+        Materialize a cached sample into output_pth (replacing whatever is there).
+
+        :return: The manifest of the sample, or None on a miss. manifest["meta"] holds the metadata given to store,
+                 with its paths rebased onto output_pth.
+        """
+        manifest = self._valid_manifest(key) if self.enabled else None
+        if manifest is None:
+            self.misses += 1
+            return None
+        entry = self.entry_path(key)
+        if os.path.exists(output_pth):
+            shutil.rmtree(output_pth)
+        for file in manifest["files"]:
+            dst = os.path.join(output_pth, file["path"])
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            _link_or_copy(os.path.join(entry, file["path"]), dst)
+        self.hits += 1
+        manifest["meta"] = _rebase(manifest["meta"], manifest["output_pth"], output_pth)
+        return manifest
+
+    def store(self, key: str, output_pth: str, spec: Dict[str, Any], meta: Any = None):
+        """
+        Add a rendered sample to the cache. The manifest is written last, so an interrupted store is never a hit.
+
+        :param key: spec_hash(spec).
+        :param output_pth: The directory the sample was rendered into.
+        :param spec: The canonical spec, kept in the manifest for inspection.
+        :param meta: JSON-serializable metadata returned on later hits (e.g. collision frames).
+        """
+        if not self.enabled or not os.path.isdir(output_pth):
+            return
+        entry = self.entry_path(key)
+        if os.path.exists(entry):
+            shutil.rmtree(entry)
+        files = []
+        for root, _, names in os.walk(output_pth):
+            for name in sorted(names):
+                src = os.path.join(root, name)
+                rel = os.path.relpath(src, output_pth)
+                dst = os.path.join(entry, rel)
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                _link_or_copy(src, dst)
+                stat = os.stat(dst)
+                files.append({"path": rel, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns})
+        manifest = {"spec": spec, "files": files, "meta": meta, "output_pth": output_pth}
+        tmp_path = os.path.join(entry, MANIFEST_NAME + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(canonicalize(manifest), f)
+        os.replace(tmp_path, os.path.join(entry, MANIFEST_NAME))
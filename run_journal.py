@@ -0,0 +1,174 @@
+import copy
+import json
+import os
+import random
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+
+from index_writer import IndexWriter
+from serialization import dumps, loads
+
+# Checkpoint/resume for long generator sweeps.
+# Samples are numbered in the order the sweep visits them. When a sample starts, the RNG state (random and
+# np.random) and any loop state the script mutates are written atomically to <path>.state; when it completes, the
+# records it added to the index (images_info, infos...) are appended to <path> and fsync'd. With an IndexWriter, only
+# the size of its file is recorded: the records are already in the writer's JSONL. On restart with
+# resume=True, the records are replayed into the index, the samples already done are skipped, and the state saved
+# at the start of the interrupted sample is restored, so the rest of the run is identical to an uninterrupted one.
+
+
+def _rng_state() -> dict:
+    version, internal, gauss = random.getstate()
+    name, keys, pos, has_gauss, cached = np.random.get_state()
+    return {"random": [version, list(internal), gauss],
+            "numpy": [name, keys.tolist(), int(pos), int(has_gauss), float(cached)]}
+
+
+def _set_rng_state(state: dict):
+    version, internal, gauss = state["random"]
+    random.setstate((version, tuple(internal), gauss))
+    name, keys, pos, has_gauss, cached = state["numpy"]
+    np.random.set_state((name, np.array(keys, dtype=np.uint32), pos, has_gauss, cached))
+
+
+def _restore_into(target: Any, saved: Any):
+    """
+    Restore a mutable object in place, so that the references the script holds see the restored value.
+    """
+    if isinstance(target, dict):
+        target.clear()
+        target.update(copy.deepcopy(saved))
+    elif isinstance(target, list):
+        target[:] = copy.deepcopy(saved)
+    else:
+        raise TypeError(f"Cannot restore {type(target).__name__} in place, use a dict or a list")
+
+
+class RunJournal:
+    def __init__(self, path: str, resume: bool = False):
+        """
+        :param path: The journal file, usually next to the index the script writes at the end.
+        :param resume: If True, continue the run recorded in the journal. Otherwise start a new journal.
+        """
+        self.path = path
+        self.state_path = path + ".state"
+        self.next_index = 0
+        self.records: List[dict] = []
+        self._state: Optional[dict] = None
+        self._restored = False
+        self._offsets: Dict[Any, int] = {}
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if resume and os.path.exists(self.state_path):
+            with open(self.state_path, "r") as f:
+                self._state = json.load(f)
+            # The interrupted sample is the one whose start state was saved last
+            self.next_index = self._state["index"]
+            self._load_records()
+        else:
+            for p in (self.path, self.state_path):
+                if os.path.exists(p):
+                    os.remove(p)
+        self._file = open(self.path, "a")
+
+    def _load_records(self):
+        """
+        Read the journal, dropping a torn last line and the records of samples at or after the interrupted one.
+        """
+        if not os.path.exists(self.path):
+            return
+        valid_bytes = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    record = loads(line)
+                except ValueError:
+                    break
+                if record["index"] >= self.next_index:
+                    break
+                self.records.append(record)
+                valid_bytes += len(line)
+        with open(self.path, "r+b") as f:
+            f.truncate(valid_bytes)
+
+    def replay(self, index_data: Union[Dict[str, list], list, IndexWriter]):
+        """
+        Append the records of the completed samples to the (empty) index of the script.
+
+        :param index_data: A dict of lists (e.g. images_info), a list (e.g. infos), or an IndexWriter opened with
+                           append=True, whose records after the last completed sample are dropped.
+        """
+        if isinstance(index_data, IndexWriter):
+            index_data.truncate(self.records[-1]["offset"] if self.records else 0)
+            return index_data
+        for record in self.records:
+            entries = record["entries"]
+            if isinstance(index_data, dict):
+                for section, items in entries.items():
+                    index_data.setdefault(section, []).extend(items)
+            else:
+                index_data.extend(entries)
+        self._offsets = self._lengths(index_data)
+        return index_data
+
+    @staticmethod
+    def _lengths(index_data) -> Dict[Any, int]:
+        if isinstance(index_data, dict):
+            return {section: len(items) for section, items in index_data.items() if isinstance(items, list)}
+        return {None: len(index_data)}
+
+    def skip(self, index: int, state: Dict[str, Any] = None) -> bool:
+        """
+        Call at the start of every sample. True if the run being resumed already completed it.
+        Otherwise, on the first such sample restore the RNG and loop state saved when it started last time,
+        then save the state this sample starts from.
+
+        :param index: The sample index.
+        :param state: {name: dict or list} of loop state the script mutates across samples, restored in place.
+        """
+        if index < self.next_index:
+            return True
+        if not self._restored:
+            self._restored = True
+            if self._state is not None:
+                _set_rng_state(self._state["rng"])
+                for name, target in (state or {}).items():
+                    if name in self._state["state"]:
+                        _restore_into(target, self._state["state"][name])
+        snapshot = {"index": index, "rng": _rng_state(),
+                    "state": loads(dumps(state or {}))}
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(snapshot, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.state_path)
+        return False
+
+    def commit(self, index: int, index_data: Union[Dict[str, list], list, IndexWriter]):
+        """
+        Durably record a completed sample: the entries it added to index_data since the previous commit.
+        """
+        if isinstance(index_data, IndexWriter):
+            index_data.sync()
+            self._append({"index": index, "offset": index_data.tell()})
+            return
+        lengths = self._lengths(index_data)
+        if isinstance(index_data, dict):
+            entries = {section: index_data[section][self._offsets.get(section, 0):] for section in lengths}
+            entries = {section: items for section, items in entries.items() if items}
+        else:
+            entries = index_data[self._offsets.get(None, 0):]
+        self._offsets = lengths
+        self._append({"index": index, "entries": entries})
+
+    def _append(self, record: dict):
+        self._file.write(dumps(record) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.next_index = record["index"] + 1
+
+    def close(self):
+        self._file.close()
+
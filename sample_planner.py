@@ -0,0 +1,463 @@
+import json
+import math
+import os
+import random
+from math import sqrt
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from shape_coords import generate_square_coords, generate_circle_coords, generate_triangle_coords, generate_line_coords_with_length
+from camera_geometry import is_sample_visible, bounding_radius
+
+# Offline planning for the script generators.
+# A plan is a plain, JSON-serializable dict describing everything a sample needs (positions, trajectories,
+# destinations, metadata/answers). Planning never touches the simulator, so invalid samples are rejected
+# before any object is added, and the render loops only execute accepted plans.
+
+PLAN_FORMAT_VERSION = 1
+
+
+def cell_rng(seed: int, index: int) -> random.Random:
+    """
+    Return the random generator of a single grid cell.
+    Seeding per cell makes a plan independent of how the grid is split across worker processes.
+    """
+    return random.Random(f"{seed}:{index}")
+
+
+# ---------------------------------------------------------------------------
+# Geometry helpers shared by the planners (pure Python, no TDW)
+# ---------------------------------------------------------------------------
+
+def get_action_coordinates(action, radius, center, direction='right'):
+    """
+    Generate a list of (x, z) coordinates according to the specified trajectory type.
+    """
+    if action is None:
+        return None
+    if action == 'circle':
+        radius = float(radius)
+        return generate_circle_coords(num_points=8, radius=radius, center=center)
+    if action == 'square':
+        side_length = float(radius)
+        return generate_square_coords(num_points=8, side_length=side_length, center=center)
+    if action == 'triangle':
+        side_length = float(radius)
+        return generate_triangle_coords(num_points=8, side_length=side_length, center=center)
+    if action == 'line':
+        length = float(radius)
+        return generate_line_coords_with_length(start_point=center, length=length, direction=direction, num_points=8)
+
+    return None
+
+
+def get_trajectory_coordinates(trajectory, radius, center):
+    """
+    Resolve a trajectory name such as "circle" or "left_line" into (x, z) coordinates.
+    """
+    if trajectory.find('line') != -1:
+        direction, action = trajectory.split('_')
+        return get_action_coordinates(action, radius, center, direction)
+    return get_action_coordinates(trajectory, radius, center)
+
+
+def check_trajectories_intersect(coords1, coords2, min_dist=0.2):
+    """
+    Check if two trajectories intersect or are too close.
+    If any pair of points (x1, z1) in coords1 and (x2, z2) in coords2 is within min_dist,
+    we consider the trajectories to intersect (or be too close).
+    """
+    for (x1, z1) in coords1:
+        for (x2, z2) in coords2:
+            dist = sqrt((x1 - x2) ** 2 + (z1 - z2) ** 2)
+            if dist < min_dist:
+                return True
+    return False
+
+
+def generate_line_coords(start_point, end_point, num_points=30):
+    """
+    Generate a list of coordinates interpolated along a straight line from the start point to the end point.
+    :param start_point: (x_start, z_start)
+    :param end_point: (x_end, z_end)
+    :param num_points: Number of interpolation points
+    :return: [(x, z), (x, z), ...]
+    """
+    (x1, z1) = start_point
+    (x2, z2) = end_point
+    coords = []
+    for i in range(num_points):
+        t = i / (num_points - 1)
+        x = x1 + (x2 - x1) * t
+        z = z1 + (z2 - z1) * t
+        coords.append((x, z))
+    return coords
+
+
+def generate_coordinates(vision_boundary, size, n=6, rng=random):
+    """
+    Randomly generate n coordinates within the specified vision boundary while maintaining a minimum distance.
+    """
+    coordinates = []
+
+    def is_overlapping(new_coord, existing_coords, min_distance):
+        """Check if the new coordinate is too close to the existing ones."""
+        for coord in existing_coords:
+            distance = ((new_coord[0] - coord[0]) ** 2 +
+                        (new_coord[1] - coord[1]) ** 2 +
+                        (new_coord[2] - coord[2]) ** 2) ** 0.5
+            if distance < min_distance:
+                return True
+        return False
+
+    min_distance = size + 0.2
+    while len(coordinates) < n:
+        x_range = vision_boundary['x']
+        z_range = vision_boundary['z']
+        y = vision_boundary['y']
+
+        x = rng.uniform(x_range[0], x_range[1])
+        z = rng.uniform(z_range[0], z_range[1])
+        new_coord = (x, y, z)
+
+        if not is_overlapping(new_coord, coordinates, min_distance):
+            coordinates.append(new_coord)
+
+    return coordinates
+
+
+def generate_objects(object_list, n=6, rng=random):
+    """
+    Randomly select n object names (potentially with weighting) from object_list.
+    """
+    return rng.choices(object_list, k=n)
+
+
+def generate_colors(colors, n=6, rng=random):
+    """
+    Randomly select n colors from the given color dictionary and return them in [(color_name, (r, g, b)), ...] format.
+    """
+    processed_colors = []
+    selected_colors = rng.sample(list(colors.items()), n)
+    for color in selected_colors:
+        color_name, color_value = color
+        # Convert from 0-255 to 0-1
+        color_new_value = tuple(value / 255 for value in color_value)
+        processed_colors.append((color_name, color_new_value))
+    return processed_colors
+
+
+def distance(p1, p2):
+    """Compute the Euclidean distance between two points on a 2D plane."""
+    return math.sqrt((p1[0] - p2[0]) ** 2 + (p1[1] - p2[1]) ** 2)
+
+
+def check_line_of_sight(p1, p2, objects, radius):
+    """
+    Determine whether the line between two points intersects with any objects.
+    :param p1, p2: (x, z)
+    :param objects: [(x, z), ...]
+    :param radius: The radius of the object
+    :return: True / False
+    """
+    for obj in objects:
+        if obj == p1 or obj == p2:
+            continue
+
+        # Parametric equation of the line segment: (1 - t)*p1 + t*p2, t ∈ [0,1]
+        vec_x, vec_z = p2[0] - p1[0], p2[1] - p1[1]
+        len_sq = vec_x * vec_x + vec_z * vec_z
+        if len_sq == 0:
+            # p1 and p2 overlap
+            continue
+        t = (vec_x * (obj[0] - p1[0]) + vec_z * (obj[1] - p1[1])) / len_sq
+        t = max(0, min(1, t))
+        closest_point = (p1[0] + t * vec_x, p1[1] + t * vec_z)
+
+        if distance(closest_point, obj) < radius:
+            return False
+    return True
+
+
+def determine_possible_moves(moving_object, another_moving_object, objects, radius):
+    """
+    Find all possible destinations to which you can move directly from last_object without being obstructed.
+    """
+    possible_moves = []
+    for obj in objects:
+        if obj == moving_object or obj == another_moving_object:
+            continue
+        if check_line_of_sight(moving_object, obj, objects, radius):
+            possible_moves.append(obj)
+    return possible_moves
+
+
+def is_tuple_close(t1, t2, tolerance=1e-9):
+    """Check if two tuples are approximately equal within a given tolerance."""
+    return all(math.isclose(a, b, abs_tol=tolerance) for a, b in zip(t1, t2))
+
+
+def find_tuple_in_list(t, lst, tolerance=1e-4):
+    """Find the index of tuple t in list lst if they are approximately equal."""
+    for i, item in enumerate(lst):
+        if is_tuple_close(t, item, tolerance):
+            return i
+    return -1
+
+
+def _to_xz_list(coords):
+    return [[float(x), float(z)] for (x, z) in coords]
+
+
+def check_visibility(context: Dict[str, Any], cell: Dict[str, Any], frames: List[List[List[float]]], size: float) -> bool:
+    """
+    Analytic frustum/occlusion check of a planned sample. Always passes if the context has no "cameras".
+
+    :param frames: Object centers per frame: [[[x, y, z] for each object] for each frame].
+    """
+    cameras = context.get("cameras")
+    if cameras is None:
+        return True
+    camera_id = cell["camera_id"].lower()
+    return is_sample_visible(frames, [bounding_radius(size)] * len(frames[0]),
+                             {camera_id: cameras[cell["scene"]][camera_id]},
+                             field_of_view=context.get("field_of_view", 35),
+                             min_coverage=context.get("min_coverage", 0.95),
+                             max_occlusion=context.get("max_occlusion", 0.5))
+
+
+# ---------------------------------------------------------------------------
+# Per-generator planners. Each takes (context, cell, rng) and returns a plan dict or None if rejected.
+# ---------------------------------------------------------------------------
+
+def plan_trajectory_sample(context: Dict[str, Any], cell: Dict[str, Any], rng: random.Random) -> Optional[Dict[str, Any]]:
+    """
+    Plan one sample of trajectory_new: two objects moving along different, non-intersecting trajectories.
+
+    :param context: Shared settings: "object_configs" (scene -> object anchors), "object_list", "colors", "size", "min_dist", "skip_prob".
+    :param cell: The grid cell: scene, camera_id, material, traj1, radius1, traj2, radius2.
+    :param rng: The random generator of this cell.
+    :return: The plan, or None if the cell is rejected.
+    """
+    object_config = context["object_configs"][cell["scene"]]
+    object_center = object_config['center']
+    object_center = [object_center[0], object_center[2]]
+
+    obj1_name = rng.choice(context["object_list"])
+    color1_name, color1_value = generate_colors(context["colors"], n=1, rng=rng)[0]
+    obj2_name = rng.choice(context["object_list"])
+    color2_name, color2_value = generate_colors(context["colors"], n=1, rng=rng)[0]
+
+    center1 = [object_center[0] - 0.2, object_center[1] + 0.2] # TODO: add bias to the line trajectory
+    coords1 = get_trajectory_coordinates(cell["traj1"], cell["radius1"], center1)
+    if coords1 is None:
+        return None
+
+    center2 = [object_center[0] + 0.2, object_center[1] - 0.2]
+    coords2 = get_trajectory_coordinates(cell["traj2"], cell["radius2"], center2)
+    if coords2 is None:
+        return None
+
+    if check_trajectories_intersect(coords1, coords2, min_dist=context.get("min_dist", 0.3)):
+        return None
+
+    y1 = object_config['left'][1]
+    y2 = object_config['right'][1]
+    frames = [[[x1, y1, z1], [x2, y2, z2]] for (x1, z1), (x2, z2) in zip(coords1, coords2)]
+    if not check_visibility(context, cell, frames, context["size"]):
+        return None
+
+    if cell["traj1"] != cell["traj2"]:
+        # 2/3 chance to skip the scenario
+        if rng.random() < context.get("skip_prob", 0.67):
+            return None
+
+    objects = []
+    for name, color_name, color_value, anchor, traj, radius, coords in [
+            (obj1_name, color1_name, color1_value, 'left', cell["traj1"], cell["radius1"], coords1),
+            (obj2_name, color2_name, color2_value, 'right', cell["traj2"], cell["radius2"], coords2)]:
+        objects.append({
+            "model_name": name,
+            "type": name.split("_")[1],  # e.g. prim_cube -> cube
+            "color": color_name,
+            "color_value": list(color_value),
+            "position": list(object_config[anchor]),
+            "trajectory": traj,
+            "radius": radius,
+            "coords": _to_xz_list(coords),
+        })
+
+    return {
+        "scene": cell["scene"],
+        "camera_id": cell["camera_id"],
+        "material": cell["material"],
+        "size": context["size"],
+        "objects": objects,
+    }
+
+
+def plan_speed_sample(context: Dict[str, Any], cell: Dict[str, Any], rng: random.Random) -> Optional[Dict[str, Any]]:
+    """
+    Plan one sample of speed_new: n static objects, the last two of which move towards another object at different speeds.
+
+    :param context: Shared settings: "vision_boundaries" (scene -> boundary), "objects_set", "colors", "size", "num_points".
+    :param cell: The grid cell: scene, camera_id, n, material, speed1, speed2.
+    :param rng: The random generator of this cell.
+    :return: The plan, or None if one of the moving objects has no reachable destination.
+    """
+    n = cell["n"]
+    size = context["size"]
+    material = cell["material"]
+    vision_boundary = context["vision_boundaries"][cell["scene"]]
+
+    coordinates = generate_coordinates(vision_boundary, size, n=n, rng=rng)
+    objs = generate_objects(context["objects_set"], n=n, rng=rng)
+    cols = generate_colors(context["colors"], n=n, rng=rng)
+
+    # Since y is the same for all generated coordinates, we can simply compare (x, z)
+    all_coordinates_2d = [(coord[0], coord[2]) for coord in coordinates]
+    start_2d_1 = all_coordinates_2d[-1]
+    start_2d_2 = all_coordinates_2d[-2]
+
+    possible_destinations_1 = determine_possible_moves(start_2d_1, start_2d_2, all_coordinates_2d, size)
+    possible_destinations_2 = determine_possible_moves(start_2d_2, start_2d_1, all_coordinates_2d, size)
+
+    # If either object has no feasible path, reject this sample
+    if len(possible_destinations_1) < 1 or len(possible_destinations_2) < 1:
+        return None
+
+    dest_1 = rng.choice(possible_destinations_1)
+    dest_2 = rng.choice(possible_destinations_2)
+    idx_1 = find_tuple_in_list(dest_1, all_coordinates_2d)
+    idx_2 = find_tuple_in_list(dest_2, all_coordinates_2d)
+
+    paths = []
+    for start, dest, speed in [(start_2d_1, dest_1, cell["speed1"]), (start_2d_2, dest_2, cell["speed2"])]:
+        length = math.sqrt((dest[0] - start[0]) ** 2 + (dest[1] - start[1]) ** 2)
+        direction = ((dest[0] - start[0]) / length, (dest[1] - start[1]) / length)
+        # Scale the endpoint by the speed
+        end = (start[0] + speed * direction[0], start[1] + speed * direction[1])
+        paths.append(_to_xz_list(generate_line_coords(start, end, num_points=context.get("num_points", 8))))
+
+    y = coordinates[-1][1]
+    frames = [[list(coord) for coord in coordinates[:-2]] + [[x2, y, z2], [x1, y, z1]]
+              for (x1, z1), (x2, z2) in zip(*paths)]
+    if not check_visibility(context, cell, frames, size):
+        return None
+
+    def describe(i):
+        return {
+            "type": objs[i].split("_")[1],  # e.g. "cube", "sphere"
+            "material": material,
+            "color": cols[i][0].replace('_', ' '),
+            "size": size
+        }
+
+    moving_info = [dict(speed=cell["speed1"], **describe(-1)), dict(speed=cell["speed2"], **describe(-2))]
+    reference_info = [describe(idx_1)] if idx_1 == idx_2 else [describe(idx_1), describe(idx_2)]
+
+    return {
+        "scene": cell["scene"],
+        "camera_id": cell["camera_id"],
+        "material": material,
+        "size": size,
+        "coordinates": [list(coord) for coord in coordinates],
+        "objects": objs,
+        "colors": [[name, list(value)] for name, value in cols],
+        "paths": paths,
+        "objects_info": [describe(i) for i in range(n)],
+        "moving": moving_info,
+        "reference": reference_info,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Grid planning and plan files
+# ---------------------------------------------------------------------------
+
+_worker_state = {}
+
+
+def _init_worker(plan_fn, context, seed):
+    _worker_state["plan_fn"] = plan_fn
+    _worker_state["context"] = context
+    _worker_state["seed"] = seed
+
+
+def _plan_cell(job):
+    index, cell = job
+    plan = _worker_state["plan_fn"](_worker_state["context"], cell, cell_rng(_worker_state["seed"], index))
+    if plan is not None:
+        plan["cell_index"] = index
+    return plan
+
+
+def plan_grid(plan_fn: Callable, context: Dict[str, Any], cells: Sequence[Dict[str, Any]],
+              seed: int = 39, processes: int = 1, chunksize: int = 64) -> List[Dict[str, Any]]:
+    """
+    Plan every cell of a generator grid and keep the accepted ones, in cell order.
+
+    :param plan_fn: A module-level planner, e.g. plan_trajectory_sample. It must be picklable when processes > 1.
+    :param context: Settings shared by all cells.
+    :param cells: The grid cells, in the generator's loop order.
+    :param seed: The base seed. The result does not depend on the number of processes.
+    :param processes: Number of worker processes.
+    :param chunksize: Number of cells sent to a worker at once.
+    :return: The accepted plans.
+    """
+    jobs = list(enumerate(cells))
+    if processes is None or processes <= 1:
+        _init_worker(plan_fn, context, seed)
+        results = [_plan_cell(job) for job in jobs]
+    else:
+        # multiprocessing is only loaded by the runs that use a pool
+        from multiprocessing import Pool
+        with Pool(processes, initializer=_init_worker, initargs=(plan_fn, context, seed)) as pool:
+            results = pool.map(_plan_cell, jobs, chunksize=chunksize)
+    return [plan for plan in results if plan is not None]
+
+
+def save_plan(path: str, plans: List[Dict[str, Any]], generator: str, seed: int, num_cells: int = None):
+    """
+    Write the plans to a JSON file.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    payload = {
+        "version": PLAN_FORMAT_VERSION,
+        "generator": generator,
+        "seed": seed,
+        "num_cells": num_cells,
+        "plans": plans,
+    }
+    with open(path, 'w') as f:
+        json.dump(payload, f)
+
+
+def load_plan(path: str, generator: str = None) -> List[Dict[str, Any]]:
+    """
+    Read plans written by save_plan.
+    """
+    with open(path, 'r') as f:
+        payload = json.load(f)
+    if payload.get("version") != PLAN_FORMAT_VERSION:
+        raise ValueError(f"Unsupported plan version {payload.get('version')} in {path}")
+    if generator is not None and payload.get("generator") != generator:
+        raise ValueError(f"Plan {path} was made for {payload.get('generator')}, not {generator}")
+    return payload["plans"]
+
+
+def plan_or_load(plan_path: Optional[str], generator: str, plan_fn: Callable, context: Dict[str, Any],
+                 cells: Sequence[Dict[str, Any]], seed: int = 39, processes: int = 1) -> List[Dict[str, Any]]:
+    """
+    Load the plans from plan_path if it exists, otherwise plan the grid (and save it to plan_path if given).
+    """
+    if plan_path is not None and os.path.exists(plan_path):
+        plans = load_plan(plan_path, generator=generator)
+        print(f"Loaded {len(plans)} plans from {plan_path}")
+        return plans
+    plans = plan_grid(plan_fn, context, cells, seed=seed, processes=processes)
+    print(f"Planned {len(plans)} / {len(cells)} samples")
+    if plan_path is not None:
+        save_plan(plan_path, plans, generator=generator, seed=seed, num_cells=len(cells))
+    return plans
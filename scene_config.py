@@ -0,0 +1,137 @@
+import copy
+import os
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+import yaml
+
+# The scene settings (scene_settings.yaml), parsed and validated once.
+# The tasks and generators used to open and parse the file for every camera of every sample. load_scene_settings()
+# parses it on the first call and returns the same SceneSettings for every scene after, with the cameras, the point
+# they look at and the object anchors (center, top, right, bottom, left) as read-only float arrays, and the dicts
+# the tasks expect from camera_config() and anchor().
+# The file is scene_settings.yaml next to this module, unless set_scene_settings_path() or the environment variable
+# SCENE_SETTINGS points to another one.
+#
+# settings = load_scene_settings()["box_room_2018"]
+# settings.cameras["top"], settings.look_at, settings.anchors["center"]
+
+SCENE_SETTINGS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scene_settings.yaml")
+SCENE_SETTINGS_ENV = "SCENE_SETTINGS"
+AXES = ("x", "y", "z")
+
+_path_override: Optional[str] = None
+_loaded: Dict[str, Dict[str, "SceneSettings"]] = {}
+_lock = threading.Lock()
+
+
+def _vector(value, where: str) -> np.ndarray:
+    """
+    A point of the file, {"x", "y", "z"} or [x, y, z], as a read-only array.
+    """
+    if isinstance(value, dict):
+        if any(axis not in value for axis in AXES):
+            raise ValueError(f"{where}: expected x, y and z, got {value}")
+        value = [value[axis] for axis in AXES]
+    try:
+        array = np.array(value, dtype=float)
+    except (TypeError, ValueError):
+        raise ValueError(f"{where}: expected 3 numbers, got {value}") from None
+    if array.shape != (3,):
+        raise ValueError(f"{where}: expected 3 numbers, got {value}")
+    array.flags.writeable = False
+    return array
+
+
+def _to_dict(array: np.ndarray) -> Dict[str, float]:
+    return {axis: float(v) for axis, v in zip(AXES, array)}
+
+
+class SceneSettings:
+    def __init__(self, name: str, settings: dict):
+        """
+        :param name: The scene name.
+        :param settings: The entry of the scene in scene_settings.yaml.
+        """
+        if not isinstance(settings, dict) or not isinstance(settings.get("camera"), dict):
+            raise ValueError(f"{name}: no camera section")
+        cameras = dict(settings["camera"])
+        if "look_at" not in cameras:
+            raise ValueError(f"{name}: no camera look_at")
+        self.name = name
+        self.look_at = _vector(cameras.pop("look_at"), f"{name}.camera.look_at")
+        self.cameras = {camera_id: _vector(position, f"{name}.camera.{camera_id}")
+                        for camera_id, position in cameras.items()}
+        self.anchors = {anchor: _vector(position, f"{name}.object.{anchor}")
+                        for anchor, position in (settings.get("object") or {}).items()}
+        self.vision_boundary = settings.get("vision_boundary")
+        # The camera section as the tasks read it: {camera_id: {"x", "y", "z"}, "look_at": {"x", "y", "z"}}
+        self._camera_config = {camera_id: _to_dict(position) for camera_id, position in self.cameras.items()}
+        self._camera_config["look_at"] = _to_dict(self.look_at)
+
+    def camera_config(self) -> Dict[str, Dict[str, float]]:
+        """
+        The camera section, a copy the caller may change.
+        """
+        return copy.deepcopy(self._camera_config)
+
+    def camera(self, camera_id: str) -> np.ndarray:
+        if camera_id not in self.cameras:
+            raise KeyError(f"{self.name} has no camera {camera_id}, expected one of {list(self.cameras)}")
+        return self.cameras[camera_id]
+
+    def anchor(self, anchor: str) -> Dict[str, float]:
+        """
+        An object anchor ("center", "top"...) as a new {"x", "y", "z"} dict.
+        """
+        if anchor not in self.anchors:
+            raise KeyError(f"{self.name} has no object anchor {anchor}, expected one of {list(self.anchors)}")
+        return _to_dict(self.anchors[anchor])
+
+    def camera_rig(self, camera_ids: List[str] = None) -> Dict[str, dict]:
+        """
+        {camera_id: {"position": array, "look_at": array}}, for camera_geometry. Default: every camera.
+        """
+        if camera_ids is None:
+            camera_ids = list(self.cameras)
+        return {camera_id: {"position": self.camera(camera_id), "look_at": self.look_at} for camera_id in camera_ids}
+
+
+def set_scene_settings_path(path: Optional[str]):
+    """
+    Read the scene settings from path from now on. None to go back to the default.
+    """
+    global _path_override
+    _path_override = path
+
+
+def scene_settings_path() -> str:
+    return _path_override or os.environ.get(SCENE_SETTINGS_ENV) or SCENE_SETTINGS_PATH
+
+
+def load_scene_settings(path: str = None) -> Dict[str, SceneSettings]:
+    """
+    The settings of every scene of a file, parsed on the first call for the file.
+
+    :param path: The file. Default: scene_settings_path().
+    """
+    path = os.path.abspath(path or scene_settings_path())
+    settings = _loaded.get(path)
+    if settings is None:
+        with _lock:
+            settings = _loaded.get(path)
+            if settings is None:
+                with open(path, "r") as file:
+                    config = yaml.safe_load(file)
+                if not isinstance(config, dict):
+                    raise ValueError(f"{path}: expected a mapping of scenes")
+                settings = _loaded[path] = {name: SceneSettings(name, scene) for name, scene in config.items()}
+    return settings
+
+
+def get_scene_settings(scene: str, path: str = None) -> SceneSettings:
+    settings = load_scene_settings(path)
+    if scene not in settings:
+        raise KeyError(f"No scene {scene} in {path or scene_settings_path()}, expected one of {list(settings)}")
+    return settings[scene]
@@ -0,0 +1,132 @@
+import json
+import os
+import threading
+from typing import Dict
+
+from tdw.controller import Controller
+from tdw.output_data import Bounds, OutputData, Raycast
+
+from scene_config import SCENE_SETTINGS_PATH
+
+# Scene geometry measured with the build once, instead of for every sample or by hand.
+#   floor_height(c, scene)              the height of the floor of a scene, by a raycast down onto the environment
+#   surface(c, model_name, scale)       the top and the extents of a model at a scale (e.g. a table top), from its
+#                                       bounds, relative to the position the model is added at
+# The measurements are kept in scene_geometry.json next to scene_settings.yaml and shared by every generator and
+# run: a probe costs a round trip or two the first time, nothing after. Delete an entry (or the file) to measure it
+# again, e.g. after a model was updated.
+#
+# geometry = SceneGeometry()
+# table_height = geometry.top(c, "marble_table", scale=1.5)
+
+SCENE_GEOMETRY_PATH = os.path.join(os.path.dirname(SCENE_SETTINGS_PATH), "scene_geometry.json")
+RAYCAST_HEIGHT = 10.0
+# Where models are probed: away from the scene, so that they touch nothing during the probe
+PROBE_POSITION = {"x": 0, "y": -50, "z": 0}
+
+
+class SceneGeometry:
+    def __init__(self, path: str = None):
+        """
+        :param path: The JSON file of the measurements, created on the first one. Default: SCENE_GEOMETRY_PATH.
+        """
+        self.path = path or SCENE_GEOMETRY_PATH
+        self.lock = threading.Lock()
+        self.entries = self._load()
+        self.probes = 0
+
+    def _load(self) -> Dict[str, dict]:
+        try:
+            with open(self.path, "r") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = {}
+        entries.setdefault("floors", {})
+        entries.setdefault("surfaces", {})
+        return entries
+
+    def _store(self, section: str, key: str, value):
+        """
+        Keep a measurement. The file is read again before it is replaced, so that runs measuring other entries at
+        the same time (e.g. shards) do not drop each other's.
+        """
+        with self.lock:
+            entries = self._load()
+            entries[section][key] = value
+            self.entries = entries
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(entries, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _communicate(c: Controller, commands: list) -> list:
+        # The add-ons of the generator are initialized by its own first frame, not by a probe
+        add_ons, c.add_ons = c.add_ons, []
+        try:
+            return c.communicate(commands)
+        finally:
+            c.add_ons = add_ons
+
+    def floor_height(self, c: Controller, scene: str, x: float = 0, z: float = 0) -> float:
+        """
+        The height of the floor of a scene, which must be loaded. 0 if the raycast hits nothing.
+
+        :param x: The point of the floor to measure.
+        :param z: The point of the floor to measure.
+        """
+        key = f"{scene}@{x:g},{z:g}"
+        if key not in self.entries["floors"]:
+            self.probes += 1
+            resp = self._communicate(c, [{"$type": "send_raycast", "id": 0, "collision_types": ["environment"],
+                                          "origin": {"x": x, "y": RAYCAST_HEIGHT, "z": z},
+                                          "destination": {"x": x, "y": -RAYCAST_HEIGHT, "z": z}}])
+            height = 0.0
+            for i in range(len(resp) - 1):
+                if OutputData.get_data_type_id(resp[i]) == "rayc":
+                    raycast = Raycast(resp[i])
+                    if raycast.get_hit():
+                        height = float(raycast.get_point()[1])
+            self._store("floors", key, height)
+        return self.entries["floors"][key]
+
+    def surface(self, c: Controller, model_name: str, scale: float = 1, library: str = "models_core.json") -> dict:
+        """
+        The geometry of a model, relative to the position it is added at:
+        {"top": y of its top, "bottom": y of its bottom, "x": [min, max], "z": [min, max]}.
+        "x" and "z" are the extents of its bounds, the usable surface of a table top being within them.
+
+        :param scale: The uniform scale factor of the model.
+        """
+        key = f"{library}/{model_name}@{scale:g}"
+        if key not in self.entries["surfaces"]:
+            self.probes += 1
+            object_id = c.get_unique_id()
+            commands = c.get_add_physics_object(model_name=model_name, library=library, object_id=object_id,
+                                                position=PROBE_POSITION, kinematic=True, gravity=False,
+                                                scale_factor={"x": scale, "y": scale, "z": scale})
+            commands.append({"$type": "send_bounds", "ids": [object_id], "frequency": "once"})
+            resp = self._communicate(c, commands)
+            self._communicate(c, [{"$type": "destroy_object", "id": object_id}])
+            surface = None
+            for i in range(len(resp) - 1):
+                if OutputData.get_data_type_id(resp[i]) == "boun":
+                    bounds = Bounds(resp[i])
+                    for j in range(bounds.get_num()):
+                        if bounds.get_id(j) == object_id:
+                            surface = {"top": float(bounds.get_top(j)[1]) - PROBE_POSITION["y"],
+                                       "bottom": float(bounds.get_bottom(j)[1]) - PROBE_POSITION["y"],
+                                       "x": sorted([float(bounds.get_left(j)[0]) - PROBE_POSITION["x"],
+                                                    float(bounds.get_right(j)[0]) - PROBE_POSITION["x"]]),
+                                       "z": sorted([float(bounds.get_front(j)[2]) - PROBE_POSITION["z"],
+                                                    float(bounds.get_back(j)[2]) - PROBE_POSITION["z"]])}
+            if surface is None:
+                raise RuntimeError(f"No bounds for {model_name} ({library})")
+            self._store("surfaces", key, surface)
+        return self.entries["surfaces"][key]
+
+    def top(self, c: Controller, model_name: str, scale: float = 1, library: str = "models_core.json") -> float:
+        """
+        The height of the top of a model above the position it is added at, e.g. of a table top above the floor.
+        """
+        return self.surface(c, model_name, scale, library)["top"]
@@ -0,0 +1,59 @@
+from typing import Dict, Iterable, List
+
+import numpy as np
+from tdw.add_ons.object_manager import ObjectManager
+from tdw.tdw_utils import TDWUtils
+
+# Snapshot of the dynamic state of the objects of a scene, to branch a simulation.
+# take() records the position, rotation, velocity and angular velocity of the objects, as of the last frame, from an
+# ObjectManager created with transforms=True and rigidbodies=True. restore_commands() returns the commands that put
+# the objects back in that state: sent with the next step, the physics continues from the snapshot, so several
+# variants can be simulated from a prefix simulated once. The state the commands cannot set (contacts, sleeping,
+# solver warm start...) is not restored: a branch is close to, not bitwise identical to, a continuation.
+
+
+class SceneSnapshot:
+    def __init__(self, positions: Dict[int, np.ndarray], rotations: Dict[int, np.ndarray],
+                 velocities: Dict[int, np.ndarray], angular_velocities: Dict[int, np.ndarray]):
+        """
+        :param positions: Object ID -> position (x, y, z).
+        :param rotations: Object ID -> rotation, a quaternion (x, y, z, w).
+        :param velocities: Object ID -> velocity. Objects without a rigidbody have none.
+        :param angular_velocities: Object ID -> angular velocity.
+        """
+        self.positions = positions
+        self.rotations = rotations
+        self.velocities = velocities
+        self.angular_velocities = angular_velocities
+
+    @staticmethod
+    def take(object_manager: ObjectManager, object_ids: Iterable[int] = None) -> "SceneSnapshot":
+        """
+        :param object_manager: An ObjectManager recording transforms and rigidbodies.
+        :param object_ids: The objects to record. Default: every object with a transform.
+        """
+        if object_ids is None:
+            object_ids = list(object_manager.transforms)
+        missing = [object_id for object_id in object_ids if object_id not in object_manager.transforms]
+        if missing:
+            raise ValueError(f"No transforms for the objects {missing}: create the ObjectManager with transforms=True")
+        rigidbodies = {object_id: object_manager.rigidbodies[object_id] for object_id in object_ids
+                       if object_id in object_manager.rigidbodies}
+        return SceneSnapshot(positions={object_id: np.array(object_manager.transforms[object_id].position) for object_id in object_ids},
+                             rotations={object_id: np.array(object_manager.transforms[object_id].rotation) for object_id in object_ids},
+                             velocities={object_id: np.array(r.velocity) for object_id, r in rigidbodies.items()},
+                             angular_velocities={object_id: np.array(r.angular_velocity) for object_id, r in rigidbodies.items()})
+
+    def restore_commands(self) -> List[dict]:
+        """
+        The commands that set the objects back to the snapshot.
+        """
+        commands = []
+        for object_id, position in self.positions.items():
+            commands.append({"$type": "teleport_object", "id": object_id, "position": TDWUtils.array_to_vector3(position)})
+            commands.append({"$type": "rotate_object_to", "id": object_id, "rotation": TDWUtils.array_to_vector4(self.rotations[object_id])})
+            if object_id in self.velocities:
+                commands.append({"$type": "set_velocity", "id": object_id, "velocity": TDWUtils.array_to_vector3(self.velocities[object_id])})
+                commands.append({"$type": "set_angular_velocity", "id": object_id,
+                                 "angular_velocity": TDWUtils.array_to_vector3(self.angular_velocities[object_id])})
+        return commands
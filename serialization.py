@@ -0,0 +1,67 @@
+import json
+from typing import Any
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# JSON encoding of generator records.
+# Records hold numpy scalars and arrays (positions drawn with np.random, answers from np.arange...). Instead of
+# rebuilding every record in Python to convert them first, the encoders convert them when they meet them: orjson
+# serializes numpy natively when it is installed, otherwise the C encoder of the json module calls to_python for the
+# few values it cannot encode. Lines are compact: json.dumps(..., separators=(",", ":")).
+#
+# orjson writes float32 values with their shortest float32 representation (0.1 rather than 0.10000000149011612)
+# and UTF-8 instead of \u escapes; both parse back to the same records.
+
+ORJSON_OPTIONS = (orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS) if orjson is not None else 0
+
+
+def to_python(obj: Any) -> Any:
+    """
+    The default hook of the encoders: convert one numpy value that JSON cannot encode.
+    """
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.floating):
+        return float(obj)
+    if isinstance(obj, np.bool_):
+        return bool(obj)
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def numpy_to_python(obj: Any) -> Any:
+    """
+    Recursively convert the numpy values of a record to Python values.
+    Only needed to keep the record in memory as plain Python; to write it, use dumps directly.
+    """
+    if isinstance(obj, dict):
+        return {k: numpy_to_python(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [numpy_to_python(item) for item in obj]
+    if isinstance(obj, (np.generic, np.ndarray)):
+        return to_python(obj)
+    return obj
+
+
+def dumps(obj: Any) -> str:
+    """
+    Encode a record as one compact line of JSON (without the newline).
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=to_python, option=ORJSON_OPTIONS).decode("utf-8")
+    return json.dumps(obj, separators=(",", ":"), default=to_python)
+
+
+def loads(text) -> Any:
+    """
+    Decode a line of JSON (str or bytes).
+    """
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
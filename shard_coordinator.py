@@ -0,0 +1,264 @@
+import argparse
+import math
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+from index_writer import IndexWriter
+from sample_planner import load_plan
+from serialization import loads
+
+# Sharded rendering of a planned generator over several TDW servers.
+# The generator plans its samples once (--plan_only --plan_path), the plan is split into contiguous shards, and
+# every shard is rendered by a copy of the generator (--shard START:STOP) bound to a server of the pool, i.e. a
+# port and a display. Shards are rendered into the common output path, each with its own index and journal under
+# shards/, and the indexes are merged in shard order at the end, so the result is the same as a single run's
+# whatever the number of servers and the order shards finish in.
+# A shard whose worker exits before every sample of the shard is in its index (crash, build error...) goes back to
+# the queue and is resumed from its journal by the next free server, up to --max_attempts times. So does a shard
+# whose index did not grow in --stall_timeout seconds, e.g. a worker stuck on a build that never started.
+# Every worker runs in a process group of its own with the build it starts, and the whole group is killed before its
+# server is reused, so that no build is left holding the port.
+#
+# python shard_coordinator.py speed_new --output_path outputs/speed --ports 1071 1072 1073 --displays :4 :5
+# python shard_coordinator.py trajectory_new --output_path outputs/trajectory --ports 1071 1072 -- --render_quality 10
+
+# The generators that can be sharded: their index name and the options of IndexWriter.finalize
+GENERATORS = {
+    "speed_new": {"index": "speed", "finalize": {"ensure_ascii": False}},
+    "trajectory_new": {"index": "trajectory", "finalize": {}},
+}
+SHARDS_DIR = "shards"
+SHARDS_PER_SERVER = 4
+POLL_INTERVAL = 1.0
+# Seconds without a new record before a worker is stopped. Longer than the recv_timeout of the generators, so that a
+# dead build is first respawned or reported by the worker itself.
+STALL_TIMEOUT = 900.0
+# Seconds between SIGTERM and SIGKILL when stopping a worker
+STOP_TIMEOUT = 10.0
+
+
+def shard_range(shard: Optional[str], total: int) -> Tuple[int, int]:
+    """
+    Parse a --shard START:STOP argument. None is the whole plan.
+    """
+    if shard is None:
+        return 0, total
+    start, stop = (int(value) for value in shard.split(":"))
+    if not 0 <= start <= stop <= total:
+        raise ValueError(f"Shard {shard} is out of the plan of {total} samples")
+    return start, stop
+
+
+def shard_index_name(index: str, shard: Optional[str], total: int) -> str:
+    """
+    The index path of a shard relative to the output path, without extension: e.g. shards/speed.000000-000128.
+    """
+    if shard is None:
+        return index
+    start, stop = shard_range(shard, total)
+    return os.path.join(SHARDS_DIR, f"{index}.{start:06d}-{stop:06d}")
+
+
+def split_shards(total: int, shard_size: int) -> List[str]:
+    return [f"{start}:{min(start + shard_size, total)}" for start in range(0, total, shard_size)]
+
+
+def count_records(path: str) -> int:
+    """
+    The number of complete records of an IndexWriter file.
+    """
+    return sum(1 for _ in read_records(path))
+
+
+def kill_worker(process: subprocess.Popen, timeout: float = STOP_TIMEOUT):
+    """
+    Stop a worker and every process of its group, i.e. the build it started, whether the worker exited or not.
+    """
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        # Nothing is left of the group
+        process.wait()
+        return
+    try:
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        pass
+    # The build may outlive its worker, or the worker ignore SIGTERM
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.wait()
+
+
+def read_records(path: str):
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                record = loads(line)
+            except ValueError:
+                return
+            yield record
+
+
+class ShardCoordinator:
+    def __init__(self, generator: str, output_path: str, servers: List[Tuple[int, str]], plan_path: str = None,
+                 shard_size: int = None, max_attempts: int = 3, stall_timeout: Optional[float] = STALL_TIMEOUT,
+                 generator_args: List[str] = None):
+        """
+        :param generator: The script, e.g. "speed_new".
+        :param output_path: The output path of the run.
+        :param servers: (port, display) of the TDW servers, one worker each.
+        :param plan_path: The plan of the generator. Default: plan.json in the output path, made if missing.
+        :param shard_size: The number of samples of a shard. Default: SHARDS_PER_SERVER shards per server.
+        :param max_attempts: The number of times a shard is run before the run fails.
+        :param stall_timeout: Seconds without a new record of a shard before its worker is stopped. None to wait.
+        :param generator_args: More arguments of the generator, e.g. ["--render_quality", "10"].
+        """
+        if generator not in GENERATORS:
+            raise ValueError(f"Unknown generator {generator}, expected one of {list(GENERATORS)}")
+        self.generator = generator
+        self.index = GENERATORS[generator]["index"]
+        self.output_path = output_path
+        self.servers = servers
+        self.plan_path = plan_path or os.path.join(output_path, "plan.json")
+        self.shard_size = shard_size
+        self.max_attempts = max_attempts
+        self.stall_timeout = stall_timeout
+        self.generator_args = generator_args or []
+        self.script = os.path.join(os.path.dirname(os.path.abspath(__file__)), f"{generator}.py")
+
+    def command(self, *args: str) -> List[str]:
+        return [sys.executable, self.script, "--output_path", self.output_path, "--plan_path", self.plan_path,
+                *self.generator_args, *args]
+
+    def plan(self) -> int:
+        """
+        Plan the samples, unless the plan exists. Returns the number of samples.
+        """
+        if not os.path.exists(self.plan_path):
+            subprocess.run(self.command("--plan_only"), check=True)
+        return len(load_plan(self.plan_path, generator=self.generator))
+
+    def shard_path(self, shard: str, total: int) -> str:
+        return os.path.join(self.output_path, shard_index_name(self.index, shard, total) + ".jsonl")
+
+    def run(self, resume: bool = False) -> int:
+        """
+        Render every shard and merge their indexes. Returns the number of records.
+
+        :param resume: If True, keep the shards already complete and resume the others from their journals.
+        """
+        total = self.plan()
+        shard_size = self.shard_size or max(1, math.ceil(total / (SHARDS_PER_SERVER * len(self.servers))))
+        shards = split_shards(total, shard_size)
+        pending = []
+        attempts: Dict[str, int] = {}
+        for shard in shards:
+            start, stop = shard_range(shard, total)
+            if resume and count_records(self.shard_path(shard, total)) == stop - start:
+                continue
+            pending.append(shard)
+            # A shard with a journal is resumed, whether it was left by this run or an earlier one
+            attempts[shard] = 1 if resume else 0
+        print(f"{total} samples in {len(shards)} shards of {shard_size}, {len(pending)} to render on {len(self.servers)} servers")
+
+        log_dir = os.path.join(self.output_path, SHARDS_DIR)
+        os.makedirs(log_dir, exist_ok=True)
+        free = list(self.servers)
+        running: Dict[str, Tuple[subprocess.Popen, Tuple[int, str]]] = {}
+        # The records of a running shard and when their number last changed
+        progress: Dict[str, Tuple[int, float]] = {}
+        failed = []
+        try:
+            while pending or running:
+                while pending and free:
+                    shard = pending.pop(0)
+                    port, display = server = free.pop(0)
+                    args = ["--shard", shard, "--port", str(port), "--display", display]
+                    if attempts[shard] > 0:
+                        args.append("--resume")
+                    attempts[shard] += 1
+                    log = open(os.path.join(log_dir, f"{shard.replace(':', '-')}.log"), "a")
+                    # A session of its own: the worker and its build are killed together, see kill_worker
+                    process = subprocess.Popen(self.command(*args), stdout=log, stderr=subprocess.STDOUT,
+                                               start_new_session=True)
+                    running[shard] = (process, server)
+                    progress[shard] = (count_records(self.shard_path(shard, total)), time.monotonic())
+                    log.close()
+                    print(f"Shard {shard} (attempt {attempts[shard]}) on port {port}, display {display}")
+                time.sleep(POLL_INTERVAL)
+                for shard, (process, server) in list(running.items()):
+                    done = count_records(self.shard_path(shard, total))
+                    if process.poll() is None:
+                        if done != progress[shard][0]:
+                            progress[shard] = (done, time.monotonic())
+                            continue
+                        if self.stall_timeout is None or time.monotonic() - progress[shard][1] < self.stall_timeout:
+                            continue
+                        print(f"Shard {shard} wrote no record in {self.stall_timeout:.0f}s, stopping its worker")
+                    # The build goes with its worker before the server is reused
+                    kill_worker(process)
+                    done = count_records(self.shard_path(shard, total))
+                    del running[shard]
+                    free.append(server)
+                    start, stop = shard_range(shard, total)
+                    if done == stop - start:
+                        print(f"Shard {shard} done")
+                    elif attempts[shard] < self.max_attempts:
+                        print(f"Shard {shard} stopped after {done} / {stop - start} samples (exit code {process.returncode}), requeued")
+                        pending.append(shard)
+                    else:
+                        print(f"Shard {shard} failed {attempts[shard]} times")
+                        failed.append(shard)
+        finally:
+            for process, _ in running.values():
+                kill_worker(process)
+        if failed:
+            raise RuntimeError(f"Shards {failed} failed, rerun with --resume")
+        return self.merge(shards, total)
+
+    def merge(self, shards: List[str], total: int) -> int:
+        """
+        Concatenate the shard indexes, in shard order, into the index of the generator and finalize it.
+        """
+        with IndexWriter(os.path.join(self.output_path, f"{self.index}.jsonl"), fsync_every=0) as writer:
+            for shard in shards:
+                for record in read_records(self.shard_path(shard, total)):
+                    writer.write(record)
+            writer.finalize(os.path.join(self.output_path, f"{self.index}.json"), **GENERATORS[self.generator]["finalize"])
+            print(f"{len(writer)} records merged into {self.index}.json")
+            return len(writer)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render a planned generator over several TDW servers.",
+                                     epilog="Arguments after -- are passed to the generator.")
+    parser.add_argument("generator", type=str, choices=list(GENERATORS))
+    parser.add_argument("--output_path", type=str, required=True)
+    parser.add_argument("--ports", type=int, nargs="+", required=True, help="The ports of the servers, one worker each.")
+    parser.add_argument("--displays", type=str, nargs="+", default=[":4"],
+                        help="The displays of the servers, assigned to the ports in turn.")
+    parser.add_argument("--plan_path", type=str, default=None, help="Default: plan.json in the output path.")
+    parser.add_argument("--shard_size", type=int, default=None,
+                        help=f"Samples per shard. Default: {SHARDS_PER_SERVER} shards per server.")
+    parser.add_argument("--max_attempts", type=int, default=3)
+    parser.add_argument("--stall_timeout", type=float, default=STALL_TIMEOUT,
+                        help="Seconds without a new record of a shard before its worker is stopped and the shard "
+                             "requeued. 0 to wait forever.")
+    parser.add_argument("--resume", action="store_true", help="Keep the complete shards of an earlier run, resume the others.")
+    argv = sys.argv[1:]
+    generator_args = argv[argv.index("--") + 1:] if "--" in argv else []
+    args = parser.parse_args(argv[:argv.index("--")] if "--" in argv else argv)
+
+    servers = [(port, args.displays[i % len(args.displays)]) for i, port in enumerate(args.ports)]
+    ShardCoordinator(args.generator, args.output_path, servers, plan_path=args.plan_path, shard_size=args.shard_size,
+                     max_attempts=args.max_attempts, stall_timeout=args.stall_timeout or None,
+                     generator_args=generator_args).run(resume=args.resume)
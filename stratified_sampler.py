@@ -0,0 +1,128 @@
+import random
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Sequence
+
+from combinatorics import ProductSpace, ShuffledView
+
+# Quota-driven planning of benchmark samples.
+# Instead of rendering the full product of every factor to get a balanced split, the generators plan a list of
+# cells that meets per-factor quotas (e.g. at least 100 samples per scene and per answer letter) within a total
+# budget, and only render those.
+#
+# Factors come in two kinds:
+#   - strata: the factors the quotas are about (scene, camera, object counts...). Their product is enumerated,
+#     so it should stay small (hundreds to a few thousands of strata).
+#   - free factors: everything else (colors, materials, tables...). They are never enumerated; each stratum walks
+#     its own shuffled view of their product, so no cell is planned twice and the free factors stay spread out.
+# Derived factors (e.g. the answer letter, computed from the object counts) can carry quotas as well.
+
+
+class StratifiedSampler:
+    def __init__(self,
+                 strata: Dict[str, Sequence],
+                 quotas: Dict[str, Dict[Any, int]] = None,
+                 derived: Dict[str, Callable[[dict], Any]] = None,
+                 free: Dict[str, Sequence] = None,
+                 seed: int = 0):
+        """
+        :param strata: {factor: values} of the factors that quotas are about.
+        :param quotas: {factor: {value: minimum number of samples}}. Factors may be strata or derived factors.
+        :param derived: {factor: function(cell) -> value} computed from the strata of a cell.
+        :param free: {factor: values} of the other factors.
+        :param seed: The seed of the tie-breaking and of the free factor order.
+        """
+        self.derived = derived if derived is not None else {}
+        self.free_names = list(free.keys()) if free else []
+        self.free_space = ProductSpace(*free.values()) if free else ProductSpace()
+        self.rng = random.Random(seed)
+
+        names = list(strata.keys())
+        self.strata = []
+        for values in ProductSpace(*strata.values()):
+            cell = dict(zip(names, values))
+            for factor, func in self.derived.items():
+                cell[factor] = func(cell)
+            self.strata.append(cell)
+        # One shuffled walk through the free factors per stratum
+        self.free_views = [ShuffledView(self.free_space, self.rng.getrandbits(64)) for _ in self.strata]
+        self.quotas = quotas if quotas is not None else {}
+        self.unmet = {}
+
+    def factor_values(self, factor: str) -> List[Any]:
+        """
+        The values a strata or derived factor takes, in order of first appearance.
+        """
+        return list(dict.fromkeys(cell[factor] for cell in self.strata))
+
+    def uniform_quotas(self, factors: List[str], budget: int) -> Dict[str, Dict[Any, int]]:
+        """
+        Quotas that split the budget evenly between the values of each factor.
+        """
+        quotas = {}
+        for factor in factors:
+            values = self.factor_values(factor)
+            quotas[factor] = {value: budget // len(values) for value in values}
+        return quotas
+
+    def _gain(self, cell: dict, counts: Dict[str, Dict[Any, int]]) -> int:
+        return sum(1 for factor, quota in self.quotas.items()
+                   if counts[factor][cell[factor]] < quota.get(cell[factor], 0))
+
+    def _load(self, cell: dict, counts: Dict[str, Dict[Any, int]]) -> int:
+        return sum(counts[factor][cell[factor]] for factor in self.quotas)
+
+    def plan(self, budget: int, fill: bool = False) -> List[dict]:
+        """
+        Greedily pick the stratum that reduces the most outstanding quotas, until every quota is met
+        or the budget is spent. Ties go to the least used stratum, then to a seeded random choice.
+
+        :param budget: The maximum number of cells.
+        :param fill: If True, spend the rest of the budget keeping the marginals as flat as possible.
+        :return: The planned cells, each a dict of strata, derived and free factor values.
+                 Unmet quotas are left in self.unmet ({factor: {value: missing}}).
+        """
+        counts = {factor: defaultdict(int) for factor in self.quotas}
+        used = [0] * len(self.strata)
+        capacity = len(self.free_space)
+        cells = []
+        while len(cells) < budget:
+            available = [i for i in range(len(self.strata)) if used[i] < capacity]
+            if not available:
+                break
+            gains = {i: self._gain(self.strata[i], counts) for i in available}
+            best = max(gains.values())
+            if best > 0:
+                candidates = [i for i in available if gains[i] == best]
+                fewest = min(used[i] for i in candidates)
+                candidates = [i for i in candidates if used[i] == fewest]
+            elif fill:
+                loads = {i: self._load(self.strata[i], counts) for i in available}
+                lightest = min(loads.values())
+                candidates = [i for i in available if loads[i] == lightest]
+            else:
+                break
+            index = self.rng.choice(candidates)
+            cell = dict(self.strata[index])
+            cell.update(zip(self.free_names, self.free_views[index][used[index]]))
+            used[index] += 1
+            for factor in self.quotas:
+                counts[factor][cell[factor]] += 1
+            cells.append(cell)
+
+        self.unmet = {}
+        for factor, quota in self.quotas.items():
+            missing = {value: n - counts[factor][value] for value, n in quota.items() if counts[factor][value] < n}
+            if missing:
+                self.unmet[factor] = missing
+        return cells
+
+
+def marginals(cells: List[dict], factors: List[str]) -> Dict[str, Dict[Any, int]]:
+    """
+    Count the cells per value of each factor, e.g. to print the balance of a plan.
+    """
+    res = {factor: defaultdict(int) for factor in factors}
+    for cell in cells:
+        for factor in factors:
+            res[factor][cell[factor]] += 1
+    return {factor: dict(values) for factor, values in res.items()}
@@ -0,0 +1,238 @@
+import os
+import subprocess
+import time
+import weakref
+from typing import Any, Callable, List, Optional, Tuple, Union
+
+import zmq
+from tdw.controller import Controller
+from tdw.output_data import Version
+
+from serialization import dumps
+
+# A controller that survives the build.
+# The build exits when a command fails, and a plain Controller then blocks forever in communicate(), or the next
+# communicate() of the script (often the "terminate" of a finally block) does. SupervisedController starts the build
+# itself with the start_tdw_server of the script, and while it waits for a response it checks every POLL_INTERVAL
+# that the process is still alive, and gives up after recv_timeout seconds without a response (a hung build).
+# Either way communicate() raises BuildDied, and every later call too, until respawn() kills the build, starts a new
+# one on the same port and display, restores the add-ons and calls on_start to load the scene again.
+#
+# run_sample() runs one sample of a sweep: if the build dies during the sample, the build is respawned and the sample
+# run again, up to max_attempts times, then the sample is skipped and the reason appended to skip_log.
+#
+# c = SupervisedController(port=1071, display=":4", start_server=start_tdw_server, on_start=load_scene)
+# done, result = c.run_sample(sample_id, render_sample, sample_id)
+
+# Seconds between two liveness checks while waiting for the build
+POLL_INTERVAL = 1.0
+# Seconds without a response before the build is considered hung. Loading a scene downloads its asset bundles.
+RECV_TIMEOUT = 300.0
+# Seconds for a new build to connect
+STARTUP_TIMEOUT = 120.0
+MAX_ATTEMPTS = 3
+
+
+class BuildDied(RuntimeError):
+    """
+    The build exited or stopped responding.
+    """
+
+
+class _SupervisedSocket:
+    """
+    The socket of the controller, whose receives give up when the build dies.
+    """
+
+    def __init__(self, socket: zmq.Socket, controller: "SupervisedController"):
+        self.socket = socket
+        # No reference cycle: the socket is closed, and its port freed, as soon as the controller is dropped
+        self.controller = weakref.proxy(controller)
+
+    def recv(self, *args, **kwargs):
+        self.controller.wait_for_build(self.socket, self.controller.recv_timeout)
+        return self.socket.recv(*args, **kwargs)
+
+    def recv_multipart(self, *args, **kwargs):
+        self.controller.wait_for_build(self.socket, self.controller.recv_timeout)
+        return self.socket.recv_multipart(*args, **kwargs)
+
+    def __getattr__(self, name: str):
+        return getattr(self.socket, name)
+
+
+class SupervisedController(Controller):
+    def __init__(self, port: int = 1071, display: str = ":4",
+                 start_server: Callable[..., Optional[subprocess.Popen]] = None,
+                 on_start: Callable[["SupervisedController"], None] = None, recv_timeout: float = RECV_TIMEOUT,
+                 startup_timeout: float = STARTUP_TIMEOUT, startup_wait: float = 0, max_attempts: int = MAX_ATTEMPTS,
+                 skip_log: str = None, check_version: bool = True):
+        """
+        :param port: The port of the build.
+        :param display: The display of the build.
+        :param start_server: start_server(display=..., port=...) starts a build and returns its process, e.g. the
+                             start_tdw_server of utils.py. None if the build is started by someone else; the
+                             process is then not checked and respawn() only reconnects.
+        :param on_start: Called with the controller after every respawn, e.g. to load the scene again.
+        :param recv_timeout: Seconds without a response before the build is considered hung.
+        :param startup_timeout: Seconds for a build to connect.
+        :param startup_wait: Seconds to wait after a build connected.
+        :param max_attempts: The number of times run_sample() runs a sample before skipping it.
+        :param skip_log: A JSONL file the skipped samples are appended to, with the reason. None to only print them.
+        :param check_version: If True, compare the version of the tdw module to the latest on PyPi.
+        """
+        self.port = port
+        self.display = display
+        self.start_server = start_server
+        self.on_start = on_start
+        self.recv_timeout = recv_timeout
+        self.startup_timeout = startup_timeout
+        self.startup_wait = startup_wait
+        self.max_attempts = max_attempts
+        self.skip_log = skip_log
+        self.process: Optional[subprocess.Popen] = None
+        # Why the build is dead, None while it is alive
+        self.dead: Optional[str] = None
+        self.respawns = 0
+        self.skipped: List[dict] = []
+        self.add_ons = []
+        self.socket = None
+        self._context: Optional[zmq.Context] = None
+        if check_version:
+            self._check_pypi_version()
+        try:
+            self._connect()
+        except BuildDied:
+            # No controller is returned to kill the build that never connected
+            self.kill()
+            raise
+
+    def _connect(self):
+        """
+        Start a build, wait for it to connect and set it up like Controller.__init__ does.
+        """
+        if self.start_server is not None:
+            self.process = self.start_server(display=self.display, port=self.port)
+        self._context = zmq.Context()
+        socket = self._context.socket(zmq.REP)
+        socket.setsockopt(zmq.LINGER, 0)
+        socket.bind(f"tcp://*:{self.port}")
+        self.socket = _SupervisedSocket(socket, self)
+        self.wait_for_build(socket, self.startup_timeout)
+        socket.recv()
+        self.dead = None
+
+        # The add-ons are initialized after the scene is loaded again
+        add_ons, self.add_ons = self.add_ons, []
+        try:
+            resp = Controller.communicate(self, [{"$type": "set_error_handling"},
+                                                 {"$type": "send_version"},
+                                                 {"$type": "load_scene", "scene_name": "ProcGenScene"}])
+        finally:
+            self.add_ons = add_ons
+        self._is_standalone = False
+        self._tdw_version = ""
+        self._unity_version = ""
+        for r in resp[:-1]:
+            if Version.get_data_type_id(r) == "vers":
+                v = Version(r)
+                self._tdw_version = v.get_tdw_version()
+                self._unity_version = v.get_unity_version()
+                self._is_standalone = v.get_standalone()
+                break
+        time.sleep(self.startup_wait)
+
+    def alive(self) -> bool:
+        return self.dead is None and (self.process is None or self.process.poll() is None)
+
+    def wait_for_build(self, socket: zmq.Socket, timeout: float):
+        """
+        Wait until the socket can be read, checking that the build is alive. Raises BuildDied.
+        """
+        deadline = time.monotonic() + timeout
+        while not socket.poll(int(POLL_INTERVAL * 1000)):
+            if self.process is not None and self.process.poll() is not None:
+                raise BuildDied(f"The build on port {self.port} exited with code {self.process.returncode}")
+            if time.monotonic() > deadline:
+                raise BuildDied(f"The build on port {self.port} did not respond in {timeout:.0f}s")
+
+    def communicate(self, commands: Union[dict, List[dict]]) -> list:
+        if self.dead is None and self.process is not None and self.process.poll() is not None:
+            self.dead = f"The build on port {self.port} exited with code {self.process.returncode}"
+        if self.dead is not None:
+            raise BuildDied(self.dead)
+        try:
+            return super().communicate(commands)
+        except BuildDied as e:
+            # The socket is waiting for a response that will never come: nothing can be sent until respawn()
+            self.dead = str(e)
+            raise
+
+    def kill(self):
+        """
+        Kill the build and close the socket.
+        """
+        if self.process is not None and self.process.poll() is None:
+            # start_tdw_server runs the build through a shell
+            subprocess.run(["pkill", "-KILL", "-P", str(self.process.pid)], check=False)
+            self.process.kill()
+            self.process.wait()
+        self.close()
+
+    def close(self):
+        """
+        Close the socket and free the port, e.g. after sending "terminate".
+        """
+        if self.socket is not None:
+            self.socket.close(linger=0)
+            self._context.term()
+            self.socket = None
+        self.dead = self.dead or f"The controller on port {self.port} was closed"
+
+    def respawn(self, add_ons: list = None):
+        """
+        Replace the build with a new one and load the scene again.
+
+        :param add_ons: The add-ons of the controller after the respawn. Default: the current ones.
+        """
+        self.kill()
+        self.respawns += 1
+        if add_ons is not None:
+            self.add_ons[:] = add_ons
+        for add_on in self.add_ons:
+            add_on.initialized = False
+        print(f"Respawning the build on port {self.port}, display {self.display}")
+        self._connect()
+        if self.on_start is not None:
+            self.on_start(self)
+
+    def run_sample(self, sample: Any, trial: Callable[..., Any], *args, **kwargs) -> Tuple[bool, Any]:
+        """
+        Run trial(*args, **kwargs), again on a new build if the build dies, up to max_attempts times.
+        The add-ons that the failed attempts added are removed before the next one.
+
+        :param sample: The id of the sample, for the skip log.
+        :return: (True, the result of trial) or (False, None) if the sample was skipped.
+        """
+        add_ons = list(self.add_ons)
+        reason = None
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                if not self.alive():
+                    self.respawn(add_ons)
+                return True, trial(*args, **kwargs)
+            except BuildDied as e:
+                reason = str(e)
+                self.dead = self.dead or reason
+                print(f"Sample {sample}, attempt {attempt} / {self.max_attempts}: {reason}")
+        self.skip(sample, reason)
+        return False, None
+
+    def skip(self, sample: Any, reason: str):
+        record = {"sample": str(sample), "reason": reason, "attempts": self.max_attempts, "time": time.time()}
+        self.skipped.append(record)
+        print(f"Skipping sample {sample}: {reason}")
+        if self.skip_log is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.skip_log)), exist_ok=True)
+            with open(self.skip_log, "a") as f:
+                f.write(dumps(record) + "\n")
@@ -8,12 +8,23 @@ from typing import List, Dict, Union
 import math
 from tqdm import tqdm
 from interface import ObjectType
+from instrumentation import RoundTripRecorder
+from supervised_controller import SupervisedController, RECV_TIMEOUT, MAX_ATTEMPTS
 from tdw.librarian import ModelLibrarian
 
 base_dir = os.path.dirname(os.path.abspath(__file__))
 DEFAULT_OUTPUT_PATH = os.path.join(base_dir, "image_capture")
+# The samples skipped after the build died max_attempts times, relative to the output path
+SKIP_LOG = "skipped_samples.jsonl"
 
 class AbstractTask(abc.ABC):
+    # Seconds to wait for the build after connecting to it (0 against a mock server, see mock_tdw_server.py)
+    startup_wait = 5
+    # Seconds without a response before the build is considered hung, and attempts of a sample before it is skipped
+    # (see supervised_controller.py)
+    recv_timeout = RECV_TIMEOUT
+    max_attempts = MAX_ATTEMPTS
+
     def __init__(self, output_path:str = DEFAULT_OUTPUT_PATH,
                  port:int = 1071,
                  display:str = ":4",
@@ -23,7 +34,8 @@ class AbstractTask(abc.ABC):
                  render_quality:int = 10,
                  name:str = "default",
                  camera: List[str] = ["top", "left", "right", "front", "back"],
-                 library:Literal["models_core.json", "models_special.json"] = "models_core.json"):
+                 library:Literal["models_core.json", "models_special.json"] = "models_core.json",
+                 timings: Union[str, RoundTripRecorder] = None):
         
         self.name = name
         if output_path is None or output_path == "default":
@@ -41,6 +53,11 @@ class AbstractTask(abc.ABC):
         self.special_librarian = ModelLibrarian("models_special.json")
         self.core_librarian = ModelLibrarian("models_core.json")
         self.image_ticks = 0
+        # Round trip timings: a JSON file to write them to, or a recorder shared by several tasks
+        if isinstance(timings, RoundTripRecorder):
+            self.timings, self.timings_path = timings, None
+        else:
+            self.timings, self.timings_path = RoundTripRecorder(enabled=timings is not None), timings
         
         self.init_scene()
         
@@ -56,37 +73,50 @@ class AbstractTask(abc.ABC):
             self.port = port
         
         print(f"Launching TDW server on port {self.port}, display {self.display}")
-        self.start_tdw_server(display=self.display, port=self.port)
-    
         try:
-            self.c = Controller(port=self.port, launch_build=False)
+            # The controller starts the build, and a new one with the scene of the task if it dies
+            self.c = SupervisedController(port=self.port, display=self.display, start_server=self.start_tdw_server,
+                                          on_start=self.restart_scene, recv_timeout=self.recv_timeout,
+                                          startup_wait=self.startup_wait, max_attempts=self.max_attempts,
+                                          skip_log=os.path.join(self.output_path, SKIP_LOG))
+            self.timings.attach(self.c)
         except Exception as e:
             print(f"Error: {e}")
             raise e
 
-        time.sleep(5)
-        self.commands = [{"$type": "set_screen_size", "width": self.screen_size[0], "height": self.screen_size[1]}, 
+        self.commands = self.scene_commands()
+        self.step()
+
+    def scene_commands(self) -> List[Dict]:
+        commands = [{"$type": "set_screen_size", "width": self.screen_size[0], "height": self.screen_size[1]}, 
                 {"$type": "set_render_quality", "render_quality": self.render_quality},
                 #{"$type": "set_field_of_view", "field_of_view": 55},
                 ]
-        
-        
-        
-        self.commands.append(self.c.get_add_scene(self.scene))
-            
+        commands.append(self.c.get_add_scene(self.scene))
+        return commands
+
+    def restart_scene(self, c):
+        # The build was respawned: the commands of the failed attempt are dropped and the scene is loaded again
+        self.commands = self.scene_commands()
         self.step()
+        self.image_ticks = 0
 
     @abc.abstractmethod
     def run(self):
         pass
     
-    def step(self, reset=True):
-        resp = self.c.communicate(self.commands)
+    def step(self, reset=True, phase=None):
+        with self.timings.phase(phase):
+            resp = self.c.communicate(self.commands)
         if reset:
             self.commands = []
         self.image_ticks += 1
         return resp
 
+    def write_timings(self):
+        # Only if the task was created with a path; a shared recorder is written by its owner
+        self.timings.write(self.timings_path)
+
     
     def start_tdw_server(self, display=":4", port=1071):
         # DISPLAY=:4 /data/shared/sim/benchmark/tdw/build/TDW.x86_64 -port=1071
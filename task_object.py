@@ -2,9 +2,9 @@ from typing import Tuple, List, Literal
 from tdw.librarian import ModelLibrarian
 from tdw.controller import Controller
 from tdw.tdw_utils import TDWUtils
-import itertools
-import random
 
+from combinatorics import sample_permutations, sample_product
+from command_compiler import COMPILER
 from task_abstract import AbstractTask, ObjectType, DEFAULT_OUTPUT_PATH
 from tdw_object_utils import SELECTED_COLORS, SELECTED_OBJECTS, SELECTED_MATERIALS, SELECTED_TEXTURES, SELECTED_SIZES
 
@@ -23,8 +23,9 @@ class ObjectTask(AbstractTask):
                  render_quality:int = 10,
                  name:str = "default",
                  camera: List[str] = ["top", "left", "right", "front", "back"],
-                 library:Literal["models_core.json", "models_special.json"] = "models_core.json"):
-        super().__init__(output_path, port, display, scene, screen_size, physics, render_quality, name, camera, library)
+                 library:Literal["models_core.json", "models_special.json"] = "models_core.json",
+                 timings=None):
+        super().__init__(output_path, port, display, scene, screen_size, physics, render_quality, name, camera, library, timings)
         self.attr_generate_func = {
             "color": self.generate_attr_pair,
             "shape": self.generate_attr_pair,
@@ -34,14 +35,11 @@ class ObjectTask(AbstractTask):
         }
         
     def get_model_record(self, obj_type):
+        # The special library first, then the core library (see command_compiler.py)
         try:
-            return "models_special.json", self.special_librarian.get_record(obj_type)
-        except:
-            try:
-                # Automatically use the core library
-                return "models_core.json", self.core_librarian.get_record(obj_type)
-            except:
-                raise ValueError(f"Model {obj_type} not found in any library.")
+            return COMPILER.model_record(obj_type)
+        except ValueError:
+            raise ValueError(f"Model {obj_type} not found in any library.")
 
     def generate_regular_object(self, obj_type, position={"x": 0, "y": 0.2, "z": 0}, scale=0.5, color="red",rotation={"x": 0, "y": 0, "z": 0}, 
                                 material=None, texture_scale=1, motion="static", mass=2, bounciness=0.7):
@@ -64,77 +62,44 @@ class ObjectTask(AbstractTask):
         #print(f"Object name: {object_info.model_name}, with id = {object_info.object_id}")
         
         # attention: here the gravity should be turned off
-        self.commands.extend(self.c.get_add_physics_object(model_name=object_info.model_name,
-                                                        library=object_info.library,
-                                                        gravity=False,
-                                                        # default_physics_values=False, # weird volume error
-                                                        position=object_info.position,
-                                                        rotation=object_info.rotation,
-                                                        scale_factor=object_info.scale_factor,
-                                                        object_id=object_info.object_id,
-                                                        dynamic_friction=0.4,
-                                                        static_friction=0.4,
-                                                        mass = mass,
-                                                        bounciness = bounciness,
-                                                        ))
-        
-        
-        
-        if object_info.material is not None:
-            self.commands.append(self.c.get_add_material(material_name=object_info.material))
-            self.commands.extend(TDWUtils.set_visual_material(c=self.c, substructure=object_info.model_record.substructure, material=object_info.material, object_id=object_info.object_id))
-        
-        if object_info.texture_scale != 1:
-            for sub_object in object_info.model_record.substructure:
-                self.commands.append({"$type": "set_texture_scale",
-                                      "object_name": sub_object["name"],
-                                        "id": object_info.object_id,
-                                        "scale": {"x": object_info.texture_scale, "y": object_info.texture_scale}})
-        self.commands.append({"$type": "set_color",
-                            "color": object_info.color,
-                            "id": object_info.object_id})
-                                    
+        # The add_object, material, texture scale and color commands, from the template of the model
+        self.commands.extend(COMPILER.object_commands(object_info,
+                                                      gravity=False,
+                                                      # default_physics_values=False, # weird volume error
+                                                      dynamic_friction=0.4,
+                                                      static_friction=0.4,
+                                                      mass=mass,
+                                                      bounciness=bounciness))
         
         return object_info
     
     
     #Now clearly define the color, shape, material, texture, size pairs because these may be further customized depending on the task
+    #The pairs are lazy shuffled views (see combinatorics.py): indexing, slicing and iterating work like the old shuffled lists,
+    #but nothing is materialized, and view.shard(i, n) splits the pairs between parallel workers.
     def generate_color_pair(self, choices=SELECTED_COLORS):
-        color_pairs = list(itertools.permutations(choices, self.num_objects))
-        random.shuffle(color_pairs)
-        return color_pairs
+        return sample_permutations(choices, self.num_objects)
     
     def generate_shape_pair(self, choices=SELECTED_OBJECTS, num=None):
         if num is None:
             num = self.num_objects
-        shape_pairs = list(itertools.permutations(choices, num))
-        random.shuffle(shape_pairs)
-        return shape_pairs
+        return sample_permutations(choices, num)
     
     def generate_material_pair(self, choices=SELECTED_MATERIALS):
-        material_pairs = list(itertools.permutations(choices, self.num_objects))
-        random.shuffle(material_pairs)
-        return material_pairs
+        return sample_permutations(choices, self.num_objects)
     
     def generate_texture_pair(self, choices=SELECTED_TEXTURES):
-        texture_pairs = list(itertools.permutations(choices, self.num_objects))
-        random.shuffle(texture_pairs)
-        return texture_pairs
+        return sample_permutations(choices, self.num_objects)
 
     def generate_size_pair(self, choices=SELECTED_SIZES, product=False):
         if product:
-            size_pairs = list(itertools.product(choices, choices))
-        else:
-            size_pairs = list(itertools.permutations(choices, self.num_objects))
-        random.shuffle(size_pairs)
-        return size_pairs
+            return sample_product(choices, choices)
+        return sample_permutations(choices, self.num_objects)
     
     def generate_attr_pair(self, choices, num=None):
         if num is None:
             num = self.num_objects
-        attr_pairs = list(itertools.permutations(choices, num))
-        random.shuffle(attr_pairs)
-        return attr_pairs
+        return sample_permutations(choices, num)
     
     def adapt_center_position(self, positions, center_position):
         if(type(positions) == list):
@@ -1,16 +1,18 @@
 import os
 import sys
 
-import yaml
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from typing import List
-from interface import ObjectType, AVAILABLE_CAMERA_POS
+from interface import ObjectType, AVAILABLE_CAMERA_POS, AVAILABLE_COLOR
 from tdw.tdw_utils import TDWUtils
 
 from tdw.add_ons.image_capture import ImageCapture
 from tdw.add_ons.third_person_camera import ThirdPersonCamera
+from pipeline import DeferredImageCapture
+from scene_config import get_scene_settings
 
 import numpy as np
+from serialization import numpy_to_python
 
 #SELECTED_SCENES = ["box_room_2018", "monkey_physics_room", "ruin", "suburb_scene_2018"]
 SELECTED_SCENES = ["box_room_2018"]
@@ -63,20 +65,6 @@ SELECTED_COLORS = {
 def array_to_transform(array):
     return {"x": array[0], "y": array[1], "z": array[2]}
 
-def numpy_to_python(obj):
-    if isinstance(obj, np.integer):
-        return int(obj)
-    elif isinstance(obj, np.floating):
-        return float(obj)
-    elif isinstance(obj, np.ndarray):
-        return obj.tolist()
-    elif isinstance(obj, dict):
-        return {k: numpy_to_python(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [numpy_to_python(item) for item in obj]
-    else:
-        return obj
-    
 def coordinate_addition(coordinates):
     total = np.array([0.0,0.0,0.0])
     for coordinate in coordinates:
@@ -124,11 +112,10 @@ def get_cameras(camera_position: str, scene: str, offset=[0.0, 0.0, 0.0]):
             offset["y"] += 0.3
         else:
             offset[1] = offset[1] + 0.3
-    with open('/data/shared/sim/benchmark/benchmark_TDW/scene_settings.yaml', 'r') as file:
-        config = yaml.safe_load(file)[scene]['camera']
-    return ThirdPersonCamera(position=coordinate_addition([config[camera_position], offset]),
+    settings = get_scene_settings(scene)
+    return ThirdPersonCamera(position=coordinate_addition([settings.camera(camera_position), offset]),
                                 avatar_id=camera_position,
-                                look_at=coordinate_addition([config["look_at"], offset]))
+                                look_at=coordinate_addition([settings.look_at, offset]))
 
 
 def get_camera_views(motion, camera_view: List[str]):
@@ -148,36 +135,35 @@ def get_camera_views(motion, camera_view: List[str]):
     else:
         return camera_view
 
-def add_cameras(c, camera_ids, output_pth, scene, offset={}):
+def add_cameras(c, camera_ids, output_pth, scene, offset={}, deferred=False, on_demand=False):
+    # deferred: keep the images for the persist stage of a SamplePipeline instead of writing them
+    # on_demand: with deferred, only capture the frames requested with capture.request()
     for cam in camera_ids:
         c.add_ons.append(get_cameras(cam, scene, offset[cam] if cam in offset else [0.0, 0.0, 0.0]))
-    capture = ImageCapture(avatar_ids=camera_ids, path=output_pth, png=True)
+    if deferred:
+        capture = DeferredImageCapture(avatar_ids=camera_ids, path=output_pth, png=True, on_demand=on_demand)
+    else:
+        capture = ImageCapture(avatar_ids=camera_ids, path=output_pth, png=True)
     c.add_ons.append(capture)
+    return capture
 
 def format_dict_to_string(d:dict):
-    res = ""
-    for key, value in d.items():
-        res += f"{key}={value},"
-    return res
+    return "".join(f"{key}={value}," for key, value in d.items())
+
+# The color part of the ids, by color name
+_COLOR_STRINGS = {name: format_dict_to_string(color) for name, color in AVAILABLE_COLOR.items()}
 
 def get_object_id(object_type:ObjectType):
-    TEMPLATE = "{model_name}_pos={position}_rot={rotation}_scale={scale_factor}_texture_scale={texture_scale}_material={material}_color={color}"
-    res = TEMPLATE.format(model_name=object_type.model_name,
-                          position=format_dict_to_string(object_type.position),
-                          rotation=format_dict_to_string(object_type.rotation),
-                          scale_factor=format_dict_to_string(object_type.scale_factor),
-                          texture_scale=object_type.texture_scale,
-                          material=object_type.material,
-                          color=format_dict_to_string(object_type.color))
-    return res
+    ### Built from the fields of the object: its scale_factor and color dicts are not built for it
+    scale = object_type.scale
+    return (f"{object_type.model_name}_pos={format_dict_to_string(object_type.position)}"
+            f"_rot={format_dict_to_string(object_type.rotation)}_scale=x={scale},y={scale},z={scale},"
+            f"_texture_scale={object_type.texture_scale}_material={object_type.material}"
+            f"_color={_COLOR_STRINGS[object_type.color_name]}")
 
 def get_object_shape_id(object_type:ObjectType):
-    TEMPLATE = "{model_name}_texture_scale={texture_scale}_material={material}_color={color}"
-    res = TEMPLATE.format(model_name=object_type.model_name,
-                          texture_scale=object_type.texture_scale,
-                          material=object_type.material,
-                          color=format_dict_to_string(object_type.color))
-    return res
+    return (f"{object_type.model_name}_texture_scale={object_type.texture_scale}_material={object_type.material}"
+            f"_color={_COLOR_STRINGS[object_type.color_name]}")
 
 def get_scene(scene_name):
     if scene_name not in SELECTED_SCENES:
@@ -185,22 +171,14 @@ def get_scene(scene_name):
     return scene_name
 
 def get_position(scene: str, x_range: tuple, y_range: tuple, z_range: tuple):
-    with open('/data/shared/sim/benchmark/benchmark_TDW/scene_settings.yaml', 'r') as file:
-        config = yaml.safe_load(file)[scene]['object']['center']
-    x, y, z = config
+    x, y, z = get_scene_settings(scene).anchors['center']
     position={"x": x + np.random.uniform(x_range[0], x_range[1]), "y": y +np.random.uniform(y_range[0], y_range[1]), "z": z + np.random.uniform(z_range[0], z_range[1])}
     return position
 
 def get_bottom_position(scene: str):
-    with open('/data/shared/sim/benchmark/benchmark_TDW/scene_settings.yaml', 'r') as file:
-        config = yaml.safe_load(file)[scene]['object']['bottom']
-    x, y, z = config
-    position={"x": x, "y": y, "z": z}
-    return position
+    return get_scene_settings(scene).anchor('bottom')
 
 def get_position_with_offset(scene: str, x_range: tuple, y_range: tuple, z_range: tuple, offset):
-    with open('/data/shared/sim/benchmark/benchmark_TDW/scene_settings.yaml', 'r') as file:
-        config = yaml.safe_load(file)[scene]['object']['center']
-    x, y, z = config
+    x, y, z = get_scene_settings(scene).anchors['center']
     position={"x": x + np.random.uniform(x_range[0], x_range[1]) + offset, "y": y +np.random.uniform(y_range[0], y_range[1]), "z": z + np.random.uniform(z_range[0], z_range[1]) + offset}
     return position
@@ -15,24 +15,10 @@ import cv2
 import shutil
 import numpy as np
 import json
+from serialization import dumps
 import traceback
 from tqdm import tqdm
 
-def numpy_to_python(obj):
-    if isinstance(obj, np.integer):
-        return int(obj)
-    elif isinstance(obj, np.floating):
-        return float(obj)
-    elif isinstance(obj, np.ndarray):
-        return obj.tolist()
-    elif isinstance(obj, dict):
-        return {k: numpy_to_python(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [numpy_to_python(item) for item in obj]
-    else:
-        return obj
-
-
 def get_cameras(camera_id):
     if camera_id not in AVAILABLE_CAMERA_POS:
         raise ValueError(f"Camera id {camera_id} not found in AVAILABLE_CAMERA_POS")
@@ -347,8 +333,7 @@ class TemporalExtension(AbstractTask):
             # write the item in output_res_cam into jsonl
             with open(os.path.join(self.output_path, self.name, "output_res_cam.jsonl"), "a") as f:
                 for cam in self.camera:
-                    json.dump(numpy_to_python(output_res_cam[cam]), f)
-                    f.write("\n")
+                    f.write(dumps(output_res_cam[cam]) + "\n")
                     
             # we will concate the query imgs in the first line, and the candidates in the second line, and output a img
             # 3 query imgs first line
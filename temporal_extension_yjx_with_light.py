@@ -1,5 +1,5 @@
-import itertools
 import random
+from combinatorics import sample_permutations
 from typing import Literal, Tuple, List, Dict, Any
 from tdw_object_utils import *
 from task_abstract import AbstractTask
@@ -18,6 +18,7 @@ import cv2
 import shutil
 import numpy as np
 import json
+from serialization import dumps
 import traceback
 from tqdm import tqdm
 from tdw.add_ons.interior_scene_lighting import InteriorSceneLighting
@@ -58,21 +59,6 @@ def setup_scene(screen_size, render_quality, c: Controller, scene_name: str):
     c.communicate(commands)
     print(f"Scene '{scene_name}' setup complete.")
 
-def numpy_to_python(obj):
-    if isinstance(obj, np.integer):
-        return int(obj)
-    elif isinstance(obj, np.floating):
-        return float(obj)
-    elif isinstance(obj, np.ndarray):
-        return obj.tolist()
-    elif isinstance(obj, dict):
-        return {k: numpy_to_python(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [numpy_to_python(item) for item in obj]
-    else:
-        return obj
-
-
 def filter_camera_view(motion, camera_view: List[str]):
     """
     We need to filter the camera view based on the motion of the object,
@@ -367,8 +353,7 @@ class TemporalExtension(AbstractTask):
             # write the item in output_res_cam into jsonl
             with open(os.path.join(self.output_path, self.name, "index.jsonl"), "a") as f:
                 for cam in self.camera:
-                    json.dump(numpy_to_python(output_res_cam[cam]), f)
-                    f.write("\n")
+                    f.write(dumps(output_res_cam[cam]) + "\n")
                     
             # we will concate the query imgs in the first line, and the candidates in the second line, and output a img
             # 3 query imgs first line
@@ -433,20 +418,15 @@ def main(cfg: DictConfig):
     pbar = tqdm(total=target_size)
     seed = 0
     
-    material_pairs = list(itertools.permutations(SELECTED_MATERIALS, 2))
-    random.shuffle(material_pairs)
+    material_pairs = sample_permutations(SELECTED_MATERIALS, 2)
 
-    texture_pairs = list(itertools.permutations(SELECTED_TEXTURES, 2))
-    random.shuffle(texture_pairs)
+    texture_pairs = sample_permutations(SELECTED_TEXTURES, 2)
 
-    size_pairs = list(itertools.permutations(SELECTED_SIZES, 2))
-    random.shuffle(size_pairs)
+    size_pairs = sample_permutations(SELECTED_SIZES, 2)
 
-    object_pairs = list(itertools.permutations(SELECTED_OBJECTS, 2))
-    random.shuffle(object_pairs)
+    object_pairs = sample_permutations(SELECTED_OBJECTS, 2)
 
-    color_pairs = list(itertools.permutations(SELECTED_COLORS, 2))
-    random.shuffle(color_pairs)
+    color_pairs = sample_permutations(SELECTED_COLORS, 2)
     
     SELECTED_SCENES = ["ruin","monkey_physics_room","box_room_2018","suburb_scene_2018"]
     scenes = SELECTED_SCENES
@@ -454,13 +434,13 @@ def main(cfg: DictConfig):
     for scene in SELECTED_SCENES:
         setup_scene(cfg.screen_size, cfg.render_quality, c,scene)
         for texture1, texture2 in texture_pairs[:2]:
-            random.shuffle(size_pairs)
+            size_pairs = sample_permutations(SELECTED_SIZES, 2)
             for size1, size2 in size_pairs[:4]:
-                random.shuffle(object_pairs)
+                object_pairs = sample_permutations(SELECTED_OBJECTS, 2)
                 for object1, object2 in object_pairs[:8]: 
-                    random.shuffle(color_pairs)
+                    color_pairs = sample_permutations(SELECTED_COLORS, 2)
                     for color1, color2 in color_pairs[:10]:
-                        random.shuffle(texture_pairs)
+                        texture_pairs = sample_permutations(SELECTED_TEXTURES, 2)
                         task = None
                         task = TemporalExtension(
         controller=c,
@@ -17,21 +17,16 @@ import numpy as np
 import json
 import traceback
 from tqdm import tqdm
+import itertools
+from combinatorics import PermutationSpace, ProductSpace
+from case_registry import CaseSpace, CaseLedger, case_hash
+from render_cache import RenderCache, CACHE_DIR_NAME, sample_spec, spec_hash
+from index_writer import IndexWriter
+from instrumentation import RoundTripRecorder
+from supervised_controller import BuildDied
+from tdw_object_utils import get_object_id, get_object_shape_id
 
-def numpy_to_python(obj):
-    if isinstance(obj, np.integer):
-        return int(obj)
-    elif isinstance(obj, np.floating):
-        return float(obj)
-    elif isinstance(obj, np.ndarray):
-        return obj.tolist()
-    elif isinstance(obj, dict):
-        return {k: numpy_to_python(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [numpy_to_python(item) for item in obj]
-    else:
-        return obj
-
+GENERATOR_VERSION = 1 # bump when the rendering changes, to invalidate the render cache
 
 def get_cameras(camera_id):
     if camera_id not in AVAILABLE_CAMERA_POS:
@@ -59,31 +54,6 @@ def filter_camera_view(motion, camera_view: List[str]):
         return camera_view
 
 
-def format_dict_to_string(d:dict):
-    res = ""
-    for key, value in d.items():
-        res += f"{key}={value},"
-    return res
-
-def get_object_id(object_type:ObjectType):
-    TEMPLATE = "{model_name}_pos={position}_rot={rotation}_scale={scale_factor}_texture_scale={texture_scale}_material={material}_color={color}"
-    res = TEMPLATE.format(model_name=object_type.model_name,
-                          position=format_dict_to_string(object_type.position),
-                          rotation=format_dict_to_string(object_type.rotation),
-                          scale_factor=format_dict_to_string(object_type.scale_factor),
-                          texture_scale=object_type.texture_scale,
-                          material=object_type.material,
-                          color=format_dict_to_string(object_type.color))
-    return res
-
-def get_object_shape_id(object_type:ObjectType):
-    TEMPLATE = "{model_name}_texture_scale={texture_scale}_material={material}_color={color}"
-    res = TEMPLATE.format(model_name=object_type.model_name,
-                          texture_scale=object_type.texture_scale,
-                          material=object_type.material,
-                          color=format_dict_to_string(object_type.color))
-    return res
-
 class TemporalPositioning(AbstractTask):
     def __init__(self, output_path:str = None,
                  port:int = 1071,
@@ -94,22 +64,38 @@ class TemporalPositioning(AbstractTask):
                  render_quality:int = 10,
                  name:str = "temporal_positioning",
                  library:str = "models_core.json",
-                 camera: List[str] = AVAILABLE_CAMERA_POS.keys()):
+                 camera: List[str] = AVAILABLE_CAMERA_POS.keys(),
+                 timings=None):
         
         super().__init__(output_path=output_path, port=port, 
                          display=display, scene=scene, 
                          screen_size=screen_size, physics=physics, 
-                         render_quality=render_quality, name=name, library=library, camera=camera)
+                         render_quality=render_quality, name=name, library=library, camera=camera,
+                         timings=timings)
+        self.render_cache = RenderCache(os.path.join(self.output_path, CACHE_DIR_NAME))
         
 
 
         
 
+    def write_index(self, records: List[Dict[str, Any]], index_writer: IndexWriter = None):
+        """
+        Append records to output_res_cam.jsonl, through index_writer if given.
+        """
+        if index_writer is None:
+            with IndexWriter(os.path.join(self.output_path, self.name, "output_res_cam.jsonl"), append=True) as writer:
+                self.write_index(records, writer)
+            return
+        for record in records:
+            index_writer.write(record)
+
     def run(self, 
             main_obj_list: List[ObjectType] = None,
             fixed_obj_list: List[ObjectType] = None,
-            seed: int = 12):
+            seed: int = 12,
+            index_writer: IndexWriter = None):
         
+        self.timings.set_sample(seed)
         if main_obj_list is None or fixed_obj_list is None:
             self.object_list: List[ObjectType] = [
             ObjectType(
@@ -162,7 +148,19 @@ class TemporalPositioning(AbstractTask):
         self.main_object_shaple_ids = [get_object_id(obj) for obj in main_obj_list]
         self.fixed_object_shape_ids = [get_object_id(obj) for obj in fixed_obj_list]
         
+        # Everything random below is drawn from np.random, which main seeds with the case id: the seed completes the spec
+        cameras = filter_camera_view(motion=main_obj_list[0].motion, camera_view=self.camera)
+        spec = sample_spec(self.name, GENERATOR_VERSION, self.scene, self.object_list, {cam: AVAILABLE_CAMERA_POS[cam] for cam in cameras},
+                           self.screen_size, self.render_quality, seed=seed)
+        cache_key = spec_hash(spec)
+        output_pth = os.path.join(self.output_path, self.name, self.expr_id)
+        
         try:
+            cached = self.render_cache.fetch(cache_key, output_pth)
+            if cached is not None:
+                self.write_index(cached["meta"], index_writer)
+                return
+            
             move_object_dict = {}
             
             for obj in self.object_list:
@@ -247,7 +245,11 @@ class TemporalPositioning(AbstractTask):
                         move_object_dict[obj.object_id].execute_movement(self.c, obj.motion, magnitude=0.15)
                     break
             # step1: randomly pick a range,which has length of 4, from (0, 10)
-            random_start = np.random.randint(0, MOVE_STEP - PIC_NUM)
+            # with room for an image more than 3 steps away from it, otherwise the draw below never ends
+            while True:
+                random_start = np.random.randint(0, MOVE_STEP - PIC_NUM)
+                if random_start - 3 > 0 or random_start + PIC_NUM - 1 + 3 < MOVE_STEP - 1:
+                    break
             query_image_index = []
             other_image_index = []
             for i in range(PIC_NUM):
@@ -371,10 +373,7 @@ class TemporalPositioning(AbstractTask):
                 output_res_cam[cam]["scene"] = self.scene
 
             # write the item in output_res_cam into jsonl
-            with open(os.path.join(self.output_path, self.name, "output_res_cam.jsonl"), "a") as f:
-                for cam in self.camera:
-                    json.dump(numpy_to_python(output_res_cam[cam]), f)
-                    f.write("\n")
+            self.write_index([output_res_cam[cam] for cam in self.camera], index_writer)
                     
             # we will concate the query imgs in the first line, and the candidates in the second line, and output a img
             # 3 query imgs first line
@@ -422,12 +421,20 @@ class TemporalPositioning(AbstractTask):
                 
                 # Save the final image
                 cv2.imwrite(os.path.join(self.output_path, self.name, self.expr_id, cam, "sample.png"), final_image)
+            
+            self.render_cache.store(cache_key, output_pth, spec, meta=[output_res_cam[cam] for cam in self.camera])
                 
+        except BuildDied:
+            # The case is run again on a new build by run_sample
+            raise
         except Exception as e:
             traceback.print_exc()   
         finally:
-            print("terminating the controller")
-            self.c.communicate({"$type": "terminate"})
+            if self.c.alive():
+                print("terminating the controller")
+                self.c.communicate({"$type": "terminate"})
+            # The next case binds the port again
+            self.c.close()
 
 @hydra.main(config_path="configs", config_name="temporal_positioning.yaml", version_base=None)
 def main(cfg: DictConfig):
@@ -435,69 +442,79 @@ def main(cfg: DictConfig):
     
     target_size = 10
     
-    ideal_size = len(AVAILABLE_CAMERA_POS) * len(AVAILABLE_MOTION) * len(AVAILABLE_OBJECT) * len(AVAILABLE_COLOR)**2
+    # Every case is one distinct combination of the discrete parameters: two different (model, color) shapes,
+    # the motion of the main object and both scales. Positions and rotations are drawn from the case id.
+    case_space = CaseSpace({
+        "shapes": PermutationSpace(ProductSpace(AVAILABLE_OBJECT, list(AVAILABLE_COLOR.keys())), 2),
+        "motion": AVAILABLE_MOTION,
+        "main_scale": AVAILABLE_SCALE_FACTOR,
+        "fixed_scale": AVAILABLE_SCALE_FACTOR,
+    })
+    ideal_size = len(case_space)
     
     print(f"Ideal size: {ideal_size}, target size: {target_size}")
     
-    gen_id_set = set()
+    # Cases generated by earlier runs into the same output are skipped
+    ledger = CaseLedger(os.path.join(cfg.output_path, cfg.name, "generated_cases.bin"), case_space)
+    index_writer = IndexWriter(os.path.join(cfg.output_path, cfg.name, "output_res_cam.jsonl"), append=True)
+    # One recorder for the controllers of all the cases
+    timings = RoundTripRecorder(enabled=cfg.get("timings") is not None)
     
     x_range = [-0.3, 0.3]
     y_range = [0.5, 1.5]
     z_range = [-0.3, 0.3]
     
     rotation_range = [-90, 90]
-    pbar = tqdm(total=target_size)
-    seed = 0
-    while len(gen_id_set) < target_size:
+    pbar = tqdm(total=min(target_size, ideal_size - len(ledger)))
+    for case_id in itertools.islice(case_space.iter_new(ledger), target_size):
         task = None
-        task = TemporalPositioning(**cfg)
-        np.random.seed(seed)
-        seed += 1
+        task = TemporalPositioning(**{**cfg, "timings": timings})
+        params = case_space[case_id]
+        (main_model, main_color), (fixed_model, fixed_color) = params["shapes"]
+        np.random.seed(case_id)
         main_obj = ObjectType(
-                model_name=np.random.choice(AVAILABLE_OBJECT),
+                model_name=main_model,
                 library="models_core.json",
                 position={"x": np.random.uniform(x_range[0], x_range[1]), "y": 0.2, "z": np.random.uniform(z_range[0], z_range[1])},
                 rotation={"x": 0, "y": np.random.uniform(rotation_range[0], rotation_range[1]), "z": 0},
-                scale_factor=np.random.choice(AVAILABLE_SCALE_FACTOR),
+                scale_factor=params["main_scale"],
                 texture_scale=1,
                 object_id=None,
                 material=None,
-                motion=np.random.choice(AVAILABLE_MOTION),
-                color=np.random.choice(list(AVAILABLE_COLOR.keys())))
+                motion=params["motion"],
+                color=main_color)
         fixed_obj = ObjectType(
-                model_name=np.random.choice(AVAILABLE_OBJECT),
+                model_name=fixed_model,
                 library="models_core.json",
                 position={"x": np.random.uniform(x_range[0], x_range[1]), "y": 0.2, "z": np.random.uniform(z_range[0], z_range[1])},
                 rotation={"x": 0, "y": np.random.uniform(rotation_range[0], rotation_range[1]), "z": 0},
-                scale_factor=np.random.choice(AVAILABLE_SCALE_FACTOR),
+                scale_factor=params["fixed_scale"],
                 texture_scale=1,
                 object_id=None,
                 material=None,
                 motion=np.random.choice(AVAILABLE_MOTION),
-                color=np.random.choice(list(AVAILABLE_COLOR.keys())))
-        
-        main_obj_shape_id = get_object_shape_id(main_obj)
-        fixed_obj_shape_id = get_object_shape_id(fixed_obj)
+                color=fixed_color)
         
-        if main_obj_shape_id == fixed_obj_shape_id:
-            continue
+        print(f"Generating case {case_id} ({case_hash(params)}), {len(ledger)} generated so far")
+        # A case whose build dies is run again from the same random state on a new build, or skipped
+        rng_state = np.random.get_state()
         
-        main_obj_id = get_object_id(main_obj)
-        fixed_obj_id = get_object_id(fixed_obj)
+        def attempt():
+            np.random.set_state(rng_state)
+            task.run(main_obj_list=[main_obj], fixed_obj_list=[fixed_obj], seed=case_id, index_writer=index_writer)
         
-        case_id = main_obj_id + "_" + fixed_obj_id
-        
-        if case_id in gen_id_set:
-            continue
-        else:
-            gen_id_set.add(case_id)
-            
-            print(f"Generated {len(gen_id_set)} unique IDs")
-            task.run(main_obj_list=[main_obj], fixed_obj_list=[fixed_obj], seed=seed)
-            pbar.update(1)
+        done, _ = task.c.run_sample(case_id, attempt)
+        # The records of a case are on disk before the ledger marks it as generated, a skipped case is left to the next run
+        index_writer.sync()
+        if done:
+            ledger.add(case_id)
+        pbar.update(1)
         
         del task
     
+    index_writer.close()
+    timings.write(cfg.get("timings"))
+    
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
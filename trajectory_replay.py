@@ -0,0 +1,122 @@
+import json
+import os
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from tdw.add_ons.object_manager import ObjectManager
+from tdw.tdw_utils import TDWUtils
+
+from render_cache import canonicalize
+
+# Record-and-replay of simulated trajectories.
+# A Trajectory holds the pose (position and rotation) of every object on every rendered frame of a simulation, with
+# the objects in the order they were added, and the metadata of the simulation (collision frames...). A visual
+# variant of the simulation - the same shapes, sizes, poses and forces with other colors, materials or textures -
+# is rendered again by replaying the trajectory: the objects are added, physics is paused, and every frame teleports
+# them to their recorded pose. Nothing is simulated and no collision or rigidbody data is sent, and a replay renders
+# exactly the recorded frames whatever the build does.
+# TrajectoryStore keeps the trajectories by the hash of what drives the physics, in memory and as JSON files, so
+# that later runs (e.g. with more colors) replay them too.
+
+TRAJECTORY_DIR_NAME = ".trajectories"
+
+
+class Trajectory:
+    def __init__(self, frames: List[List[List[float]]] = None, meta: dict = None):
+        """
+        :param frames: Per rendered frame, per object: position (x, y, z) + rotation quaternion (x, y, z, w).
+        :param meta: JSON-serializable metadata of the simulation, returned with the replays.
+        """
+        self.frames = frames if frames is not None else []
+        self.meta = meta
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def record(self, object_manager: ObjectManager, object_ids: Iterable[int]):
+        """
+        Record the poses of the last frame, from an ObjectManager created with transforms=True.
+        """
+        self.frames.append([np.concatenate([object_manager.transforms[object_id].position,
+                                            object_manager.transforms[object_id].rotation]).tolist()
+                            for object_id in object_ids])
+
+    def truncate(self, frames: int):
+        """
+        Drop the frames after the first ones, e.g. to branch from a prefix.
+        """
+        del self.frames[frames:]
+
+    def copy(self, meta: dict = None) -> "Trajectory":
+        return Trajectory([list(frame) for frame in self.frames], meta if meta is not None else self.meta)
+
+    def replay_commands(self, frame: int, object_ids: List[int]) -> List[dict]:
+        """
+        The commands that put the objects in their pose of a frame. object_ids are in the order of the recording.
+        """
+        commands = []
+        for object_id, pose in zip(object_ids, self.frames[frame]):
+            commands.append({"$type": "teleport_object", "id": object_id, "position": TDWUtils.array_to_vector3(pose[:3])})
+            commands.append({"$type": "rotate_object_to", "id": object_id, "rotation": TDWUtils.array_to_vector4(pose[3:])})
+        return commands
+
+    def to_dict(self) -> dict:
+        return canonicalize({"frames": self.frames, "meta": self.meta})
+
+    @staticmethod
+    def from_dict(data: dict) -> "Trajectory":
+        return Trajectory(data["frames"], data["meta"])
+
+
+class TrajectoryStore:
+    def __init__(self, directory: str, enabled: bool = True):
+        """
+        :param directory: The directory of the JSON files. None to keep the trajectories in memory only.
+        :param enabled: If False, every lookup misses and nothing is stored.
+        """
+        self.directory = directory
+        self.enabled = enabled
+        self.trajectories: Dict[str, Trajectory] = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def fetch(self, key: str) -> Optional[Trajectory]:
+        trajectory = None
+        if self.enabled:
+            with self.lock:
+                trajectory = self.trajectories.get(key)
+            if trajectory is None and self.directory is not None:
+                try:
+                    with open(self.path(key), "r") as f:
+                        trajectory = Trajectory.from_dict(json.load(f))
+                except (OSError, ValueError, KeyError):
+                    trajectory = None
+                if trajectory is not None:
+                    with self.lock:
+                        self.trajectories[key] = trajectory
+        if trajectory is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return trajectory
+
+    def store(self, key: str, trajectory: Trajectory):
+        """
+        Keep a trajectory. The file is written to a temporary name first, so an interrupted store is never a hit.
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.trajectories[key] = trajectory
+        if self.directory is None:
+            return
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump(trajectory.to_dict(), f)
+        os.replace(path + ".tmp", path)